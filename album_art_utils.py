@@ -1,12 +1,65 @@
-import requests
+import json
+import mimetypes
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+import batch_utils
 
 # TODO:
 # - "Hacking" around iTunes URL is a temporary solution. Look into leveraging Echo Nest.
-# - Maybe run query though some other music service to correct spelling and what not since the iTunes API needs an
-#   exact album title.
 # - Can I use iTunes search API to suggest other ID3 frame completions, not just album art?
-# - 1200x1200 art is not guaranteed to exist. If it doesn't, just take highest resolution available in JSON. Or maybe
-#   tweak the URL to some other high resolution that is also not in the JSON response.
+
+# The Apple iTunes search API endpoint.
+SEARCH_URL = "https://itunes.apple.com/search"
+
+# The minimum score, between 0 and 1, the top ranked result needs before it is applied without asking.
+DEFAULT_MIN_SCORE = 0.6
+
+# The number of albums looked up at the same time when tagging many albums.
+DEFAULT_SEARCH_WORKERS = 4
+
+# How long to wait on the search API and image downloads, in seconds.
+REQUEST_TIMEOUT = 30
+
+# Album art sizes to probe for, largest first. Not every size exists for every album.
+ART_SIZES = (1400, 1200, 1000, 600, 300, 100)
+
+# How long to wait on a single size probe, in seconds.
+PROBE_TIMEOUT = 10
+
+# Where resolved album art sizes are kept between runs, so each artwork is only ever probed once.
+RESOLVED_SIZES_PATH = os.path.join(os.path.expanduser("~"), ".mp3_tagger", "album_art_sizes.json")
+
+# The number of pooled connections kept open per host.
+_POOL_SIZE = 16
+
+# The size part of an artwork URL, e.g. "100x100" in ".../source/100x100bb.jpg".
+_SIZE_PATTERN = re.compile("([0-9]+)x([0-9]+)(?!.*[0-9]+x[0-9]+)")
+
+# A map of artwork IDs to the largest size that was found to exist, or None if no probed size exists. The artwork ID is
+# the artwork URL with its size replaced by a placeholder.
+_resolved_sizes = {}
+_resolved_sizes_lock = threading.Lock()
+
+# The shared HTTP session, created on first use.
+_session = None
+_session_lock = threading.Lock()
+
+# The JSON keys of artwork URLs in a search result, from highest to lowest resolution.
+_ARTWORK_KEYS = ("artworkUrl100", "artworkUrl60", "artworkUrl30")
+
+# Bracketed or dashed edition information such as "(Deluxe Edition)", "[Remastered]", or "- Single" that the iTunes
+# API does not match on.
+_EDITION_PATTERN = re.compile(r"\s*(\([^)]*\)|\[[^\]]*\]|-\s*(single|ep)\s*$)", re.IGNORECASE)
+
+# Disc information such as "Disc 1" or "CD2".
+_DISC_PATTERN = re.compile(r"\s*\b(disc|disk|cd)\s*[0-9]+\b", re.IGNORECASE)
+
+_NON_WORD_PATTERN = re.compile(r"[\W_]+")
 
 
 def fetch_album_art(query):
@@ -20,30 +73,467 @@ def fetch_album_art(query):
 
     :raise HTTPError: Bad HTTP response code.
     """
-    # Replace spaces with plus signs so URL is valid.
-    query = query.replace(" ", "+")
 
-    # Search for album art using Apple iTunes search API.
-    search_url = "https://itunes.apple.com/search?term={}&media=music&entity=album".format(query)
-    results = requests.get(search_url)
+    urls = []
+    for result in fetch_album_art_results(query):
+        url = get_art_url(result)
+        if url is not None:
+            urls.append(resolve_album_art_url(url))
+
+    return urls
+
+
+def fetch_album_art_results(query):
+    """Fetch the raw album search results for a search query.
+
+    :param query: The search query to use to look for albums.
+    :type query: str
+
+    :returns: A list of result dicts as returned by the iTunes search API.
+    :rtype: list
+
+    :raise HTTPError: Bad HTTP response code.
+    """
+
+    # Let requests encode the query so that characters such as "&" do not break the URL.
+    results = get_session().get(SEARCH_URL, params={"term": query, "media": "music", "entity": "album"},
+                                timeout=REQUEST_TIMEOUT)
 
     # Raise HTTPError if we do not get an OK response code.
-    if results.status_code == requests.codes.ok:
-        results.raise_for_status()
+    results.raise_for_status()
 
-    json_results = results.json()["results"]
+    return results.json()["results"]
 
-    urls = []
-    for result in json_results:
-        if "artworkUrl100" in result:
-            small_art_url = result["artworkUrl100"]
 
-            # The Apple iTunes API JSON response only contains a URL for 100x100 resolution album art. Tweak the URL a
-            # bit to get "secret" higher resolution art.
-            large_art_url = small_art_url.replace("100x100", "1200x1200")
-            urls.append(large_art_url)
+def get_art_url(result):
+    """Get the highest resolution album art URL listed in a search result.
 
-    return urls
+    The listed URLs are all low resolution. Use resolve_album_art_url() to find the highest resolution that exists.
+
+    :param result: A result dict as returned by the iTunes search API.
+    :type result: dict
+
+    :returns: The album art URL or None if the result has no album art.
+    :rtype: str or None
+    """
+
+    for key in _ARTWORK_KEYS:
+        if key in result:
+            return result[key]
+
+    return None
+
+
+def get_session():
+    """Get the shared HTTP session so that connections to the search API and image servers are reused.
+
+    :returns: The shared session.
+    :rtype: requests.Session
+    """
+
+    global _session
+
+    # Requests takes longer to import than the rest of the tagger put together, so it is only imported once it is used.
+    import requests
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=_POOL_SIZE, pool_maxsize=_POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+
+        return _session
+
+
+def resolve_album_art_url(url, sizes=ART_SIZES, session=None):
+    """Find the highest resolution version of an album art URL that actually exists.
+
+    The Apple iTunes API JSON response only contains URLs for low resolution album art, but tweaking the size in the
+    URL gives "secret" higher resolution art. Not every size exists, so all sizes are probed in parallel with HEAD
+    requests and the largest one that exists wins. The outcome is cached per artwork so each artwork is only probed
+    once.
+
+    :param url: A album art URL containing a size such as "100x100".
+    :type url: str
+
+    :param sizes: The sizes to probe. Defaults to ART_SIZES.
+    :type sizes: tuple
+
+    :param session: The session to probe with. Defaults to the shared session.
+    :type session: requests.Session or None
+
+    :returns: The URL of the largest size found, or the original URL if no probed size exists.
+    :rtype: str
+    """
+
+    if _SIZE_PATTERN.search(url) is None:
+        return url
+
+    artwork_id = _SIZE_PATTERN.sub("{0}x{0}", url.replace("{", "{{").replace("}", "}}"))
+
+    with _resolved_sizes_lock:
+        cached = artwork_id in _resolved_sizes
+        size = _resolved_sizes.get(artwork_id)
+
+    if not cached:
+        (size, is_certain) = _probe_sizes(artwork_id, sorted(sizes, reverse=True), session or get_session())
+        # Do not remember an outcome that may only be down to a network error.
+        if is_certain:
+            with _resolved_sizes_lock:
+                _resolved_sizes[artwork_id] = size
+
+    if size is None:
+        return url
+
+    return artwork_id.format(size)
+
+
+def clear_resolved_sizes():
+    """Forget all cached album art sizes."""
+
+    with _resolved_sizes_lock:
+        _resolved_sizes.clear()
+
+
+def load_resolved_sizes(path=RESOLVED_SIZES_PATH):
+    """Load cached album art sizes from a JSON file, e.g. one written by a previous run.
+
+    :param path: The path to the JSON file. Defaults to RESOLVED_SIZES_PATH.
+    :type path: str
+
+    :raise IOError: Error reading file.
+    :raise ValueError: Malformed file.
+    """
+
+    with open(path, encoding="utf-8") as file:
+        sizes = json.load(file)
+
+    if not isinstance(sizes, dict):
+        raise ValueError("Malformed album art size cache: " + path)
+
+    with _resolved_sizes_lock:
+        _resolved_sizes.update(sizes)
+
+
+def save_resolved_sizes(path=RESOLVED_SIZES_PATH):
+    """Save cached album art sizes to a JSON file. The file is replaced in one step, so a run that loads it at the
+    same time never sees it half written.
+
+    :param path: The path to the JSON file. Defaults to RESOLVED_SIZES_PATH.
+    :type path: str
+
+    :raise IOError: Error writing file.
+    """
+
+    with _resolved_sizes_lock:
+        sizes = dict(_resolved_sizes)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    (file_descriptor, temp_path) = tempfile.mkstemp(suffix=".tmp", dir=directory)
+    try:
+        with open(file_descriptor, "w", encoding="utf-8") as file:
+            json.dump(sizes, file)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def normalise_album_title(album):
+    """Strip edition and disc information from an album title so that it matches the title the iTunes API knows.
+
+    :param album: The album title.
+    :type album: str
+
+    :returns: The normalised album title.
+    :rtype: str
+    """
+
+    stripped_album = _DISC_PATTERN.sub("", _EDITION_PATTERN.sub("", album)).strip()
+
+    # Do not strip everything away for titles that are entirely bracketed.
+    return stripped_album or album.strip()
+
+
+def build_album_art_query(tracks):
+    """Build an album art search query from the most common album artist and album of a set of tracks.
+
+    :param tracks: The tracks to build a query for.
+    :type tracks: iterable
+
+    :returns: A tuple of the query, the album artist, and the album. The query is None if the tracks have no album.
+    :rtype: tuple
+    """
+
+    albums = Counter()
+    for track in tracks:
+        album = track.get_album()
+        if album:
+            albums[(track.get_album_artist() or track.get_artist() or "", album)] += 1
+
+    if len(albums) == 0:
+        return (None, None, None)
+
+    ((artist, album), _) = albums.most_common(1)[0]
+    album = normalise_album_title(album)
+    query = " ".join(_NON_WORD_PATTERN.sub(" ", artist + " " + album).split())
+
+    return (query, artist, album)
+
+
+def rank_album_art(results, artist, album, resolve_ties=False):
+    """Rank album search results by how closely they match an artist and album, best first.
+
+    Results are scored by string similarity of the album title and artist. Without an artist, the album is also compared
+    against each result's artist and album together, so a free text query such as "radiohead ok computer" can be ranked
+    by passing it as the album. Results without artwork are left out.
+
+    The search API lists the same low resolution for every result, so resolution can only break ties once the sizes
+    that exist have been probed. That is only done when asked, and only for the results tied for first place.
+
+    :param results: A list of result dicts as returned by the iTunes search API.
+    :type results: list
+
+    :param artist: The album artist being looked for. May be empty.
+    :type artist: str
+
+    :param album: The album being looked for.
+    :type album: str
+
+    :param resolve_ties: True to probe the artwork sizes of the results tied for first place and put the highest
+        resolution first, false to keep the order of the search results. Defaults to False.
+    :type resolve_ties: bool
+
+    :returns: A list of (score, album art URL) tuples. Scores are between 0 and 1. The URLs are the low resolution ones
+        listed in the results.
+    :rtype: list
+    """
+
+    ranked_results = []
+    for result in results:
+        url = get_art_url(result)
+        if url is None:
+            continue
+
+        result_album = normalise_album_title(result.get("collectionName", ""))
+        album_score = _similarity(album, result_album)
+        if artist:
+            score = 0.6 * album_score + 0.4 * _similarity(artist, result.get("artistName", ""))
+        else:
+            score = max(album_score, _similarity(album, result.get("artistName", "") + " " + result_album))
+
+        ranked_results.append((score, url))
+
+    # The sort is stable, so results with equal scores keep the order the search API returned them in.
+    ranked_results.sort(key=lambda ranked_result: ranked_result[0], reverse=True)
+
+    if resolve_ties and len(ranked_results) > 1:
+        tied_results = [ranked_result for ranked_result in ranked_results if ranked_result[0] == ranked_results[0][0]]
+        if len(tied_results) > 1:
+            tied_results.sort(key=lambda ranked_result: _get_art_size(resolve_album_art_url(ranked_result[1])),
+                              reverse=True)
+            ranked_results[:len(tied_results)] = tied_results
+
+    return ranked_results
+
+
+def find_album_art_url(tracks, min_score=DEFAULT_MIN_SCORE):
+    """Find the best album art URL for a set of tracks from the same album.
+
+    :param tracks: The tracks to find album art for.
+    :type tracks: iterable
+
+    :param min_score: The minimum score, between 0 and 1, the best result needs. Defaults to DEFAULT_MIN_SCORE.
+    :type min_score: float
+
+    :returns: The album art URL or None if nothing matched well enough.
+    :rtype: str or None
+
+    :raise HTTPError: Bad HTTP response code.
+    """
+
+    (query, artist, album) = build_album_art_query(tracks)
+    if query is None:
+        return None
+
+    ranked_results = rank_album_art(fetch_album_art_results(query), artist, album, resolve_ties=True)
+    if len(ranked_results) == 0 or ranked_results[0][0] < min_score:
+        return None
+
+    return ranked_results[0][1]
+
+
+def apply_album_art(tracks, url):
+    """Download the highest resolution version of album art once and apply it to a set of tracks, saving them in one
+    batch.
+
+    :param tracks: The tracks to apply album art to.
+    :type tracks: iterable
+
+    :param url: The album art URL. See resolve_album_art_url().
+    :type url: str
+
+    :returns: A list of (track, exception) tuples for the tracks that failed to save.
+    :rtype: list
+
+    :raise HTTPError: Bad HTTP response code.
+    :raise ValueError: Incompatible mime type.
+    """
+
+    url = resolve_album_art_url(url)
+    response = get_session().get(url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    mime_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+    if mime_type not in ("image/png", "image/jpeg"):
+        mime_type = mimetypes.guess_type(url)[0]
+
+    tracks = list(tracks)
+    for track in tracks:
+        track.add_picture_from_data(response.content, mime_type)
+
+    return batch_utils.save_tracks(tracks)
+
+
+def tag_album_art(tracks, min_score=DEFAULT_MIN_SCORE, max_workers=DEFAULT_SEARCH_WORKERS):
+    """Find and apply album art for every album in a set of tracks as one unattended job.
+
+    Tracks are grouped into albums and each album is looked up once.
+
+    :param tracks: The tracks to tag.
+    :type tracks: iterable
+
+    :param min_score: The minimum score, between 0 and 1, an album's best result needs. Defaults to DEFAULT_MIN_SCORE.
+    :type min_score: float
+
+    :param max_workers: The number of albums to look up at the same time. Defaults to DEFAULT_SEARCH_WORKERS.
+    :type max_workers: int
+
+    :returns: A tuple of a list of lists of tracks for albums where nothing matched and a list of (track, exception)
+        tuples for tracks that failed to be tagged.
+    :rtype: tuple
+    """
+
+    albums = list(batch_utils.group_tracks_by_album(tracks).values())
+    unmatched_albums = []
+    failures = []
+
+    if len(albums) == 0:
+        return (unmatched_albums, failures)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(albums))) as executor:
+        for (album_tracks, (url, album_failures)) in zip(albums, executor.map(_tag_album, albums,
+                                                                              [min_score] * len(albums))):
+            if url is None and len(album_failures) == 0:
+                unmatched_albums.append(album_tracks)
+            failures.extend(album_failures)
+
+    return (unmatched_albums, failures)
+
+
+def _tag_album(album_tracks, min_score):
+    """Find and apply album art for the tracks of a single album.
+
+    :param album_tracks: The tracks of the album.
+    :type album_tracks: list
+
+    :param min_score: The minimum score, between 0 and 1, the best result needs.
+    :type min_score: float
+
+    :returns: A tuple of the applied URL, or None if nothing matched, and a list of (track, exception) tuples.
+    :rtype: tuple
+    """
+
+    # Already imported by get_session(), which every lookup goes through.
+    import requests
+
+    try:
+        url = find_album_art_url(album_tracks, min_score)
+        if url is None:
+            return (None, [])
+        return (url, apply_album_art(album_tracks, url))
+    except (requests.RequestException, IOError, ValueError) as error:
+        return (None, [(track, error) for track in album_tracks])
+
+
+def _probe_sizes(artwork_id, sizes, session):
+    """Probe which sizes of an artwork exist in parallel.
+
+    :param artwork_id: The artwork URL with "{0}" in place of each size dimension.
+    :type artwork_id: str
+
+    :param sizes: The sizes to probe, largest first.
+    :type sizes: list
+
+    :param session: The session to probe with.
+    :type session: requests.Session
+
+    :returns: A tuple of the largest size that exists, or None if none do, and whether or not the outcome is certain.
+        An outcome is only certain if every size larger than the one found was definitely missing. A probe that failed
+        with a network error may have been for a size that exists.
+    :rtype: tuple
+    """
+
+    # Already imported by get_session(), which made the session.
+    import requests
+
+    def exists(size):
+        try:
+            response = session.head(artwork_id.format(size), timeout=PROBE_TIMEOUT, allow_redirects=True)
+        except requests.RequestException:
+            return None
+        return response.ok
+
+    with ThreadPoolExecutor(max_workers=len(sizes)) as executor:
+        outcomes = list(executor.map(exists, sizes))
+
+    is_certain = True
+    for (size, size_exists) in zip(sizes, outcomes):
+        if size_exists is None:
+            is_certain = False
+        elif size_exists:
+            return (size, is_certain)
+
+    return (None, is_certain)
+
+
+def _get_art_size(url):
+    """Get the size of an album art URL.
+
+    :param url: A album art URL containing a size such as "100x100".
+    :type url: str
+
+    :returns: The larger of the two dimensions, or 0 if the URL has no size.
+    :rtype: int
+    """
+
+    match = _SIZE_PATTERN.search(url)
+    if match is None:
+        return 0
+
+    return max(int(match.group(1)), int(match.group(2)))
+
+
+def _similarity(a, b):
+    """Compare two strings, ignoring case, punctuation, and spacing.
+
+    :param a: A string.
+    :type a: str
+
+    :param b: Another string.
+    :type b: str
+
+    :returns: A similarity ratio between 0 and 1.
+    :rtype: float
+    """
+
+    a = " ".join(_NON_WORD_PATTERN.sub(" ", a.casefold()).split())
+    b = " ".join(_NON_WORD_PATTERN.sub(" ", b.casefold()).split())
+
+    return SequenceMatcher(None, a, b).ratio()
 
 if __name__ == "__main__":
     for url in fetch_album_art("saintseneca"):
@@ -52,4 +542,10 @@ if __name__ == "__main__":
     print("---")
 
     for url in fetch_album_art("saintseneca") + (fetch_album_art("dark arc")):
-        print(url)
\ No newline at end of file
+        print(url)
+
+    print("---")
+
+    for (ranked_score, ranked_url) in rank_album_art(fetch_album_art_results("saintseneca dark arc"), "Saintseneca",
+                                                     "Dark Arc"):
+        print(ranked_score, ranked_url)
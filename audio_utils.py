@@ -0,0 +1,140 @@
+import hashlib
+import os
+import struct
+
+# The size of the blocks that audio data is read and hashed in.
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# ID3V2 header and footer sizes. The footer is only present if the footer flag is set in the header.
+_ID3V2_HEADER_SIZE = 10
+_ID3V2_FOOTER_FLAG = 0x10
+
+# An ID3V1 tag is a fixed 128 byte block at the end of the file starting with "TAG".
+_ID3V1_SIZE = 128
+
+# An APEV2 tag ends with a 32 byte footer starting with "APETAGEX". Its size includes the footer, but not the optional
+# header, which is present if the header flag is set in the footer.
+_APE_FOOTER_SIZE = 32
+_APE_HEADER_FLAG = 0x80000000
+
+
+def get_audio_bounds(path):
+    """Find the region of an MP3 file that holds the audio frames, leaving out any ID3V2, ID3V1, and APEV2 tags.
+
+    :param path: The path to the MP3 file.
+    :type path: str
+
+    :returns: A tuple of the start offset and end offset of the audio data.
+    :rtype: tuple
+
+    :raise IOError: Error reading file.
+    """
+
+    with open(path, "rb") as file:
+        return _get_audio_bounds(file, os.fstat(file.fileno()).st_size)
+
+
+def hash_audio(path, algorithm="sha1", chunk_size=DEFAULT_CHUNK_SIZE):
+    """Hash the audio data of an MP3 file without its tags, so tag edits do not change the hash.
+
+    The audio is streamed in fixed size chunks so memory use stays flat regardless of file size.
+
+    :param path: The path to the MP3 file.
+    :type path: str
+
+    :param algorithm: The name of a hashlib algorithm. Defaults to "sha1".
+    :type algorithm: str
+
+    :param chunk_size: The number of bytes to read at a time. Defaults to DEFAULT_CHUNK_SIZE.
+    :type chunk_size: int
+
+    :returns: The hex digest of the audio data.
+    :rtype: str
+
+    :raise IOError: Error reading file.
+    """
+
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+
+    with open(path, "rb") as file:
+        (start, end) = _get_audio_bounds(file, os.fstat(file.fileno()).st_size)
+        file.seek(start)
+
+        remaining = end - start
+        while remaining > 0:
+            count = file.readinto(view[:min(chunk_size, remaining)])
+            if not count:
+                break
+            digest.update(view[:count])
+            remaining -= count
+
+    return digest.hexdigest()
+
+
+def _get_audio_bounds(file, size):
+    """Find the region of an open MP3 file that holds the audio frames.
+
+    :param file: A binary file object opened for reading.
+    :type file: file
+
+    :param size: The size of the file in bytes.
+    :type size: int
+
+    :returns: A tuple of the start offset and end offset of the audio data.
+    :rtype: tuple
+    """
+
+    start = 0
+
+    # There may be more than one ID3V2 tag at the start of the file if a tool prepended a new one instead of replacing.
+    while start + _ID3V2_HEADER_SIZE <= size:
+        file.seek(start)
+        header = file.read(_ID3V2_HEADER_SIZE)
+        if len(header) < _ID3V2_HEADER_SIZE or header[0:3] != b"ID3":
+            break
+
+        flags = header[5]
+        tag_size = _decode_syncsafe(header[6:10])
+        start += _ID3V2_HEADER_SIZE + tag_size
+        if flags & _ID3V2_FOOTER_FLAG:
+            start += _ID3V2_HEADER_SIZE
+
+    end = size
+
+    if end - start >= _ID3V1_SIZE:
+        file.seek(end - _ID3V1_SIZE)
+        if file.read(3) == b"TAG":
+            end -= _ID3V1_SIZE
+
+    if end - start >= _APE_FOOTER_SIZE:
+        file.seek(end - _APE_FOOTER_SIZE)
+        footer = file.read(_APE_FOOTER_SIZE)
+        if footer[0:8] == b"APETAGEX":
+            # The footer holds the version, tag size, item count, and flags, in that order, after the preamble.
+            (ape_size, _, ape_flags) = struct.unpack("<III", footer[12:24])
+            if ape_flags & _APE_HEADER_FLAG:
+                ape_size += _APE_FOOTER_SIZE
+            end -= ape_size
+
+    return (min(start, size), max(end, min(start, size)))
+
+
+def _decode_syncsafe(data):
+    """Decode a 4 byte syncsafe integer, where only the lower 7 bits of each byte are used.
+
+    :param data: The 4 bytes to decode.
+    :type data: bytes
+
+    :returns: The decoded integer.
+    :rtype: int
+    """
+
+    return (data[0] & 0x7f) << 21 | (data[1] & 0x7f) << 14 | (data[2] & 0x7f) << 7 | (data[3] & 0x7f)
+
+if __name__ == "__main__":
+    import sys
+
+    for file_path in sys.argv[1:]:
+        print(get_audio_bounds(file_path), hash_audio(file_path), file_path)
@@ -0,0 +1,490 @@
+import json
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+import batch_utils
+
+# The reference catalogue fields that can be proposed, mapped to the track getter and setter for each.
+FIELD_ACCESSORS = {
+    "title": ("get_title", "set_title"),
+    "artist": ("get_artist", "set_artist"),
+    "album_artist": ("get_album_artist", "set_album_artist"),
+    "album": ("get_album", "set_album"),
+    "genre": ("get_genre", "set_genre"),
+    "year": ("get_year", "set_year"),
+    "track": ("get_track", "set_track"),
+}
+
+# The fields matched on and how much each counts towards a match's score.
+MATCH_WEIGHTS = {
+    "title": 2.0,
+    "artist": 1.5,
+    "album": 1.0,
+}
+
+# The minimum score, between 0 and 1, a match needs before its values are proposed.
+DEFAULT_MIN_SCORE = 0.75
+
+# The number of rarest query words and trigrams used to look up candidates. Common ones match too much to be useful.
+_LOOKUP_WORDS = 4
+_LOOKUP_TRIGRAMS = 8
+
+# The number of candidates with the most shared trigrams that are scored in full.
+_SCORED_CANDIDATES = 20
+
+# The number of matches a catalogue remembers before it starts over.
+_MATCH_CACHE_SIZE = 65536
+
+_NON_WORD_PATTERN = re.compile(r"[\W_]+")
+_YEAR_PATTERN = re.compile(r"^([0-9]{4})")
+_TRACK_PATTERN = re.compile(r"^\s*([0-9]+)(?:\s*/\s*([0-9]+))?")
+_LEADING_TRACK_NUMBER_PATTERN = re.compile(r"^[0-9]{1,3}(?:\s*[-.]\s*|\s+)")
+
+
+class ReferenceCatalogue:
+    """An offline catalogue of reference track metadata that tracks can be fuzzy matched against.
+
+    Every record is indexed by the words and trigrams of its title, artist, and album, so a lookup only scores the
+    handful of records that share the query's rarest words rather than the whole catalogue. Words are far more
+    selective than trigrams, so trigrams are only looked up when no word leads to a good enough match, e.g. when every
+    word of the query is misspelled.
+    """
+
+    def __init__(self, records=()):
+        """Create a new catalogue.
+
+        :param records: Reference records. Each is a dict with any of the keys in FIELD_ACCESSORS.
+        :type records: iterable
+        """
+
+        # A list of reference records. A record's index in this list is its ID.
+        self._records = []
+
+        # A list of maps of field names to trigram sets, one per record, used for scoring.
+        self._record_trigrams = []
+
+        # Maps of words and trigrams to lists of IDs of records containing them.
+        self._word_index = {}
+        self._trigram_index = {}
+
+        # A map of (title, artist, album, min_score) tuples to the results of match(). Cleared when records are added.
+        self._match_cache = {}
+
+        self.add_all(records)
+
+    def __len__(self):
+        return len(self._records)
+
+    @staticmethod
+    def load(path):
+        """Load a catalogue from a JSON lines file with one record per line.
+
+        :param path: The path to the JSON lines file.
+        :type path: str
+
+        :returns: The loaded catalogue.
+        :rtype: ReferenceCatalogue
+
+        :raise IOError: Error reading file.
+        :raise ValueError: Malformed record.
+        """
+
+        catalogue = ReferenceCatalogue()
+
+        with open(path, encoding="utf-8") as file:
+            catalogue.add_all(json.loads(line) for line in file if line.strip())
+
+        return catalogue
+
+    def add(self, record):
+        """Add a record to the catalogue. Use add_all() to add many records.
+
+        :param record: A dict with any of the keys in FIELD_ACCESSORS. Other keys are ignored.
+        :type record: dict
+        """
+
+        self.add_all([record])
+
+    def add_all(self, records):
+        """Add records to the catalogue.
+
+        :param records: Dicts with any of the keys in FIELD_ACCESSORS. Other keys are ignored.
+        :type records: iterable
+        """
+
+        for record in records:
+            self._index_record(record)
+
+        # The catalogue changed, so cached matches may no longer be the best ones.
+        self._match_cache.clear()
+
+    def _index_record(self, record):
+        """Add a record to the word and trigram indexes without touching the match cache.
+
+        :param record: A dict with any of the keys in FIELD_ACCESSORS. Other keys are ignored.
+        :type record: dict
+        """
+
+        record_id = len(self._records)
+        record = {field: str(record[field]) for field in FIELD_ACCESSORS if record.get(field) not in (None, "")}
+        trigrams = {field: _trigrams(record.get(field)) for field in MATCH_WEIGHTS}
+
+        self._records.append(record)
+        self._record_trigrams.append(trigrams)
+
+        for word in set(_words(" ".join(record.get(field, "") for field in MATCH_WEIGHTS))):
+            self._word_index.setdefault(word, []).append(record_id)
+
+        for trigram in set().union(*trigrams.values()):
+            self._trigram_index.setdefault(trigram, []).append(record_id)
+
+    def match(self, title=None, artist=None, album=None, min_score=DEFAULT_MIN_SCORE):
+        """Find the record that best matches some known track information.
+
+        :param title: The known title. Defaults to None.
+        :type title: str or None
+
+        :param artist: The known artist. Defaults to None.
+        :type artist: str or None
+
+        :param album: The known album. Defaults to None.
+        :type album: str or None
+
+        :param min_score: The score, between 0 and 1, below which a match found by words is not trusted and trigrams are
+            looked up as well. Defaults to DEFAULT_MIN_SCORE.
+        :type min_score: float
+
+        :returns: A tuple of the best record and its score between 0 and 1, or (None, 0.0) if nothing matched.
+        :rtype: tuple
+        """
+
+        key = (title, artist, album, min_score)
+        if key not in self._match_cache:
+            if len(self._match_cache) >= _MATCH_CACHE_SIZE:
+                self._match_cache.clear()
+            self._match_cache[key] = self._match(title, artist, album, min_score)
+
+        return self._match_cache[key]
+
+    def _match(self, title, artist, album, min_score):
+        """The uncached implementation of match().
+
+        :param title: The known title.
+        :type title: str or None
+
+        :param artist: The known artist.
+        :type artist: str or None
+
+        :param album: The known album.
+        :type album: str or None
+
+        :param min_score: The score below which trigrams are looked up as well.
+        :type min_score: float
+
+        :returns: A tuple of the best record and its score between 0 and 1, or (None, 0.0) if nothing matched.
+        :rtype: tuple
+        """
+
+        query = {"title": _trigrams(title), "artist": _trigrams(artist), "album": _trigrams(album)}
+        query_trigrams = set().union(*query.values())
+        if len(query_trigrams) == 0:
+            return (None, 0.0)
+
+        query_words = set(_words(" ".join(text for text in (title, artist, album) if text is not None)))
+        (best_id, best_score) = self._best_candidate(query, self._word_index, query_words, _LOOKUP_WORDS)
+
+        if best_score < min_score:
+            (trigram_id, trigram_score) = self._best_candidate(query, self._trigram_index, query_trigrams,
+                                                               _LOOKUP_TRIGRAMS)
+            if trigram_score > best_score:
+                (best_id, best_score) = (trigram_id, trigram_score)
+
+        if best_id is None:
+            return (None, 0.0)
+
+        return (self._records[best_id], best_score)
+
+    def _best_candidate(self, query, index, keys, lookup_count):
+        """Look up candidate records by the rarest of a set of index keys and score the most promising ones.
+
+        :param query: A map of field names to query trigram sets.
+        :type query: dict
+
+        :param index: A map of keys to lists of record IDs.
+        :type index: dict
+
+        :param keys: The query's keys for the index.
+        :type keys: set
+
+        :param lookup_count: The number of rarest keys to look up.
+        :type lookup_count: int
+
+        :returns: A tuple of the best record ID and its score, or (None, 0.0) if there were no candidates.
+        :rtype: tuple
+        """
+
+        # The rarest keys have the shortest posting lists and are the most telling.
+        known_keys = [key for key in keys if key in index]
+        known_keys.sort(key=lambda key: len(index[key]))
+
+        candidate_counts = Counter()
+        for key in known_keys[:lookup_count]:
+            candidate_counts.update(index[key])
+
+        best_id = None
+        best_score = 0.0
+        for (record_id, _) in candidate_counts.most_common(_SCORED_CANDIDATES):
+            score = self._score(query, self._record_trigrams[record_id])
+            if score > best_score:
+                (best_id, best_score) = (record_id, score)
+
+        return (best_id, best_score)
+
+    @staticmethod
+    def _score(query, record_trigrams):
+        """Score how well a record matches a query as the weighted Dice similarity of their shared fields.
+
+        :param query: A map of field names to query trigram sets.
+        :type query: dict
+
+        :param record_trigrams: A map of field names to record trigram sets.
+        :type record_trigrams: dict
+
+        :returns: A score between 0 and 1.
+        :rtype: float
+        """
+
+        total_weight = 0.0
+        total_score = 0.0
+
+        for (field, weight) in MATCH_WEIGHTS.items():
+            query_trigrams = query[field]
+            if len(query_trigrams) == 0:
+                continue
+
+            record_field_trigrams = record_trigrams[field]
+            total_weight += weight
+            if len(record_field_trigrams) > 0:
+                shared = len(query_trigrams & record_field_trigrams)
+                total_score += weight * 2.0 * shared / (len(query_trigrams) + len(record_field_trigrams))
+
+        if total_weight == 0.0:
+            return 0.0
+
+        return total_score / total_weight
+
+
+def guess_from_filename(path):
+    """Guess track information from a filename of the form "<artist> - <album> - <title>.mp3",
+    "<artist> - <title>.mp3", or "<title>.mp3", with or without a leading track number.
+
+    :param path: The file path.
+    :type path: str
+
+    :returns: A map of field names to guessed values.
+    :rtype: dict
+    """
+
+    root = os.path.splitext(os.path.basename(path))[0]
+    parts = [part.strip() for part in root.split(" - ") if part.strip()]
+
+    guess = {}
+    if len(parts) >= 3:
+        guess["artist"] = parts[0]
+        guess["album"] = parts[1]
+        guess["title"] = " - ".join(parts[2:])
+    elif len(parts) == 2:
+        guess["artist"] = parts[0]
+        guess["title"] = parts[1]
+    elif len(parts) == 1:
+        guess["title"] = _LEADING_TRACK_NUMBER_PATTERN.sub("", parts[0]) or parts[0]
+
+    return guess
+
+
+def propose_fills(catalogue, track, min_score=DEFAULT_MIN_SCORE):
+    """Propose values for a track's missing fields from its best match in a reference catalogue.
+
+    The track's existing title, artist, and album are matched on, filling any gaps from the filename. Fields that
+    already have a value are never proposed.
+
+    :param catalogue: The reference catalogue to match against.
+    :type catalogue: ReferenceCatalogue
+
+    :param track: The track to propose values for.
+    :type track: MP3Track
+
+    :param min_score: The minimum score, between 0 and 1, a match needs. Defaults to DEFAULT_MIN_SCORE.
+    :type min_score: float
+
+    :returns: A map of setter names to values. Empty if there was no good enough match or nothing is missing.
+    :rtype: dict
+    """
+
+    current = {field: getattr(track, getter)() for (field, (getter, _)) in FIELD_ACCESSORS.items()}
+    missing_fields = [field for (field, value) in current.items() if value in (None, "")]
+    if len(missing_fields) == 0:
+        return {}
+
+    known = guess_from_filename(track.get_file_path())
+    for field in MATCH_WEIGHTS:
+        if current[field] not in (None, ""):
+            known[field] = current[field]
+
+    (record, score) = catalogue.match(known.get("title"), known.get("artist"), known.get("album"), min_score)
+    if record is None or score < min_score:
+        return {}
+
+    fills = {}
+    for field in missing_fields:
+        value = _format_value(field, record.get(field))
+        if value is not None:
+            fills[FIELD_ACCESSORS[field][1]] = value
+
+    return fills
+
+
+def auto_tag_tracks(catalogue, tracks, min_score=DEFAULT_MIN_SCORE):
+    """Fill the missing fields of a set of tracks from a reference catalogue and save the changed tracks in one batch.
+
+    :param catalogue: The reference catalogue to match against.
+    :type catalogue: ReferenceCatalogue
+
+    :param tracks: The tracks to tag.
+    :type tracks: iterable
+
+    :param min_score: The minimum score, between 0 and 1, a match needs. Defaults to DEFAULT_MIN_SCORE.
+    :type min_score: float
+
+    :returns: A tuple of a map of changed tracks to the fills applied to them and a list of (track, exception) tuples
+        for tracks that could not take their fills or failed to save. A track that could not take its fills is left as
+        it was and is not saved.
+    :rtype: tuple
+    """
+
+    applied_fills = {}
+    failures = []
+    for track in tracks:
+        fills = propose_fills(catalogue, track, min_score)
+        if len(fills) == 0:
+            continue
+
+        frames = track.get_frames()
+        try:
+            for (setter, value) in fills.items():
+                getattr(track, setter)(value)
+        except Exception as error:
+            # Undo the fills that were already set, so the track is not saved with only some of them later on.
+            changed_frames = track.get_frames()
+            track.set_frames({key: frames.get(key) for key in frames.keys() | changed_frames.keys()
+                              if frames.get(key) != changed_frames.get(key)})
+            failures.append((track, error))
+            continue
+
+        applied_fills[track] = fills
+
+    failures.extend(batch_utils.save_tracks(applied_fills))
+
+    return (applied_fills, failures)
+
+
+def _format_value(field, value):
+    """Convert a reference value into the form the field's setter accepts.
+
+    :param field: The field name.
+    :type field: str
+
+    :param value: The reference value.
+    :type value: str or None
+
+    :returns: The converted value or None if it cannot be converted.
+    :rtype: str or None
+    """
+
+    if value is None:
+        return None
+
+    if field == "year":
+        match = _YEAR_PATTERN.match(value)
+        return match.group(1) if match is not None else None
+
+    if field == "track":
+        match = _TRACK_PATTERN.match(value)
+        if match is None:
+            return None
+        return "{}/{}".format(int(match.group(1)), match.group(2) or "")
+
+    return value
+
+
+def _words(text):
+    """Split text into normalised words.
+
+    :param text: The text to split.
+    :type text: str
+
+    :returns: A list of words.
+    :rtype: list
+    """
+
+    return _NON_WORD_PATTERN.sub(" ", text.casefold()).split()
+
+
+def _trigrams(text):
+    """Split text into the set of its character trigrams after normalising case, punctuation, and whitespace.
+
+    :param text: The text to split.
+    :type text: str or None
+
+    :returns: A set of trigrams. Empty if there is no text.
+    :rtype: frozenset
+    """
+
+    if text is None:
+        return frozenset()
+
+    return _cached_trigrams(text)
+
+
+@lru_cache(maxsize=65536)
+def _cached_trigrams(text):
+    """The cached implementation of _trigrams() for non-empty text.
+
+    :param text: The text to split.
+    :type text: str
+
+    :returns: A set of trigrams.
+    :rtype: frozenset
+    """
+
+    normalised_text = " ".join(_words(text))
+    if len(normalised_text) == 0:
+        return frozenset()
+
+    padded_text = "  " + normalised_text + " "
+    return frozenset(padded_text[i:i + 3] for i in range(len(padded_text) - 2))
+
+if __name__ == "__main__":
+    import sys
+    from mp3_track import MP3Track
+    from file_utils import get_mp3_files
+
+    if len(sys.argv) not in (3, 4) or (len(sys.argv) == 4 and sys.argv[3] != "--apply"):
+        print("Usage: python3 auto_tag_utils.py <catalogue.jsonl> <folder> [--apply]")
+        exit(2)
+
+    reference_catalogue = ReferenceCatalogue.load(sys.argv[1])
+    # Without --apply this is only a preview, so leave files without a tag untouched.
+    mp3_tracks = [MP3Track(file_path, create_tag=False) for file_path in get_mp3_files(sys.argv[2], recursive=True)]
+
+    if len(sys.argv) == 4:
+        (changes, save_failures) = auto_tag_tracks(reference_catalogue, mp3_tracks)
+        for (mp3_track, error) in save_failures:
+            print("Unable to save {}: {}".format(mp3_track.get_file_path(), error))
+    else:
+        changes = {mp3_track: propose_fills(reference_catalogue, mp3_track) for mp3_track in mp3_tracks}
+
+    for (mp3_track, changed_fields) in changes.items():
+        if len(changed_fields) > 0:
+            print(mp3_track.get_file_path(), changed_fields)
@@ -0,0 +1,651 @@
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+import file_utils
+import save_journal
+import track_factory
+
+# The number of threads used to save tracks. Saving is dominated by file I/O, so threads overlap well.
+DEFAULT_SAVE_WORKERS = 8
+
+# The number of tracks saved between syncs of their directories and of the journal. Each track's own file is synced by
+# the thread that saved it, but a rename is only durable once its directory is synced, which is done once per group.
+SYNC_GROUP_SIZE = 256
+
+# The setter methods an assignment may name. They only change the tag held in memory, so an assignment cannot save,
+# rename, or fetch anything itself, whoever wrote it.
+FIELD_SETTERS = frozenset(["set_title", "set_artist", "set_album_artist", "set_album", "set_genre", "set_year",
+                           "set_track", "set_part_of_compilation", "set_audio_checksum", "set_frames"])
+
+_ID3_HEADER_SIZE = 10
+_ID3V1_SIZE = 128
+
+_TRACK_NUMBER_PATTERN = re.compile(r"^\s*([0-9]+)")
+
+
+def save_tracks(tracks, max_workers=DEFAULT_SAVE_WORKERS, journal=None):
+    """Save a batch of tracks in parallel.
+
+    Each track is saved to a synced copy of its file, which is then swapped in with os.replace(), so a crash leaves
+    every file either fully saved or untouched. With a journal, an MP3 file whose new tag fits in the space of its old
+    one is instead written in place, without copying its audio. See _save_tag_in_place(). Every track is attempted even
+    if some fail, so one bad file does not stop the rest of the batch.
+
+    :param tracks: The tracks to save.
+    :type tracks: iterable
+
+    :param max_workers: The number of threads to save with. Defaults to DEFAULT_SAVE_WORKERS.
+    :type max_workers: int
+
+    :param journal: A journal to mark saved files in, or None to not keep one. Defaults to None.
+    :type journal: SaveJournal or None
+
+    :returns: A list of (track, exception) tuples for the tracks that failed to save.
+    :rtype: list
+    """
+
+    tracks = list(tracks)
+    if len(tracks) == 0:
+        return []
+
+    failures = []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tracks))) as executor:
+        for start in range(0, len(tracks), SYNC_GROUP_SIZE):
+            group = tracks[start:start + SYNC_GROUP_SIZE]
+            in_place = [journal is not None] * len(group)
+            group_failures = [failure for failure in executor.map(_save_track, group, in_place) if failure is not None]
+            failures.extend(group_failures)
+
+            save_journal.sync_directories({os.path.dirname(track.get_file_path()) for track in group})
+
+            if journal is not None:
+                failed_tracks = {track for (track, _) in group_failures}
+                journal.mark_saved(track.get_file_path() for track in group if track not in failed_tracks)
+
+    return failures
+
+
+def save_assignments(assignments, tracks=None, max_workers=DEFAULT_SAVE_WORKERS,
+                     journal_directory=save_journal.JOURNAL_DIRECTORY):
+    """Apply field assignments to a set of files and save them as one journaled batch.
+
+    The assignments are written to a journal before anything is saved. If the process dies part way, the batch can be
+    finished later with resume_assignments(), which only saves the files that were not saved yet. The journal is only
+    deleted once every file has been saved, so files that failed can be retried the same way, or the batch given up on
+    with discard_assignments().
+
+    :param assignments: A map of file paths to maps of setter method names to values, for example
+        {"/music/a.mp3": {"set_title": "Title", "set_year": "2014"}}. Setters must be in FIELD_SETTERS, and a file
+        with any other setter fails. Values must be JSON serializable if there is a journal.
+    :type assignments: dict
+
+    :param tracks: A map of file paths to tracks that are already loaded. Other files are loaded with
+        track_factory.open_track(). Defaults to None.
+    :type tracks: dict or None
+
+    :param max_workers: The number of threads to load and save with. Defaults to DEFAULT_SAVE_WORKERS.
+    :type max_workers: int
+
+    :param journal_directory: The directory to keep the journal in, or None to not keep one. Defaults to
+        save_journal.JOURNAL_DIRECTORY.
+    :type journal_directory: str or None
+
+    :returns: A list of (file path, exception) tuples for the files that failed to load, take an assignment, or save.
+    :rtype: list
+
+    :raise IOError: Error writing journal.
+    """
+
+    if journal_directory is None:
+        return _run_assignments(assignments, tracks or {}, max_workers, None)
+
+    journal = save_journal.SaveJournal.create(assignments, journal_directory)
+
+    return _run_journaled_assignments(assignments, tracks or {}, max_workers, journal)
+
+
+def resume_assignments(journal, max_workers=DEFAULT_SAVE_WORKERS):
+    """Finish a batch started by save_assignments() that was interrupted or finished with failures. The journal is kept
+    if any file fails again.
+
+    :param journal: The journal of the batch.
+    :type journal: SaveJournal
+
+    :param max_workers: The number of threads to load and save with. Defaults to DEFAULT_SAVE_WORKERS.
+    :type max_workers: int
+
+    :returns: A list of (file path, exception) tuples for the files that failed to load, take an assignment, or save.
+    :rtype: list
+
+    :raise IOError: Error reading journal, or the batch is being saved by another process.
+    """
+
+    journal.acquire()
+    try:
+        pending = journal.get_pending()
+        _restore_tag_backups(pending)
+        journal.remove_temp_files()
+    except BaseException:
+        journal.release()
+        raise
+
+    return _run_journaled_assignments(pending, {}, max_workers, journal)
+
+
+def discard_assignments(journal):
+    """Give up on a batch started by save_assignments() that was interrupted or finished with failures, so it is not
+    offered again. The files that were not saved keep their old tags, and whatever the batch left next to them is
+    cleaned up.
+
+    :param journal: The journal of the batch.
+    :type journal: SaveJournal
+
+    :raise IOError: Error reading journal, or the batch is being saved by another process.
+    """
+
+    journal.acquire()
+    try:
+        pending = journal.get_pending()
+        _restore_tag_backups(pending)
+        journal.remove_temp_files()
+    except BaseException:
+        journal.release()
+        raise
+
+    journal.close()
+
+
+def check_setters(assignment):
+    """Check that an assignment only names setters in FIELD_SETTERS.
+
+    :param assignment: A map of setter method names to values.
+    :type assignment: dict
+
+    :raise ValueError: A setter is not in FIELD_SETTERS.
+    """
+
+    for setter in assignment:
+        if setter not in FIELD_SETTERS:
+            raise ValueError("Not a field setter: " + setter)
+
+
+def group_tracks_by_album(tracks):
+    """Group tracks into albums by album artist and album.
+
+    Tracks without an album artist are grouped by their artist instead. Comparison ignores case and extra whitespace.
+
+    :param tracks: The tracks to group.
+    :type tracks: iterable
+
+    :returns: A map of (album artist, album) tuples to lists of tracks.
+    :rtype: dict
+    """
+
+    albums = {}
+    for track in tracks:
+        album_artist = track.get_album_artist() or track.get_artist()
+        key = (_normalise_text(album_artist), _normalise_text(track.get_album()))
+        albums.setdefault(key, []).append(track)
+
+    return albums
+
+
+def number_tracks(tracks, by_filename=False):
+    """Work out "<track_number>/<total_tracks>" values for a set of tracks, numbering each album separately.
+
+    Nothing is applied to the tracks. See apply_track_numbers().
+
+    The tracks of an album in different folders, such as one folder per disc, are kept together folder by folder in
+    natural order, so "Disc 2" is numbered after "Disc 1" even though both start at track 1.
+
+    :param tracks: The tracks to number.
+    :type tracks: iterable
+
+    :param by_filename: True to order each album by filename, false to order by the existing track number and fall back
+        to the filename for tracks without one. Defaults to False.
+    :type by_filename: bool
+
+    :returns: A map of tracks to their new track information.
+    :rtype: dict
+    """
+
+    track_numbers = {}
+
+    for album_tracks in group_tracks_by_album(tracks).values():
+        if by_filename:
+            album_tracks.sort(key=lambda track: (_folder_sort_key(track), _filename_sort_key(track)))
+        else:
+            album_tracks.sort(key=lambda track: (_folder_sort_key(track), _track_number_sort_key(track),
+                                                 _filename_sort_key(track)))
+
+        total = len(album_tracks)
+        for (number, track) in enumerate(album_tracks, 1):
+            track_numbers[track] = "{}/{}".format(number, total)
+
+    return track_numbers
+
+
+def apply_track_numbers(tracks, by_filename=False):
+    """Number a set of tracks album by album and save them all in one batch.
+
+    Tracks whose track information is already correct are not saved again.
+
+    :param tracks: The tracks to number.
+    :type tracks: iterable
+
+    :param by_filename: See number_tracks(). Defaults to False.
+    :type by_filename: bool
+
+    :returns: A list of (track, exception) tuples for the tracks that failed to save.
+    :rtype: list
+    """
+
+    changed_tracks = []
+    for (track, track_number) in number_tracks(tracks, by_filename).items():
+        if track.get_track() != track_number:
+            track.set_track(track_number)
+            changed_tracks.append(track)
+
+    return save_tracks(changed_tracks)
+
+
+def _run_journaled_assignments(assignments, tracks, max_workers, journal):
+    """Run assignments under a journal owned by this process, then delete the journal if every file was saved, or give
+    up ownership of it otherwise.
+
+    :param assignments: A map of file paths to maps of setter method names to values.
+    :type assignments: dict
+
+    :param tracks: A map of file paths to tracks that are already loaded.
+    :type tracks: dict
+
+    :param max_workers: The number of threads to load and save with.
+    :type max_workers: int
+
+    :param journal: The journal, owned by this process.
+    :type journal: SaveJournal
+
+    :returns: A list of (file path, exception) tuples for the files that failed.
+    :rtype: list
+
+    :raise IOError: Error writing journal.
+    """
+
+    try:
+        failures = _run_assignments(assignments, tracks, max_workers, journal)
+    except BaseException:
+        # Cut short, so the journal is left as interrupted.
+        journal.release()
+        raise
+
+    if len(failures) == 0:
+        journal.close()
+    else:
+        journal.release(file_path for (file_path, _) in failures)
+
+    return failures
+
+
+def _run_assignments(assignments, tracks, max_workers, journal):
+    """Load, assign, and save files group by group, so only one group of tracks is held in memory at a time.
+
+    :param assignments: A map of file paths to maps of setter method names to values.
+    :type assignments: dict
+
+    :param tracks: A map of file paths to tracks that are already loaded.
+    :type tracks: dict
+
+    :param max_workers: The number of threads to load and save with.
+    :type max_workers: int
+
+    :param journal: The journal to mark saved files in, or None.
+    :type journal: SaveJournal or None
+
+    :returns: A list of (file path, exception) tuples for the files that failed.
+    :rtype: list
+    """
+
+    def assign(file_path):
+        try:
+            check_setters(assignments[file_path])
+            track = tracks.get(file_path) or track_factory.open_track(file_path)
+            for (setter, value) in assignments[file_path].items():
+                getattr(track, setter)(value)
+        except Exception as error:
+            return (file_path, error)
+
+        return (track, None)
+
+    file_paths = list(assignments)
+    failures = []
+
+    for start in range(0, len(file_paths), SYNC_GROUP_SIZE):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(assign, file_paths[start:start + SYNC_GROUP_SIZE]))
+
+        failures.extend(result for result in results if result[1] is not None)
+        save_failures = save_tracks([track for (track, error) in results if error is None], max_workers, journal)
+        failures.extend((track.get_file_path(), error) for (track, error) in save_failures)
+
+    return failures
+
+
+def _save_track(track, in_place=False):
+    """Save a single track, catching any error so it can be reported with the rest of the batch.
+
+    :param track: The track to save.
+    :type track: MP3Track or MusicTrack
+
+    :param in_place: True to write the tag in place when it fits, false to always save to a copy. Defaults to False.
+    :type in_place: bool
+
+    :returns: A (track, exception) tuple if saving failed, None otherwise.
+    :rtype: tuple or None
+    """
+
+    try:
+        if not (in_place and _save_tag_in_place(track)):
+            _save_track_atomically(track)
+    except Exception as error:
+        return (track, error)
+
+    return None
+
+
+def _save_track_atomically(track):
+    """Save a track to a copy of its file, sync the copy, and swap it in.
+
+    The copy lives next to the file, so the swap is a rename within one filesystem. The directory is not synced here,
+    see save_tracks().
+
+    :param track: The track to save.
+    :type track: MP3Track or MusicTrack
+
+    :raise IOError: Error copying, saving, or replacing file.
+    """
+
+    file_path = track.get_file_path()
+    (temp_path, temp_file) = _create_temp_file(file_path, file_utils.TEMP_FILE_SUFFIX)
+
+    with temp_file:
+        try:
+            shutil.copyfile(file_path, temp_path)
+            shutil.copymode(file_path, temp_path)
+            track.save_tag(temp_path)
+
+            with open(temp_path, "rb+") as saved_file:
+                os.fsync(saved_file.fileno())
+
+            os.replace(temp_path, file_path)
+        except BaseException:
+            _remove_quietly(temp_path)
+            raise
+
+
+def _save_tag_in_place(track):
+    """Save the tag of an MP3 track over its old tag without copying its audio, if the new tag fits in the old one's
+    space.
+
+    MP3 tracks only ever write their ID3V2 tag at the start of the file and their ID3V1 tag, if there is one, in the
+    last 128 bytes. The old tag region and ID3V1 tag are copied to a small scratch file and the track is saved to
+    that, which shows whether the new tag fits without touching the file. If it fits, the old region is backed up next
+    to the file and the new one is written over it. A crash part way leaves the backup behind, and
+    resume_assignments() restores it before the batch is saved again, so this is only safe for journaled batches.
+
+    :param track: The track to save.
+    :type track: MP3Track or MusicTrack
+
+    :returns: True if the tag was saved, false if the file has no ID3V2 tag or the new tag does not fit, in which case
+        nothing was written.
+    :rtype: bool
+
+    :raise IOError: Error reading or writing file.
+    """
+
+    file_path = track.get_file_path()
+    if file_utils.get_file_format(file_path) != file_utils.FORMAT_MP3:
+        return False
+
+    with open(file_path, "rb") as file:
+        region_size = _get_tag_region_size(file.read(_ID3_HEADER_SIZE))
+        if region_size is None:
+            return False
+
+        file.seek(0)
+        region = file.read(region_size)
+        file_size = os.fstat(file.fileno()).st_size
+        id3v1_tag = b""
+        if file_size >= region_size + _ID3V1_SIZE:
+            file.seek(-_ID3V1_SIZE, os.SEEK_END)
+            id3v1_tag = file.read(_ID3V1_SIZE)
+            if not id3v1_tag.startswith(b"TAG"):
+                id3v1_tag = b""
+
+    if len(region) != region_size:
+        return False
+
+    # Without an ID3V1 tag, the scratch file ends in zeros where a new one would be written. That way, a save that adds
+    # one changes the scratch file's size and is not done in place.
+    (scratch_path, scratch_file) = _create_temp_file(file_path, file_utils.TEMP_FILE_SUFFIX)
+    with scratch_file:
+        try:
+            scratch_file.write(region + (id3v1_tag or b"\x00" * _ID3V1_SIZE))
+            scratch_file.flush()
+            track.save_tag(scratch_path)
+            with open(scratch_path, "rb") as saved_file:
+                scratch = saved_file.read()
+        finally:
+            _remove_quietly(scratch_path)
+
+    (new_region, new_id3v1_tag) = (scratch[:region_size], scratch[region_size:])
+    if (len(scratch) != region_size + _ID3V1_SIZE or _get_tag_region_size(new_region) != region_size or
+            (not id3v1_tag and new_id3v1_tag != b"\x00" * _ID3V1_SIZE)):
+        return False
+
+    if new_region == region and (not id3v1_tag or new_id3v1_tag == id3v1_tag):
+        return True
+
+    (backup_path, backup_file) = _create_temp_file(file_path, file_utils.TAG_BACKUP_SUFFIX)
+    with backup_file:
+        try:
+            backup_file.write(region + id3v1_tag)
+            backup_file.flush()
+            os.fsync(backup_file.fileno())
+            save_journal.sync_directories([os.path.dirname(file_path)])
+        except BaseException:
+            _remove_quietly(backup_path)
+            raise
+
+        try:
+            _write_tag_region(file_path, new_region, new_id3v1_tag if id3v1_tag else b"")
+        except BaseException:
+            # Put the old tag back. If even that fails, the backup is left for resume_assignments() to restore.
+            _write_tag_region(file_path, region, id3v1_tag)
+            os.remove(backup_path)
+            raise
+
+        # A crash before the directory is synced can bring the backup back, but the file is not marked as saved in the
+        # journal until then either, so restoring the backup and saving again is still right.
+        os.remove(backup_path)
+
+    return True
+
+
+def _restore_tag_backups(file_paths):
+    """Restore the tags backed up by saves in place that were interrupted. See _save_tag_in_place().
+
+    :param file_paths: The paths of the files whose saves may have been interrupted.
+    :type file_paths: iterable
+
+    :raise IOError: Error reading backup or writing file.
+    """
+
+    for file_path in file_paths:
+        for backup_path in save_journal.find_temp_files(file_path, file_utils.TAG_BACKUP_SUFFIX):
+            with open(backup_path, "rb") as backup_file:
+                # Still locked by a save in place running in another process.
+                if not save_journal.try_lock(backup_file):
+                    continue
+
+                backup = backup_file.read()
+                region_size = _get_tag_region_size(backup[:_ID3_HEADER_SIZE])
+                if region_size is not None and len(backup) in (region_size, region_size + _ID3V1_SIZE):
+                    _write_tag_region(file_path, backup[:region_size], backup[region_size:])
+
+                os.remove(backup_path)
+
+
+def _write_tag_region(file_path, region, id3v1_tag):
+    """Overwrite the ID3V2 tag region at the start of a file, and its ID3V1 tag, and sync the file.
+
+    :param file_path: The path to the file.
+    :type file_path: str
+
+    :param region: The new tag region, exactly as long as the old one.
+    :type region: bytes
+
+    :param id3v1_tag: The new ID3V1 tag to write over the last 128 bytes, or an empty bytes object to leave them.
+    :type id3v1_tag: bytes
+
+    :raise IOError: Error writing file.
+    """
+
+    with open(file_path, "rb+") as file:
+        file.write(region)
+        if id3v1_tag:
+            file.seek(-_ID3V1_SIZE, os.SEEK_END)
+            file.write(id3v1_tag)
+        file.flush()
+        os.fsync(file.fileno())
+
+
+def _get_tag_region_size(header):
+    """Get the size of the ID3V2 tag region, including its header and padding, that starts with a header.
+
+    :param header: The first 10 bytes of the region.
+    :type header: bytes
+
+    :returns: The size of the region, or None if there is no ID3V2 tag or it has a footer, which is not written in
+        place.
+    :rtype: int or None
+    """
+
+    if len(header) < _ID3_HEADER_SIZE or not header.startswith(b"ID3") or header[5] & 0x10:
+        return None
+
+    return _ID3_HEADER_SIZE + ((header[6] & 0x7f) << 21 | (header[7] & 0x7f) << 14 | (header[8] & 0x7f) << 7 |
+                               (header[9] & 0x7f))
+
+
+def _create_temp_file(file_path, suffix):
+    """Create an empty hidden file next to a file, named after it so that it can be found again with
+    save_journal.find_temp_files(). The new file is locked until it is closed, so that it is not mistaken for one left
+    behind by an interrupted save.
+
+    :param file_path: The path to the file.
+    :type file_path: str
+
+    :param suffix: The suffix of the new file.
+    :type suffix: str
+
+    :returns: A tuple of the path to the new file and the new file, opened for binary writing.
+    :rtype: tuple
+
+    :raise IOError: Error creating file.
+    """
+
+    (directory, filename) = os.path.split(file_path)
+    (file_descriptor, temp_path) = tempfile.mkstemp(prefix="." + filename + ".", suffix=suffix, dir=directory or ".")
+
+    temp_file = os.fdopen(file_descriptor, "wb")
+    save_journal.try_lock(temp_file)
+
+    return (temp_path, temp_file)
+
+
+def _remove_quietly(path):
+    """Remove a file, ignoring errors.
+
+    :param path: The path to the file.
+    :type path: str
+    """
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _normalise_text(text):
+    """Normalise a tag value for grouping.
+
+    :param text: The text to normalise.
+    :type text: str or None
+
+    :returns: The text case folded with runs of whitespace collapsed, or an empty string if there is no text.
+    :rtype: str
+    """
+
+    if text is None:
+        return ""
+
+    return " ".join(text.casefold().split())
+
+
+def _track_number_sort_key(track):
+    """Build a sort key from a track's existing track number. Tracks without a number sort last.
+
+    :param track: The track.
+    :type track: MP3Track
+
+    :returns: A sort key.
+    :rtype: tuple
+    """
+
+    match = _TRACK_NUMBER_PATTERN.match(track.get_track() or "")
+    if match is None:
+        return (1, 0)
+
+    return (0, int(match.group(1)))
+
+
+def _filename_sort_key(track):
+    """Build a natural sort key from a track's filename so that "2 - x.mp3" sorts before "10 - x.mp3".
+
+    :param track: The track.
+    :type track: MP3Track
+
+    :returns: A sort key.
+    :rtype: list
+    """
+
+    return _natural_sort_key(os.path.basename(track.get_file_path()))
+
+
+def _folder_sort_key(track):
+    """Build a natural sort key from the folder of a track so that "Disc 2" sorts before "Disc 10".
+
+    :param track: The track.
+    :type track: MP3Track
+
+    :returns: A sort key.
+    :rtype: list
+    """
+
+    return _natural_sort_key(os.path.dirname(track.get_file_path()))
+
+
+def _natural_sort_key(text):
+    """Build a sort key that compares runs of digits by their value and everything else case-insensitively.
+
+    :param text: The text.
+    :type text: str
+
+    :returns: A sort key.
+    :rtype: list
+    """
+
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split("([0-9]+)", text.casefold())]
@@ -0,0 +1,162 @@
+import re
+from multiprocessing import Pool
+import audio_utils
+from id3_reader import read_tag
+
+# The number of files handed to a worker process at a time. Larger chunks mean less inter-process overhead.
+_POOL_CHUNK_SIZE = 64
+
+_TRACK_NUMBER_PATTERN = re.compile(r"^\s*0*([0-9]+)")
+
+
+class DuplicateReport:
+    """The result of a duplicate analysis.
+
+    Files are reported as duplicates in two ways:
+    - audio_groups: Files whose audio data is byte for byte identical, regardless of how they are tagged.
+    - tag_groups: Files whose normalised artist, album, title, and track number match, but whose audio differs. These
+      are likely different rips or encodings of the same track.
+    """
+
+    def __init__(self, audio_groups, tag_groups, errors):
+        """Create a new report.
+
+        :param audio_groups: A list of lists of file paths with identical audio.
+        :type audio_groups: list
+
+        :param tag_groups: A list of lists of file paths with matching tags, but different audio.
+        :type tag_groups: list
+
+        :param errors: A list of (file path, error message) tuples for files that could not be analysed.
+        :type errors: list
+        """
+
+        self.audio_groups = audio_groups
+        self.tag_groups = tag_groups
+        self.errors = errors
+
+    def __str__(self):
+        lines = []
+
+        lines.append("Identical audio ({} groups):".format(len(self.audio_groups)))
+        for group in self.audio_groups:
+            lines.extend("  " + file_path for file_path in group)
+            lines.append("")
+
+        lines.append("Matching tags ({} groups):".format(len(self.tag_groups)))
+        for group in self.tag_groups:
+            lines.extend("  " + file_path for file_path in group)
+            lines.append("")
+
+        if len(self.errors) > 0:
+            lines.append("Unable to analyse ({} files):".format(len(self.errors)))
+            lines.extend("  {}: {}".format(file_path, message) for (file_path, message) in self.errors)
+
+        return "\n".join(lines).rstrip()
+
+
+def find_duplicates(paths, processes=None):
+    """Find duplicate and near-duplicate tracks in a single pass over a list of files.
+
+    Files are read and hashed in a pool of worker processes. Each file is opened once for its tag and streamed once
+    for its audio hash.
+
+    :param paths: The paths of the MP3 files to analyse.
+    :type paths: list
+
+    :param processes: The number of worker processes to use. Defaults to the number of CPUs.
+    :type processes: int or None
+
+    :returns: A report of all duplicate groups found.
+    :rtype: DuplicateReport
+    """
+
+    files_by_audio = {}
+    files_by_tags = {}
+    errors = []
+
+    with Pool(processes) as pool:
+        for (file_path, tags, audio_hash, error) in pool.imap_unordered(_analyse_file, paths, _POOL_CHUNK_SIZE):
+            if error is not None:
+                errors.append((file_path, error))
+                continue
+
+            files_by_audio.setdefault(audio_hash, []).append(file_path)
+
+            # Only group by tags if there is enough information to be confident two files are the same track.
+            if tags[0] and tags[2]:
+                files_by_tags.setdefault(tags, {}).setdefault(audio_hash, []).append(file_path)
+
+    audio_groups = [sorted(group) for group in files_by_audio.values() if len(group) > 1]
+
+    tag_groups = []
+    for groups_by_audio in files_by_tags.values():
+        # Files with identical audio are already reported, so only report a tag group if its audio actually differs.
+        if len(groups_by_audio) > 1:
+            tag_groups.append(sorted(file_path for group in groups_by_audio.values() for file_path in group))
+
+    return DuplicateReport(sorted(audio_groups), sorted(tag_groups), sorted(errors))
+
+
+def normalise_tags(track):
+    """Build a normalised (artist, album, title, track number) tuple for a track so that cosmetic differences in
+    casing, spacing, and track number padding do not prevent a match.
+
+    :param track: The track to read tags from.
+    :type track: MP3Track or TagSnapshot
+
+    :returns: A tuple of normalised tag values. Missing values are empty strings.
+    :rtype: tuple
+    """
+
+    artist = _normalise_text(track.get_artist())
+    album = _normalise_text(track.get_album())
+    title = _normalise_text(track.get_title())
+
+    track_number = ""
+    match = _TRACK_NUMBER_PATTERN.match(track.get_track() or "")
+    if match is not None:
+        track_number = match.group(1)
+
+    return (artist, album, title, track_number)
+
+
+def _normalise_text(text):
+    """Normalise a tag value for comparison.
+
+    :param text: The text to normalise.
+    :type text: str or None
+
+    :returns: The text case folded with runs of whitespace collapsed, or an empty string if there is no text.
+    :rtype: str
+    """
+
+    if text is None:
+        return ""
+
+    return " ".join(text.casefold().split())
+
+
+def _analyse_file(path):
+    """Read the tags of a file and hash its audio. Runs in a worker process.
+
+    :param path: The path of the MP3 file to analyse.
+    :type path: str
+
+    :returns: A tuple of the file path, the normalised tags, the audio hash, and an error message if analysis failed.
+    :rtype: tuple
+    """
+
+    try:
+        tags = normalise_tags(read_tag(path))
+        audio_hash = audio_utils.hash_audio(path)
+    except IOError as error:
+        return (path, None, None, str(error))
+
+    return (path, tags, audio_hash, None)
+
+if __name__ == "__main__":
+    import sys
+    from file_utils import get_mp3_files
+
+    print(find_duplicates(get_mp3_files(sys.argv[1], recursive=True)))
@@ -0,0 +1,496 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+import batch_utils
+
+# Where the undo history is kept. It is never trimmed, so every edit ever made can be undone.
+HISTORY_DIRECTORY = os.path.join(os.path.expanduser("~"), ".mp3_tagger", "history")
+
+# Encoded frames up to this size are stored inline in the action log. Larger ones, such as pictures, are stored once per
+# distinct content in the blob directory, so applying the same album art to a thousand tracks stores it once.
+INLINE_FRAME_SIZE = 256
+
+_ACTIONS_FILENAME = "actions.jsonl"
+_CURSOR_FILENAME = "cursor"
+_BLOBS_DIRECTORY = "blobs"
+
+# Prefixes of stored frame references.
+_INLINE_PREFIX = "="
+_BLOB_PREFIX = "sha1:"
+
+
+class FrameCapture:
+    """The frames of a set of tracks captured by EditHistory.capture() before an edit."""
+
+    def __init__(self):
+        # A map of file paths to maps of frame keys to frame references.
+        self.frames = {}
+
+        # The digests of the blobs the capture had to create, which record() removes again if the edit did not use them.
+        self.created_digests = set()
+
+
+class EditHistory:
+    """An on-disk undo and redo history of tag edits.
+
+    Each action records, for every file it changed, only the frames that changed, with their encoded value before and
+    after. A frame that did not exist on one side is recorded as None. Actions are appended to a JSON lines log and a
+    cursor file holds how many of them are currently applied. Recording a new action after undoing discards the actions
+    that could have been redone.
+
+    Frames are captured with the get_frames() and restored with the set_frames() methods every track class has.
+    """
+
+    def __init__(self, directory=HISTORY_DIRECTORY):
+        """Open a history, creating it if it does not exist.
+
+        :param directory: The directory the history is kept in. Defaults to HISTORY_DIRECTORY.
+        :type directory: str
+
+        :raise IOError: Error reading or creating history.
+        """
+
+        self.directory = directory
+        self._actions_path = os.path.join(directory, _ACTIONS_FILENAME)
+        self._cursor_path = os.path.join(directory, _CURSOR_FILENAME)
+        self._blobs_directory = os.path.join(directory, _BLOBS_DIRECTORY)
+
+        os.makedirs(self._blobs_directory, exist_ok=True)
+
+        # The byte offset of each action in the log, so any action can be read without scanning the log.
+        self._offsets = []
+        self._log_size = 0
+        self._load_offsets()
+
+        self._cursor = len(self._offsets)
+        try:
+            with open(self._cursor_path, encoding="utf8") as file:
+                self._cursor = min(max(int(file.read().strip()), 0), len(self._offsets))
+        except (IOError, ValueError):
+            pass
+
+    def capture(self, tracks):
+        """Capture the frames of tracks before they are edited. Pass the result to record() once they are saved.
+
+        Only references to the frames are kept in memory. Frames larger than INLINE_FRAME_SIZE, such as pictures, are
+        written to the blob directory straight away, once per distinct content, so capturing a large selection never
+        holds all of its pictures at once. record() removes the blobs of frames the edit did not change again.
+
+        :param tracks: The tracks about to be edited.
+        :type tracks: iterable
+
+        :returns: The captured frames.
+        :rtype: FrameCapture
+
+        :raise IOError: Error writing history.
+        """
+
+        capture = FrameCapture()
+        for track in tracks:
+            capture.frames[track.get_file_path()] = {
+                key: self._store_frame(encoded_frame, capture.created_digests)
+                for (key, encoded_frame) in track.get_frames().items()}
+
+        return capture
+
+    def record(self, description, before, tracks, failures=()):
+        """Record the frames that changed between a capture and the tracks as they are now saved.
+
+        :param description: A short description of the edit, such as "Save Tags".
+        :type description: str
+
+        :param before: The result of capture() from before the edit.
+        :type before: FrameCapture
+
+        :param tracks: The tracks after the edit.
+        :type tracks: iterable
+
+        :param failures: The (track or file path, exception) tuples of tracks that failed to save, which are left out.
+            Defaults to an empty tuple.
+        :type failures: iterable
+
+        :returns: True if anything changed and an action was recorded, false otherwise.
+        :rtype: bool
+
+        :raise IOError: Error writing history.
+        """
+
+        failed_file_paths = {track if isinstance(track, str) else track.get_file_path() for (track, _) in failures}
+
+        changes = {}
+        try:
+            for track in tracks:
+                file_path = track.get_file_path()
+                if file_path in failed_file_paths or file_path not in before.frames:
+                    continue
+
+                before_frames = before.frames[file_path]
+                after_frames = track.get_frames()
+                frame_changes = {}
+                for key in before_frames.keys() | after_frames.keys():
+                    (before_reference, after_frame) = (before_frames.get(key), after_frames.get(key))
+                    if before_reference != self._get_reference(after_frame):
+                        frame_changes[key] = [before_reference, self._store_frame(after_frame)]
+
+                if len(frame_changes) > 0:
+                    changes[file_path] = frame_changes
+        finally:
+            # Blobs captured for frames that did not change are not needed. Blobs that existed before the capture may
+            # be used by earlier actions, so only the ones it created are removed.
+            used_references = {reference for frame_changes in changes.values()
+                               for references in frame_changes.values() for reference in references}
+            for digest in before.created_digests:
+                if _BLOB_PREFIX + digest not in used_references:
+                    try:
+                        os.remove(self._get_blob_path(digest))
+                    except OSError:
+                        pass
+            before.created_digests.clear()
+
+        if len(changes) == 0:
+            return False
+
+        # Recording after an undo discards the actions that could have been redone.
+        if self._cursor < len(self._offsets):
+            with open(self._actions_path, "r+b") as file:
+                file.truncate(self._offsets[self._cursor])
+            self._log_size = self._offsets[self._cursor]
+            del self._offsets[self._cursor:]
+
+        line = json.dumps({"description": description, "time": time.time(), "changes": changes},
+                          separators=(",", ":")).encode("utf8") + b"\n"
+        with open(self._actions_path, "ab") as file:
+            file.write(line)
+
+        self._offsets.append(self._log_size)
+        self._log_size += len(line)
+        self._set_cursor(self._cursor + 1)
+
+        return True
+
+    def can_undo(self):
+        """Whether or not there is an action to undo.
+
+        :returns: True if there is an applied action, false otherwise.
+        :rtype: bool
+        """
+
+        return self._cursor > 0
+
+    def can_redo(self):
+        """Whether or not there is an action to redo.
+
+        :returns: True if there is an undone action, false otherwise.
+        :rtype: bool
+        """
+
+        return self._cursor < len(self._offsets)
+
+    def get_undo_description(self):
+        """Get the description of the action undo() would undo.
+
+        :returns: The description, or None if there is nothing to undo.
+        :rtype: str or None
+        """
+
+        return self._read_action(self._cursor - 1)["description"] if self.can_undo() else None
+
+    def get_redo_description(self):
+        """Get the description of the action redo() would redo.
+
+        :returns: The description, or None if there is nothing to redo.
+        :rtype: str or None
+        """
+
+        return self._read_action(self._cursor)["description"] if self.can_redo() else None
+
+    def get_undo_missing_files(self):
+        """Get the files changed by the action undo() would undo that no longer exist, e.g. because they were deleted
+        or renamed since.
+
+        :returns: The paths of the missing files, empty if there is nothing to undo.
+        :rtype: list
+
+        :raise IOError: Error reading history.
+        """
+
+        return self._get_missing_files(self._cursor - 1) if self.can_undo() else []
+
+    def get_redo_missing_files(self):
+        """Get the files changed by the action redo() would redo that no longer exist.
+
+        :returns: The paths of the missing files, empty if there is nothing to redo.
+        :rtype: list
+
+        :raise IOError: Error reading history.
+        """
+
+        return self._get_missing_files(self._cursor) if self.can_redo() else []
+
+    def undo(self, tracks=None, max_workers=batch_utils.DEFAULT_SAVE_WORKERS, skip_missing=False):
+        """Restore the frames the last applied action changed to what they were before it, and save the files through
+        the parallel batch save.
+
+        Every file that can be restored is. If any file cannot be, the action stays applied so the undo can be tried
+        again, and files that were restored are simply restored again. Files that no longer exist would keep the action
+        applied for good, so they can be skipped. See get_undo_missing_files().
+
+        :param tracks: A map of file paths to tracks that are already loaded, which are updated in place. Other files
+            are loaded as needed. Defaults to None.
+        :type tracks: dict or None
+
+        :param max_workers: The number of threads to load and save with. Defaults to batch_utils.DEFAULT_SAVE_WORKERS.
+        :type max_workers: int
+
+        :param skip_missing: True to leave out files that no longer exist rather than fail on them. Defaults to False.
+        :type skip_missing: bool
+
+        :returns: A list of (file path, exception) tuples for the files that could not be restored.
+        :rtype: list
+
+        :raise IOError: Error reading or writing history.
+        """
+
+        if not self.can_undo():
+            return []
+
+        failures = self._apply(self._read_action(self._cursor - 1), 0, tracks, max_workers, skip_missing)
+        if len(failures) == 0:
+            self._set_cursor(self._cursor - 1)
+
+        return failures
+
+    def redo(self, tracks=None, max_workers=batch_utils.DEFAULT_SAVE_WORKERS, skip_missing=False):
+        """Apply the frames of the first undone action again, and save the files through the parallel batch save.
+
+        If any file cannot be restored, the action stays undone so the redo can be tried again.
+
+        :param tracks: See undo().
+        :type tracks: dict or None
+
+        :param max_workers: See undo().
+        :type max_workers: int
+
+        :param skip_missing: See undo() and get_redo_missing_files().
+        :type skip_missing: bool
+
+        :returns: A list of (file path, exception) tuples for the files that could not be restored.
+        :rtype: list
+
+        :raise IOError: Error reading or writing history.
+        """
+
+        if not self.can_redo():
+            return []
+
+        failures = self._apply(self._read_action(self._cursor), 1, tracks, max_workers, skip_missing)
+        if len(failures) == 0:
+            self._set_cursor(self._cursor + 1)
+
+        return failures
+
+    def _get_missing_files(self, index):
+        """Get the files changed by an action that no longer exist.
+
+        :param index: The index of the action.
+        :type index: int
+
+        :returns: The paths of the missing files.
+        :rtype: list
+
+        :raise IOError: Error reading history.
+        """
+
+        return [file_path for file_path in self._read_action(index)["changes"] if not os.path.exists(file_path)]
+
+    def _apply(self, action, side, tracks, max_workers, skip_missing):
+        """Set one side of every frame change of an action on its file and save.
+
+        :param action: The action.
+        :type action: dict
+
+        :param side: 0 for the frames before the action, 1 for the frames after it.
+        :type side: int
+
+        :param tracks: A map of file paths to tracks that are already loaded, or None.
+        :type tracks: dict or None
+
+        :param max_workers: The number of threads to load and save with.
+        :type max_workers: int
+
+        :param skip_missing: True to leave out files that no longer exist.
+        :type skip_missing: bool
+
+        :returns: A list of (file path, exception) tuples for the files that failed.
+        :rtype: list
+        """
+
+        assignments = {}
+        for (file_path, frame_changes) in action["changes"].items():
+            if skip_missing and not os.path.exists(file_path):
+                continue
+            frames = {key: self._load_frame(references[side]) for (key, references) in frame_changes.items()}
+            assignments[file_path] = {"set_frames": frames}
+
+        # The encoded frames are not JSON serializable and the history itself says what to redo, so skip the journal.
+        return batch_utils.save_assignments(assignments, tracks, max_workers, journal_directory=None)
+
+    def _store_frame(self, encoded_frame, created_digests=None):
+        """Turn an encoded frame into a reference that can be kept in the action log, storing it as a blob if large.
+
+        :param encoded_frame: The encoded frame, or None.
+        :type encoded_frame: bytes or None
+
+        :param created_digests: A set to add the digest of the blob to if it had to be created, or None. Defaults to
+            None.
+        :type created_digests: set or None
+
+        :returns: The reference, or None.
+        :rtype: str or None
+
+        :raise IOError: Error writing blob.
+        """
+
+        reference = self._get_reference(encoded_frame)
+        if reference is None or reference.startswith(_INLINE_PREFIX):
+            return reference
+
+        digest = reference[len(_BLOB_PREFIX):]
+        blob_path = self._get_blob_path(digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            # Write to a temp file first so a blob is never seen half written.
+            (file_descriptor, temp_path) = tempfile.mkstemp(dir=os.path.dirname(blob_path))
+            with os.fdopen(file_descriptor, "wb") as file:
+                file.write(encoded_frame)
+            os.replace(temp_path, blob_path)
+            if created_digests is not None:
+                created_digests.add(digest)
+
+        return reference
+
+    @staticmethod
+    def _get_reference(encoded_frame):
+        """Get the reference _store_frame() would return for an encoded frame, without storing anything.
+
+        :param encoded_frame: The encoded frame, or None.
+        :type encoded_frame: bytes or None
+
+        :returns: The reference, or None.
+        :rtype: str or None
+        """
+
+        if encoded_frame is None:
+            return None
+
+        if len(encoded_frame) <= INLINE_FRAME_SIZE:
+            return _INLINE_PREFIX + base64.b64encode(encoded_frame).decode("ascii")
+
+        return _BLOB_PREFIX + hashlib.sha1(encoded_frame).hexdigest()
+
+    def _load_frame(self, reference):
+        """Load an encoded frame from a reference made by _store_frame().
+
+        :param reference: The reference, or None.
+        :type reference: str or None
+
+        :returns: The encoded frame, or None.
+        :rtype: bytes or None
+        """
+
+        if reference is None:
+            return None
+
+        if reference.startswith(_INLINE_PREFIX):
+            return base64.b64decode(reference[len(_INLINE_PREFIX):])
+
+        with open(self._get_blob_path(reference[len(_BLOB_PREFIX):]), "rb") as file:
+            return file.read()
+
+    def _get_blob_path(self, digest):
+        """Get the path of a blob, fanned out over subdirectories by the first two digits of its digest.
+
+        :param digest: The SHA-1 hex digest of the blob.
+        :type digest: str
+
+        :returns: The path of the blob.
+        :rtype: str
+        """
+
+        return os.path.join(self._blobs_directory, digest[:2], digest)
+
+    def _read_action(self, index):
+        """Read an action from the log.
+
+        :param index: The index of the action.
+        :type index: int
+
+        :returns: The action.
+        :rtype: dict
+        """
+
+        with open(self._actions_path, "rb") as file:
+            file.seek(self._offsets[index])
+            return json.loads(file.readline().decode("utf8"))
+
+    def _load_offsets(self):
+        """Find the offset of every action in the log, dropping a last line left incomplete by a crash."""
+
+        try:
+            file = open(self._actions_path, "r+b")
+        except FileNotFoundError:
+            return
+
+        with file:
+            offset = 0
+            for line in file:
+                if not line.endswith(b"\n"):
+                    file.truncate(offset)
+                    break
+                self._offsets.append(offset)
+                offset += len(line)
+
+        self._log_size = offset
+
+    def _set_cursor(self, cursor):
+        """Move the cursor and save it.
+
+        :param cursor: The number of applied actions.
+        :type cursor: int
+        """
+
+        self._cursor = cursor
+
+        (file_descriptor, temp_path) = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(file_descriptor, "w", encoding="utf8") as file:
+            file.write(str(cursor))
+        os.replace(temp_path, self._cursor_path)
+
+if __name__ == "__main__":
+    # Undo or redo the last action from the command line.
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("undo", "redo") or sys.argv[2:] not in ([], ["--skip-missing"]):
+        print("Usage: python3 edit_history.py undo|redo [--skip-missing]")
+        exit(2)
+
+    edit_history = EditHistory()
+    skip_missing = "--skip-missing" in sys.argv
+    if sys.argv[1] == "undo":
+        (description, missing_file_paths) = (edit_history.get_undo_description(), edit_history.get_undo_missing_files())
+        undo_failures = edit_history.undo(skip_missing=skip_missing)
+    else:
+        (description, missing_file_paths) = (edit_history.get_redo_description(), edit_history.get_redo_missing_files())
+        undo_failures = edit_history.redo(skip_missing=skip_missing)
+
+    print("{}: {}".format(sys.argv[1], description or "nothing to " + sys.argv[1]))
+    if skip_missing:
+        for missing_file_path in missing_file_paths:
+            print("  {}: skipped, no longer exists".format(missing_file_path))
+    for (failed_file_path, error) in undo_failures:
+        print("  {}: {}".format(failed_file_path, error))
+    if len(missing_file_paths) > 0 and not skip_missing:
+        print("Run again with --skip-missing to skip the files that no longer exist.")
@@ -1,17 +1,64 @@
 import glob
 import os
 
+# The music file formats that can be detected, named after their usual extensions.
+FORMAT_MP3 = "mp3"
+FORMAT_FLAC = "flac"
+FORMAT_OGG_VORBIS = "ogg"
+FORMAT_MP4 = "m4a"
 
-def get_mp3_files(path):
-    """Finds all music files in a directory non-recursively.
+# The suffix of the temp files that saves are written to before being swapped in. See batch_utils.save_tracks().
+TEMP_FILE_SUFFIX = ".mp3_tagger.tmp"
+
+# The suffix of the backups of tags that are being written in place. See batch_utils.save_tracks().
+TAG_BACKUP_SUFFIX = ".mp3_tagger.bak"
+
+# Enough of the start of a file to recognise every format.
+_MAGIC_SIZE = 36
+
+# The major brands of MP4 files that only ever hold audio. Files of other brands, such as QuickTime movies and 3GP
+# videos, are not music files even though they share the container.
+_MP4_AUDIO_BRANDS = frozenset([b"M4A ", b"M4B ", b"M4P ", b"F4A ", b"F4B "])
+
+# The major brands shared by MP4 audio and video files. Files of these brands are only music files if they have an
+# audio extension or no video track.
+_MP4_GENERIC_BRANDS = frozenset([b"mp41", b"mp42", b"isom", b"iso2", b"dash"])
+
+# The extensions of MP4 audio files.
+_MP4_AUDIO_EXTENSIONS = frozenset([".m4a", ".m4b", ".m4p"])
+
+# The boxes on the path from the top of an MP4 file to the handler of each of its tracks.
+_MP4_HANDLER_PATH = (b"moov", b"trak", b"mdia", b"hdlr")
+
+# The largest movie box read when looking for a video track. Real ones are far smaller; anything bigger is not music.
+_MAX_MP4_MOVIE_BOX_SIZE = 64 * 1024 * 1024
+
+# The usual extensions of the supported formats, used to recognise music files that cannot be read.
+_MUSIC_EXTENSIONS = frozenset([".mp3", ".flac", ".ogg", ".m4a", ".m4b", ".m4p"])
+
+
+def get_mp3_files(path, recursive=False):
+    """Finds all music files in a directory.
 
     :param path: The path in which to look for music files.
     :type path: str
 
+    :param recursive: True to also look in all subdirectories, false to only look in the directory itself. Defaults to
+        False.
+    :type recursive: bool
+
     :returns: A list of all music files that were found.
     :rtype: list
     """
 
+    if recursive:
+        mp3_files = []
+        for (directory, _, filenames) in os.walk(path):
+            for filename in filenames:
+                if filename.endswith(".mp3"):
+                    mp3_files.append(os.path.join(directory, filename))
+        return mp3_files
+
     # TODO: Account for bug in glob module in Python versions < 3.4.
     # - Before Python 3.4, the glob module didn't automatically escape metacharacters. Escape ?, *, [, and ]. Simply
     #   replace with [?], [*], [[], []]. When using regex to make a substitution/replacement, make sure not to replace
@@ -21,6 +68,214 @@ def get_mp3_files(path):
     return glob.glob(glob.escape(path) + "/*.mp3")
 
 
+def get_music_files(path, recursive=False):
+    """Finds all music files of a supported format in a directory, whatever their extensions.
+
+    :param path: The path in which to look for music files.
+    :type path: str
+
+    :param recursive: True to also look in all subdirectories, false to only look in the directory itself. Defaults to
+        False.
+    :type recursive: bool
+
+    :returns: A sorted list of all music files that were found. Files that cannot be read are included if their
+        extension is that of a supported format, so the error is reported when they are opened.
+    :rtype: list
+    """
+
+    if recursive:
+        file_paths = [os.path.join(directory, filename)
+                      for (directory, _, filenames) in os.walk(path) for filename in filenames]
+    else:
+        with os.scandir(path) as entries:
+            file_paths = [entry.path for entry in entries if entry.is_file()]
+
+    return sorted(file_path for file_path in file_paths
+                  if not file_path.endswith((TEMP_FILE_SUFFIX, TAG_BACKUP_SUFFIX)) and _is_music_file(file_path))
+
+
+def _is_music_file(path):
+    """Whether or not a file is in a supported format, going by its extension if it cannot be read.
+
+    :param path: The path to the file.
+    :type path: str
+
+    :returns: True if the file is a music file, false otherwise.
+    :rtype: bool
+    """
+
+    try:
+        return get_file_format(path) is not None
+    except OSError:
+        return os.path.splitext(path)[1].lower() in _MUSIC_EXTENSIONS
+
+
+def get_file_format(path):
+    """Detect the format of a music file from the magic bytes at its start rather than from its extension.
+
+    :param path: The path to the file.
+    :type path: str
+
+    :returns: One of the FORMAT_* values, or None if the file is not in a supported format.
+    :rtype: str or None
+
+    :raise OSError: Error reading file.
+    """
+
+    with open(path, "rb") as file:
+        data = file.read(_MAGIC_SIZE)
+
+        if data.startswith(b"ID3") and len(data) >= 10:
+            # Some FLAC files have an ID3 tag in front of them. Look past it before deciding this is an MP3.
+            tag_size = 10 + ((data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 |
+                             (data[9] & 0x7f))
+            if data[5] & 0x10:
+                # Footer present.
+                tag_size += 10
+            file.seek(tag_size)
+            return FORMAT_FLAC if file.read(4) == b"fLaC" else FORMAT_MP3
+
+    if data.startswith(b"fLaC"):
+        return FORMAT_FLAC
+    # The first Ogg page holds a single packet, the Vorbis identification header. Other codecs in Ogg are unsupported.
+    if data.startswith(b"OggS") and data[28:35] == b"\x01vorbis":
+        return FORMAT_OGG_VORBIS
+    if data[4:8] == b"ftyp" and data[8:12] in _MP4_AUDIO_BRANDS:
+        return FORMAT_MP4
+    if data[4:8] == b"ftyp" and data[8:12] in _MP4_GENERIC_BRANDS and (
+            os.path.splitext(path)[1].lower() in _MP4_AUDIO_EXTENSIONS or not _has_mp4_video_track(path)):
+        return FORMAT_MP4
+    # An MPEG audio layer III frame header, for MP3 files without an ID3V2 tag.
+    if _is_mp3_frame_header(data):
+        return FORMAT_MP3
+    # Some MP3 files start with junk before the first frame, so fall back to the extension as a last resort.
+    if path.lower().endswith(".mp3"):
+        return FORMAT_MP3
+
+    return None
+
+
+def _has_mp4_video_track(path):
+    """Whether or not an MP4 file has a video track, found from the handler types of its tracks.
+
+    Only the top level box headers are read on the way to the movie box, so the media data is never read even if it
+    comes first.
+
+    :param path: The path to the MP4 file.
+    :type path: str
+
+    :returns: True if the file has a video track or no readable movie box, false otherwise.
+    :rtype: bool
+
+    :raise OSError: Error reading file.
+    """
+
+    with open(path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        position = 0
+        while position + 8 <= file_size:
+            file.seek(position)
+            (size, box_type) = _read_mp4_box_header(file.read(16), file_size - position)
+            if size is None:
+                return True
+            if box_type == b"moov":
+                if size > _MAX_MP4_MOVIE_BOX_SIZE:
+                    return True
+                file.seek(position)
+                return b"vide" in _find_mp4_handler_types(file.read(size), _MP4_HANDLER_PATH)
+            position += size
+
+    return True
+
+
+def _find_mp4_handler_types(data, path):
+    """Find the handler types of the handler boxes at the end of a path of nested boxes.
+
+    :param data: The data of a sequence of boxes.
+    :type data: bytes
+
+    :param path: The box types on the path to the handler boxes, starting with one of the boxes in data.
+    :type path: tuple
+
+    :returns: A list of the 4 byte handler types found.
+    :rtype: list
+    """
+
+    handler_types = []
+    position = 0
+    while position + 8 <= len(data):
+        (size, box_type) = _read_mp4_box_header(data[position:position + 16], len(data) - position)
+        if size is None:
+            break
+
+        if box_type == path[0]:
+            header_size = 16 if data[position:position + 4] == b"\x00\x00\x00\x01" else 8
+            body = data[position + header_size:position + size]
+            if len(path) == 1:
+                # A full box header of version and flags, then a predefined field, then the handler type.
+                handler_types.append(body[8:12])
+            else:
+                handler_types.extend(_find_mp4_handler_types(body, path[1:]))
+        position += size
+
+    return handler_types
+
+
+def _read_mp4_box_header(header, available_size):
+    """Read the size and type of an MP4 box.
+
+    :param header: The first 16 bytes of the box, or as many as there are.
+    :type header: bytes
+
+    :param available_size: The number of bytes from the start of the box to the end of its parent or the file.
+    :type available_size: int
+
+    :returns: A tuple of the size of the box and its type, or (None, None) if the box is malformed.
+    :rtype: tuple
+    """
+
+    if len(header) < 8:
+        return (None, None)
+
+    size = int.from_bytes(header[0:4], "big")
+    header_size = 8
+    if size == 1:
+        if len(header) < 16:
+            return (None, None)
+        size = int.from_bytes(header[8:16], "big")
+        header_size = 16
+    elif size == 0:
+        # The box runs to the end of its parent or the file.
+        size = available_size
+
+    if size < header_size or size > available_size:
+        return (None, None)
+
+    return (size, header[4:8])
+
+
+def _is_mp3_frame_header(data):
+    """Whether or not data starts with a valid MPEG audio layer III frame header.
+
+    :param data: The data to check.
+    :type data: bytes
+
+    :returns: True if the frame sync and all header fields are valid, false otherwise.
+    :rtype: bool
+    """
+
+    if len(data) < 4 or data[0] != 0xff or data[1] & 0xe0 != 0xe0:
+        return False
+
+    version = (data[1] >> 3) & 0x03
+    layer = (data[1] >> 1) & 0x03
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 0x03
+
+    # Version 0b01 is reserved, layer 0b01 is layer III, and the all ones bitrate and sample rate indexes are invalid.
+    return version != 0x01 and layer == 0x01 and bitrate_index != 0x0f and sample_rate_index != 0x03
+
+
 def ensure_valid_filename(filename):
     """Ensures a valid filename by removing any invalid characters and capping the length to 255.
 
@@ -61,3 +316,4 @@ if __name__ == "__main__":
 
     # Print a list of music files in my music directory.
     print(get_mp3_files("/Users/stephen/Music"))
+    print(get_music_files("/Users/stephen/Music"))
@@ -0,0 +1,155 @@
+import re
+from functools import lru_cache
+from types import MappingProxyType
+
+# The ID3V1 genre list including the Winamp extensions, indexed by genre ID. ID3V2 tags still refer to these IDs.
+GENRES = (
+    "Blues", "Classic Rock", "Country", "Dance", "Disco", "Funk", "Grunge", "Hip-Hop", "Jazz", "Metal", "New Age",
+    "Oldies", "Other", "Pop", "R&B", "Rap", "Reggae", "Rock", "Techno", "Industrial", "Alternative", "Ska",
+    "Death Metal", "Pranks", "Soundtrack", "Euro-Techno", "Ambient", "Trip-Hop", "Vocal", "Jazz+Funk", "Fusion",
+    "Trance", "Classical", "Instrumental", "Acid", "House", "Game", "Sound Clip", "Gospel", "Noise", "Alt. Rock",
+    "Bass", "Soul", "Punk", "Space", "Meditative", "Instrumental Pop", "Instrumental Rock", "Ethnic", "Gothic",
+    "Darkwave", "Techno-Industrial", "Electronic", "Pop-Folk", "Eurodance", "Dream", "Southern Rock", "Comedy", "Cult",
+    "Gangsta Rap", "Top 40", "Christian Rap", "Pop/Funk", "Jungle", "Native American", "Cabaret", "New Wave",
+    "Psychedelic", "Rave", "Showtunes", "Trailer", "Lo-Fi", "Tribal", "Acid Punk", "Acid Jazz", "Polka", "Retro",
+    "Musical", "Rock & Roll", "Hard Rock", "Folk", "Folk-Rock", "National Folk", "Swing", "Fast-Fusion", "Bebop",
+    "Latin", "Revival", "Celtic", "Bluegrass", "Avantgarde", "Gothic Rock", "Progressive Rock", "Psychedelic Rock",
+    "Symphonic Rock", "Slow Rock", "Big Band", "Chorus", "Easy Listening", "Acoustic", "Humour", "Speech", "Chanson",
+    "Opera", "Chamber Music", "Sonata", "Symphony", "Booty Bass", "Primus", "Porn Groove", "Satire", "Slow Jam",
+    "Club", "Tango", "Samba", "Folklore", "Ballad", "Power Ballad", "Rhythmic Soul", "Freestyle", "Duet", "Punk Rock",
+    "Drum Solo", "A Cappella", "Euro-House", "Dance Hall", "Goa", "Drum & Bass", "Club-House", "Hardcore", "Terror",
+    "Indie", "BritPop", "Afro-Punk", "Polsk Punk", "Beat", "Christian Gangsta Rap", "Heavy Metal", "Black Metal",
+    "Crossover", "Contemporary Christian", "Christian Rock", "Merengue", "Salsa", "Thrash Metal", "Anime", "JPop",
+    "Synthpop", "Abstract", "Art Rock", "Baroque", "Bhangra", "Big Beat", "Breakbeat", "Chillout", "Downtempo", "Dub",
+    "EBM", "Eclectic", "Electro", "Electroclash", "Emo", "Experimental", "Garage", "Global", "IDM", "Illbient",
+    "Industro-Goth", "Jam Band", "Krautrock", "Leftfield", "Lounge", "Math Rock", "New Romantic", "Nu-Breakz",
+    "Post-Punk", "Post-Rock", "Psytrance", "Shoegaze", "Space Rock", "Trop Rock", "World Music", "Neoclassical",
+    "Audiobook", "Audio Theatre", "Neue Deutsche Welle", "Podcast", "Indie Rock", "G-Funk", "Dubstep", "Garage Rock",
+    "Psybient",
+)
+
+# ID3V2.3 also defines two special genre references that are not numbers.
+SPECIAL_GENRES = MappingProxyType({"RX": "Remix", "CR": "Cover"})
+
+# The text put between genres when a tag refers to more than one.
+GENRE_SEPARATOR = " / "
+
+# A map of case folded genre names to their canonical spelling.
+_CANONICAL_GENRES = MappingProxyType({genre.casefold(): genre for genre in GENRES})
+
+_REFERENCE_PATTERN = re.compile(r"^\(([0-9]+|RX|CR)\)")
+
+
+def get_genre_name(genre_id):
+    """Get the name of a genre from its ID.
+
+    :param genre_id: The genre ID.
+    :type genre_id: int
+
+    :returns: The genre name or None if the ID is unknown.
+    :rtype: str or None
+    """
+
+    if 0 <= genre_id < len(GENRES):
+        return GENRES[genre_id]
+
+    return None
+
+
+@lru_cache(maxsize=1024)
+def normalise_genre(genre):
+    """Convert raw genre text such as "(17)", "17", "(17)Rock", or "rock" into a genre name such as "Rock".
+
+    Text that does not refer to a known genre, including numbers of 256 and above such as "1999", is returned as is,
+    just stripped of surrounding whitespace. Results are cached since a library only ever holds a few hundred distinct
+    genre values.
+
+    :param genre: The raw genre text, as returned by MP3Track.get_genre().
+    :type genre: str or None
+
+    :returns: The normalised genre or None if there is no genre.
+    :rtype: str or None
+    """
+
+    if genre is None:
+        return None
+
+    text = genre.strip()
+    names = []
+
+    # ID3V2.3 genres may start with any number of references, e.g. "(17)(18)", optionally followed by a refinement.
+    match = _REFERENCE_PATTERN.match(text)
+    while match is not None:
+        names.append(_get_reference_name(match.group(1)))
+        text = text[match.end():]
+        match = _REFERENCE_PATTERN.match(text)
+
+    # A refinement starting with "(" is escaped as "((".
+    if text.startswith("(("):
+        text = text[1:]
+
+    text = text.strip()
+    if len(text) > 0:
+        # Like mutagenx, only numbers that fit an ID3V1 genre byte are genre IDs. Larger ones such as "1999" are text.
+        if text.isdigit() and int(text) < 256:
+            names.append(_get_reference_name(text))
+        else:
+            names.append(_CANONICAL_GENRES.get(text.casefold(), text))
+
+    # Drop repeats such as "(17)Rock" while keeping the original order.
+    unique_names = []
+    for name in names:
+        if name not in unique_names:
+            unique_names.append(name)
+
+    return GENRE_SEPARATOR.join(unique_names)
+
+
+def normalise_genres(tracks):
+    """Normalise the genre of each track and save only the tracks whose genre actually changed, in one batch.
+
+    :param tracks: The tracks to normalise.
+    :type tracks: iterable
+
+    :returns: A tuple of the list of changed tracks and a list of (track, exception) tuples for tracks that failed to
+        save.
+    :rtype: tuple
+    """
+
+    # Imported here because batch_utils depends on the readers, and id3_reader needs this module for the genre table.
+    import batch_utils
+
+    changed_tracks = []
+    for track in tracks:
+        genre = track.get_genre()
+        normalised_genre = normalise_genre(genre)
+        if genre is not None and normalised_genre != genre:
+            track.set_genre(normalised_genre)
+            changed_tracks.append(track)
+
+    return (changed_tracks, batch_utils.save_tracks(changed_tracks))
+
+
+def _get_reference_name(reference):
+    """Get the genre name for a genre reference.
+
+    :param reference: A genre ID as text or one of the SPECIAL_GENRES keys.
+    :type reference: str
+
+    :returns: The genre name. Unknown references are returned as "(<reference>)" so no information is lost.
+    :rtype: str
+    """
+
+    if reference in SPECIAL_GENRES:
+        return SPECIAL_GENRES[reference]
+
+    name = get_genre_name(int(reference))
+    if name is None:
+        return "(" + reference + ")"
+
+    return name
+
+if __name__ == "__main__":
+    for raw_genre in ["(17)", "17", "(17)Rock", "(17)(18)", "((Drum) and Bass", "(RX)", "rock", "(200)", "1999",
+                      "Shoegaze "]:
+        print(repr(raw_genre), "->", repr(normalise_genre(raw_genre)))
@@ -0,0 +1,800 @@
+import re
+import struct
+import zlib
+import genre_utils
+import mmap_io
+
+# TODO:
+# - Stripping of grouping identity bytes is deliberately not done because mutagenx does not do it either and the
+#   output of this reader has to match MP3Track. Revisit if mutagenx ever fixes it.
+
+# The frames MP3Track exposes. Only these are decoded, every other frame is skipped without being parsed.
+_TEXT_FRAMES = frozenset(["TIT2", "TPE1", "TPE2", "TALB", "TCON", "TDRC", "TRCK", "TCMP"])
+_WANTED_FRAMES = _TEXT_FRAMES | frozenset(["COMM", "TXXX", "APIC", "TYER", "TDAT", "TIME"])
+
+# The length of the fixed size image format of an ID3V2.2 PIC frame, which ID3V2.3 replaced with a mime type.
+_V22_IMAGE_FORMAT_SIZE = 3
+
+# ID3V2.2 frame identifiers of the wanted frames mapped to their ID3V2.3/2.4 identifiers.
+_V22_FRAMES = {
+    "TT2": "TIT2", "TP1": "TPE1", "TP2": "TPE2", "TAL": "TALB", "TCO": "TCON", "TRK": "TRCK", "TCP": "TCMP",
+    "TYE": "TYER", "TDA": "TDAT", "TIM": "TIME", "COM": "COMM", "TXX": "TXXX", "PIC": "PIC",
+}
+
+# All ID3V2.3/2.4 frame identifiers. Used to work out whether frame sizes in an ID3V2.4 tag are syncsafe, since old
+# versions of iTunes wrote plain integers instead.
+_KNOWN_FRAMES = frozenset("""
+    AENC APIC ASPI COMM COMR ENCR EQU2 EQUA ETCO GEOB GRID GRP1 IPLS LINK MCDI MLLT MVIN MVNM OWNE PCNT PCST POPM POSS
+    PRIV RBUF RVA2 RVAD RVRB SEEK SIGN SYLT SYTC TALB TBPM TCAT TCMP TCOM TCON TCOP TDAT TDEN TDES TDLY TDOR TDRC TDRL
+    TDTG TENC TEXT TFLT TGID TIME TIPL TIT1 TIT2 TIT3 TKEY TKWD TLAN TLEN TMCL TMED TMOO TOAL TOFN TOLY TOPE TORY TOWN
+    TPE1 TPE2 TPE3 TPE4 TPOS TPRO TPUB TRCK TRDA TRSN TRSO TSIZ TSO2 TSOA TSOC TSOP TSOT TSRC TSSE TSST TXXX TYER UFID
+    USER USLT WCOM WCOP WFED WOAF WOAR WOAS WORS WPAY WPUB WXXX
+""".split())
+
+# Text encodings by encoding byte, each with its string terminator.
+_ENCODINGS = (("latin1", b"\x00"), ("utf16", b"\x00\x00"), ("utf_16_be", b"\x00\x00"), ("utf8", b"\x00"))
+
+_HEADER_SIZE = 10
+_ID3V1_SIZE = 128
+
+# Header flags.
+_FLAG_UNSYNCH = 0x80
+_FLAG_EXTENDED = 0x40
+
+# Frame flags.
+_FLAG23_COMPRESS = 0x0080
+_FLAG23_ENCRYPT = 0x0040
+_FLAG24_COMPRESS = 0x0008
+_FLAG24_ENCRYPT = 0x0004
+_FLAG24_UNSYNCH = 0x0002
+_FLAG24_DATALEN = 0x0001
+
+# How much of an APIC or PIC frame to decode when looking for its description.
+_PICTURE_HEAD_SIZE = 1024
+
+_EMPTY_FRAME_HEADER = b"\x00" * 10
+_INVALID_UNSYNCH_PATTERN = re.compile(b"\xff[\xe0-\xff]")
+_TIMESTAMP_SPLIT_PATTERN = re.compile(r"[-T:/.]|\s+")
+_GENRE_PATTERN = re.compile(r"((?:\((?P<id>[0-9]+|RX|CR)\))*)(?P<str>.+)?")
+
+
+class _JunkFrameError(Exception):
+    """Raised when a frame's data cannot be decoded. Such frames are dropped."""
+
+
+class TagSnapshot:
+    """A read-only view of the metadata of an MP3 file, read without mutagenx.
+
+    The getters return exactly what the MP3Track getters of the same names return for the same file, but reading a
+    snapshot is several times faster because only the frames MP3Track exposes are decoded. This makes snapshots suited
+    to listing and indexing many files. Use an MP3Track to edit a file.
+    """
+
+    def __init__(self, path, frames):
+        """Create a new snapshot. Use read_tag() rather than calling this directly.
+
+        :param path: The path of the file.
+        :type path: str
+
+        :param frames: A map of frame hash keys (e.g. "TIT2" or "COMM:desc:lang") to lists of text values. Pictures
+            have no text values.
+        :type frames: dict
+        """
+
+        self._path = path
+        self._frames = frames
+
+    def get_title(self):
+        """See MP3Track.get_title()."""
+
+        return self._get_frames_text("TIT2")
+
+    def get_artist(self):
+        """See MP3Track.get_artist()."""
+
+        return self._get_frames_text("TPE1")
+
+    def get_album_artist(self):
+        """See MP3Track.get_album_artist()."""
+
+        return self._get_frames_text("TPE2")
+
+    def get_album(self):
+        """See MP3Track.get_album()."""
+
+        return self._get_frames_text("TALB")
+
+    def get_genre(self):
+        """See MP3Track.get_genre()."""
+
+        return self._get_frames_text("TCON")
+
+    def get_year(self):
+        """See MP3Track.get_year()."""
+
+        return self._get_frames_text("TDRC")
+
+    def get_track(self):
+        """See MP3Track.get_track()."""
+
+        return self._get_frames_text("TRCK")
+
+    def get_part_of_compilation(self):
+        """See MP3Track.get_part_of_compilation()."""
+
+        compilation_flag = self._get_frames_text("TCMP")
+        return not ((compilation_flag is None) or (compilation_flag == '0'))
+
+    def get_comments(self):
+        """See MP3Track.get_comments()."""
+
+        return self._get_frames_text("COMM")
+
+    def get_audio_checksum(self):
+        """See MP3Track.get_audio_checksum()."""
+
+        return self._get_frames_text("TXXX:AUDIO_CHECKSUM")
+
+    def has_picture(self):
+        """See MP3Track.has_picture()."""
+
+        return len(self._get_frames("APIC")) > 0
+
+    def get_file_path(self):
+        """See MP3Track.get_file_path()."""
+
+        return self._path
+
+    def _get_frames_text(self, identifier):
+        """Get the text from all frames with a given frame identifier as one string, the same way MP3Track does.
+
+        :param identifier: The frame identifier or hash key.
+        :type identifier: str
+
+        :returns: The text of all frames joined by spaces or None if no such frames exist.
+        :rtype: str or None
+        """
+
+        frames = self._get_frames(identifier)
+        if len(frames) == 0:
+            return None
+
+        all_text = ""
+        for texts in frames:
+            for text in texts:
+                all_text += text + " "
+
+        return all_text.rstrip()
+
+    def _get_frames(self, identifier):
+        """Get the text values of all frames with a given identifier, matching hash keys by prefix like mutagenx.
+
+        :param identifier: The frame identifier or hash key.
+        :type identifier: str
+
+        :returns: A list of lists of text values.
+        :rtype: list
+        """
+
+        if identifier in self._frames:
+            return [self._frames[identifier]]
+
+        prefix = identifier + ":"
+        return [texts for (key, texts) in self._frames.items() if key.startswith(prefix)]
+
+
+def read_tag(path):
+    """Read the metadata of an MP3 file into a snapshot without going through mutagenx.
+
+    The file is never written to, and only its tag region is read. Large tags are memory mapped where that is safe.
+    A file without a tag gives an empty snapshot.
+
+    :param path: The path to the MP3 file.
+    :type path: str
+
+    :returns: A snapshot of the file's metadata.
+    :rtype: TagSnapshot
+
+    :raise IOError: Error reading file.
+    """
+
+    with open(path, "rb") as file:
+        header = file.read(_HEADER_SIZE)
+        if len(header) < _HEADER_SIZE:
+            return TagSnapshot(path, {})
+
+        (tag_id, major_version, _, flags, size) = struct.unpack(">3sBBB4s", header)
+        if tag_id != b"ID3" or major_version not in (2, 3, 4):
+            return TagSnapshot(path, _read_id3v1(file))
+
+        size = _decode_syncsafe(size)
+        with mmap_io.map_file_region(file, _HEADER_SIZE + size) as region:
+            if len(region) != _HEADER_SIZE + size:
+                return TagSnapshot(path, {})
+
+            return TagSnapshot(path, parse_tag_body(region[_HEADER_SIZE:], major_version, flags))
+
+
+def parse_tag_body(data, major_version, flags):
+    """Parse the frames of an ID3V2 tag following its header.
+
+    :param data: The tag data after the 10 byte header.
+    :type data: memoryview
+
+    :param major_version: The ID3V2 major version, 2, 3, or 4.
+    :type major_version: int
+
+    :param flags: The tag header flags.
+    :type flags: int
+
+    :returns: A map of frame hash keys to lists of text values.
+    :rtype: dict
+    """
+
+    if flags & _FLAG_EXTENDED and len(data) >= 4:
+        extended_size = bytes(data[0:4])
+        # Some taggers set the extended header flag without writing one. A frame identifier means there isn't one.
+        if extended_size.decode("latin1") in _KNOWN_FRAMES:
+            pass
+        elif major_version >= 4:
+            data = data[_decode_syncsafe(extended_size):]
+        else:
+            data = data[4 + struct.unpack(">L", extended_size)[0]:]
+
+    unsynch = bool(flags & _FLAG_UNSYNCH)
+    if unsynch and major_version < 4:
+        try:
+            data = memoryview(_decode_unsynch(data))
+        except ValueError:
+            pass
+
+    frames = {}
+    for (frame_id, frame_flags, frame_data) in _iterate_frames(data, major_version):
+        try:
+            frame_data = _unpack_frame_data(frame_data, frame_flags, major_version, unsynch)
+            _add_frame(frames, frame_id, frame_data)
+        except _JunkFrameError:
+            pass
+
+    _update_to_v24(frames)
+
+    return frames
+
+
+def _iterate_frames(data, major_version):
+    """Iterate over the wanted frames of a tag body, skipping all others without decoding them.
+
+    :param data: The tag body without the extended header.
+    :type data: memoryview
+
+    :param major_version: The ID3V2 major version.
+    :type major_version: int
+
+    :returns: A generator of (frame identifier, frame flags, frame data) tuples. ID3V2.2 identifiers are translated.
+    :rtype: generator
+    """
+
+    if major_version == 2:
+        while len(data) > 0:
+            if len(data) < 6:
+                return
+            name = bytes(data[0:3])
+            if name.strip(b"\x00") == b"":
+                return
+            size = struct.unpack(">L", b"\x00" + bytes(data[3:6]))[0]
+            frame_data = data[6:6 + size]
+            data = data[6 + size:]
+            frame_id = _V22_FRAMES.get(name.decode("latin1"))
+            if size > 0 and frame_id is not None:
+                yield (frame_id, 0, frame_data)
+        return
+
+    syncsafe = major_version == 4 and _uses_syncsafe_sizes(data)
+
+    while len(data) > 0:
+        if len(data) < 10:
+            return
+        (name, size, frame_flags) = struct.unpack(">4sLH", data[0:10])
+        if name.strip(b"\x00") == b"":
+            return
+        if syncsafe:
+            size = _decode_syncsafe(struct.pack(">L", size))
+        frame_data = data[10:10 + size]
+        data = data[10 + size:]
+        frame_id = name.decode("latin1")
+        if size > 0 and frame_id in _WANTED_FRAMES:
+            yield (frame_id, frame_flags, frame_data)
+
+
+def _uses_syncsafe_sizes(data):
+    """Work out whether the frame sizes of an ID3V2.4 tag are syncsafe, by walking the frames both ways and seeing
+    which finds more known frames. Old versions of iTunes wrote plain integers.
+
+    :param data: The tag body without the extended header.
+    :type data: memoryview
+
+    :returns: True if the sizes are syncsafe, false otherwise.
+    :rtype: bool
+    """
+
+    def walk(decode):
+        offset = 0
+        found = 0
+        while offset < len(data) - 10:
+            part = bytes(data[offset:offset + 10])
+            if part == _EMPTY_FRAME_HEADER:
+                return (found, -((len(data) - offset) % 10))
+            (name, size, _) = struct.unpack(">4sLH", part)
+            offset += 10 + decode(size)
+            if name.decode("latin1") in _KNOWN_FRAMES:
+                found += 1
+        return (found, offset - len(data))
+
+    (syncsafe_found, syncsafe_overrun) = walk(lambda size: _decode_syncsafe(struct.pack(">L", size)))
+    (plain_found, plain_overrun) = walk(lambda size: size)
+
+    if plain_found > syncsafe_found or (plain_found == syncsafe_found and syncsafe_overrun >= 1 and plain_overrun <= 1):
+        return False
+
+    return True
+
+
+def _unpack_frame_data(data, frame_flags, major_version, unsynch):
+    """Undo unsynchronisation and compression of a frame's data.
+
+    :param data: The frame data.
+    :type data: memoryview
+
+    :param frame_flags: The frame flags.
+    :type frame_flags: int
+
+    :param major_version: The ID3V2 major version.
+    :type major_version: int
+
+    :param unsynch: Whether or not the tag header's unsynchronisation flag is set.
+    :type unsynch: bool
+
+    :returns: The frame data ready to be decoded. Frames without flags are passed through without being copied.
+    :rtype: bytes or memoryview
+
+    :raise _JunkFrameError: Encrypted frame.
+    """
+
+    if frame_flags == 0 and not unsynch:
+        return data
+
+    data = bytes(data)
+
+    if major_version == 4:
+        data_length = b""
+        if frame_flags & (_FLAG24_COMPRESS | _FLAG24_DATALEN):
+            (data_length, data) = (data[:4], data[4:])
+        if frame_flags & _FLAG24_UNSYNCH or unsynch:
+            try:
+                data = _decode_unsynch(data)
+            except ValueError:
+                pass
+        if frame_flags & _FLAG24_ENCRYPT:
+            raise _JunkFrameError()
+        if frame_flags & _FLAG24_COMPRESS:
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:
+                # Some taggers leave out the data length, so the data length bytes are really compressed data.
+                try:
+                    data = zlib.decompress(data_length + data)
+                except zlib.error:
+                    data = data_length + data
+    elif major_version == 3:
+        if frame_flags & _FLAG23_COMPRESS:
+            data = data[4:]
+        if frame_flags & _FLAG23_ENCRYPT:
+            raise _JunkFrameError()
+        if frame_flags & _FLAG23_COMPRESS:
+            try:
+                data = zlib.decompress(data)
+            except zlib.error:
+                pass
+
+    return data
+
+
+def _add_frame(frames, frame_id, data):
+    """Decode a wanted frame and add it to a map of frames, replacing any frame with the same hash key.
+
+    :param frames: A map of frame hash keys to lists of text values.
+    :type frames: dict
+
+    :param frame_id: The ID3V2.3/2.4 frame identifier.
+    :type frame_id: str
+
+    :param data: The frame data.
+    :type data: bytes or memoryview
+
+    :raise _JunkFrameError: Frame data cannot be decoded.
+    """
+
+    if frame_id in ("APIC", "PIC"):
+        # Only the presence of a picture matters, but the frame must still be well formed to count.
+        frames["APIC:" + _read_picture_description(data, frame_id == "PIC")] = []
+        return
+
+    (encoding, data) = _read_encoding(bytes(data))
+
+    if frame_id == "COMM":
+        if len(data) == 0:
+            raise _JunkFrameError()
+        (language, data) = (data[:3].decode("latin1"), data[3:])
+        (description, data) = _read_text(_required(data), encoding)
+        frames["COMM:{}:{}".format(description, language)] = _read_texts(_required(data), encoding)
+        return
+
+    if frame_id == "TXXX":
+        (description, data) = _read_text(_required(data), encoding)
+        frames["TXXX:" + description] = _read_texts(_required(data), encoding)
+        return
+
+    frames[frame_id] = _read_texts(_required(data), encoding)
+
+
+def _read_encoding(data):
+    """Read the encoding byte at the start of a frame.
+
+    :param data: The frame data.
+    :type data: bytes
+
+    :returns: A tuple of the encoding and the remaining data.
+    :rtype: tuple
+
+    :raise _JunkFrameError: Unknown encoding.
+    """
+
+    encoding = _required(data)[0]
+
+    # A byte that is too large to be an encoding is really the first character of latin1 text.
+    if encoding >= 16:
+        return (0, data)
+    if encoding >= len(_ENCODINGS):
+        raise _JunkFrameError()
+
+    return (encoding, data[1:])
+
+
+def _read_picture_description(data, is_v22):
+    """Read the description of an APIC or PIC frame, which is part of its hash key.
+
+    The start of the frame is decoded first, so the picture data is only copied if the description runs past it.
+
+    :param data: The frame data.
+    :type data: bytes or memoryview
+
+    :param is_v22: True if the frame is an ID3V2.2 PIC frame, false if it is an APIC frame.
+    :type is_v22: bool
+
+    :returns: The picture description.
+    :rtype: str
+
+    :raise _JunkFrameError: Frame data cannot be decoded.
+    """
+
+    try:
+        return _decode_picture_description(bytes(data[:_PICTURE_HEAD_SIZE]), is_v22)
+    except _JunkFrameError:
+        if len(data) <= _PICTURE_HEAD_SIZE:
+            raise
+
+    return _decode_picture_description(bytes(data), is_v22)
+
+
+def _decode_picture_description(data, is_v22):
+    """Decode the description of an APIC or PIC frame.
+
+    :param data: The frame data, or enough of its start to include the description and a byte of picture data.
+    :type data: bytes
+
+    :param is_v22: True if the frame is an ID3V2.2 PIC frame, false if it is an APIC frame.
+    :type is_v22: bool
+
+    :returns: The picture description.
+    :rtype: str
+
+    :raise _JunkFrameError: Frame data cannot be decoded.
+    """
+
+    (encoding, data) = _read_encoding(data)
+
+    # Skip the mime type or image format and the picture type byte.
+    if is_v22:
+        data = _required(data)[_V22_IMAGE_FORMAT_SIZE:]
+    else:
+        (_, _, data) = _required(data).partition(b"\x00")
+    data = _required(_required(data)[1:])
+    (description, data) = _read_text(data, encoding)
+    _required(data)
+
+    return description
+
+
+def _read_texts(data, encoding):
+    """Read all terminator separated strings from the rest of a frame.
+
+    :param data: The data to read.
+    :type data: bytes
+
+    :param encoding: The encoding of the strings.
+    :type encoding: int
+
+    :returns: A list of strings.
+    :rtype: list
+
+    :raise _JunkFrameError: Frame data cannot be decoded.
+    """
+
+    texts = []
+    while data:
+        (text, data) = _read_text(data, encoding)
+        texts.append(text)
+
+    return texts
+
+
+def _read_text(data, encoding):
+    """Read a single terminated string.
+
+    :param data: The data to read.
+    :type data: bytes
+
+    :param encoding: The encoding of the string.
+    :type encoding: int
+
+    :returns: A tuple of the string and the data after its terminator.
+    :rtype: tuple
+
+    :raise _JunkFrameError: Frame data cannot be decoded.
+    """
+
+    (codec, terminator) = _ENCODINGS[encoding]
+    rest = b""
+
+    if len(terminator) == 1:
+        if terminator in data:
+            (data, rest) = data.split(terminator, 1)
+    else:
+        # Two byte terminators only count if they are aligned to a character.
+        offset = data.find(terminator)
+        while offset != -1 and offset & 1:
+            offset = data.find(terminator, offset + 1)
+        if offset != -1:
+            (data, rest) = (data[:offset], data[offset + 2:])
+
+    if len(data) < len(terminator):
+        return ("", rest)
+
+    try:
+        return (data.decode(codec), rest)
+    except UnicodeDecodeError:
+        raise _JunkFrameError()
+
+
+def _required(data):
+    """Ensure there is data left to read. A frame that ends early is dropped.
+
+    :param data: The data left.
+    :type data: bytes
+
+    :returns: The same data.
+    :rtype: bytes
+
+    :raise _JunkFrameError: No data left.
+    """
+
+    if len(data) == 0:
+        raise _JunkFrameError()
+
+    return data
+
+
+def _update_to_v24(frames):
+    """Convert frames the same way mutagenx does when loading, so the output matches MP3Track.
+
+    :param frames: A map of frame hash keys to lists of text values.
+    :type frames: dict
+    """
+
+    if "TCON" in frames:
+        frames["TCON"] = _parse_genres(frames["TCON"])
+
+    if "\x00".join(frames.get("TYER", [])).strip("\x00"):
+        date = "\x00".join(frames.pop("TYER"))
+        if "\x00".join(frames.get("TDAT", [])).strip("\x00"):
+            day_month = "\x00".join(frames.pop("TDAT"))
+            date = "{}-{}-{}".format(date, day_month[2:], day_month[:2])
+            if "\x00".join(frames.get("TIME", [])).strip("\x00"):
+                time = "\x00".join(frames.pop("TIME"))
+                date += "T{}:{}:00".format(time[:2], time[2:])
+        if "TDRC" not in frames:
+            frames["TDRC"] = [date]
+
+    for frame_id in ("TYER", "TDAT", "TIME"):
+        frames.pop(frame_id, None)
+
+    if "TDRC" in frames:
+        frames["TDRC"] = [_normalise_timestamp(text) for text in frames["TDRC"]]
+
+
+def _parse_genres(texts):
+    """Convert genre references such as "(17)" or "17" into names the same way mutagenx does.
+
+    :param texts: The TCON text values.
+    :type texts: list
+
+    :returns: A list of genres.
+    :rtype: list
+    """
+
+    genres = []
+    for value in texts:
+        # Only numbers that fit an ID3V1 genre byte are genre IDs, larger ones such as "1999" are kept as they are.
+        if value.isdigit() and int(value) < 256:
+            genres.append(genre_utils.get_genre_name(int(value)) or "Unknown")
+        elif value == "CR":
+            genres.append("Cover")
+        elif value == "RX":
+            genres.append("Remix")
+        elif value:
+            new_genres = []
+            (genre_ids, _, genre_name) = _GENRE_PATTERN.match(value).groups()
+            if genre_ids:
+                for genre_id in genre_ids[1:-1].split(")("):
+                    if genre_id.isdigit() and genre_utils.get_genre_name(int(genre_id)) is not None:
+                        new_genres.append(genre_utils.get_genre_name(int(genre_id)))
+                    elif genre_id in genre_utils.SPECIAL_GENRES:
+                        new_genres.append(genre_utils.SPECIAL_GENRES[genre_id])
+                    else:
+                        new_genres.append("Unknown")
+            if genre_name:
+                # A refinement starting with "(" is escaped as "((".
+                if genre_name.startswith("(("):
+                    genre_name = genre_name[1:]
+                if genre_name not in new_genres:
+                    new_genres.append(genre_name)
+            genres.extend(new_genres)
+
+    return genres
+
+
+def _normalise_timestamp(text):
+    """Normalise a timestamp the same way mutagenx's ID3TimeStamp does, e.g. "2001-02-03T04:05" becomes
+    "2001-02-03 04:05" and text that is not a timestamp becomes an empty string.
+
+    :param text: The timestamp text.
+    :type text: str
+
+    :returns: The normalised timestamp.
+    :rtype: str
+    """
+
+    parts = _TIMESTAMP_SPLIT_PATTERN.split(text + ":::::")[:6]
+    formats = ("%04d", "%02d", "%02d", "%02d", "%02d", "%02d")
+    separators = ("-", "-", " ", ":", ":", "x")
+
+    pieces = []
+    for (part, number_format, separator) in zip(parts, formats, separators):
+        try:
+            number = int(part)
+        except ValueError:
+            break
+        pieces.append(number_format % number + separator)
+
+    return "".join(pieces)[:-1]
+
+
+def _read_id3v1(file):
+    """Read an ID3V1 tag from the end of a file, which is only used when there is no ID3V2 tag.
+
+    :param file: A binary file object opened for reading.
+    :type file: file
+
+    :returns: A map of frame hash keys to lists of text values. Empty if there is no ID3V1 tag.
+    :rtype: dict
+    """
+
+    try:
+        file.seek(-_ID3V1_SIZE, 2)
+    except (IOError, ValueError):
+        return {}
+
+    data = file.read(_ID3V1_SIZE)
+
+    # Like mutagenx, take the tag to start at the first "TAG" found and tolerate short year fields.
+    start = data.find(b"TAG")
+    if start == -1:
+        return {}
+    data = data[start:]
+    if len(data) > 128 or len(data) < 124:
+        return {}
+
+    try:
+        (_, title, artist, album, year, comment, track, genre) = struct.unpack(
+            "3s30s30s30s{}s29sBB".format(len(data) - 124), data)
+    except struct.error:
+        return {}
+
+    (title, artist, album, year, comment) = [value.split(b"\x00")[0].strip().decode("latin1")
+                                             for value in (title, artist, album, year, comment)]
+
+    frames = {}
+    if title:
+        frames["TIT2"] = [title]
+    if artist:
+        frames["TPE1"] = [artist]
+    if album:
+        frames["TALB"] = [album]
+    if year:
+        frames["TDRC"] = [year]
+    if comment:
+        frames["COMM:ID3v1 Comment:eng"] = [comment]
+    # Do not read a track number if the comment looks like it was padded with spaces instead of nulls.
+    if track and (track != 32 or data[-3] == 0):
+        frames["TRCK"] = [str(track)]
+    if genre != 255:
+        frames["TCON"] = [str(genre)]
+
+    _update_to_v24(frames)
+
+    return frames
+
+
+def _decode_unsynch(data):
+    """Undo unsynchronisation, which inserts a zero byte after every 0xFF byte.
+
+    :param data: The unsynchronised data.
+    :type data: bytes or memoryview
+
+    :returns: The original data.
+    :rtype: bytes
+
+    :raise ValueError: The data was not validly unsynchronised.
+    """
+
+    data = bytes(data)
+
+    if _INVALID_UNSYNCH_PATTERN.search(data) is not None or data.endswith(b"\xff"):
+        raise ValueError("Invalid unsynchronised data.")
+
+    return data.replace(b"\xff\x00", b"\xff")
+
+
+def _decode_syncsafe(data):
+    """Decode a 4 byte syncsafe integer, where only the lower 7 bits of each byte are used.
+
+    :param data: The 4 bytes to decode.
+    :type data: bytes
+
+    :returns: The decoded integer.
+    :rtype: int
+    """
+
+    return (data[0] & 0x7f) << 21 | (data[1] & 0x7f) << 14 | (data[2] & 0x7f) << 7 | (data[3] & 0x7f)
+
+if __name__ == "__main__":
+    # Compare every getter of a snapshot against MP3Track for every file in a folder and report any differences.
+    import sys
+    from mp3_track import MP3Track
+    from file_utils import get_mp3_files
+
+    getters = ["get_title", "get_artist", "get_album_artist", "get_album", "get_genre", "get_year", "get_track",
+               "get_part_of_compilation", "get_comments", "get_audio_checksum", "has_picture"]
+
+    differences = 0
+    for file_path in get_mp3_files(sys.argv[1], recursive=True):
+        snapshot = read_tag(file_path)
+        mp3_track = MP3Track(file_path, create_tag=False)
+        for getter in getters:
+            expected = getattr(mp3_track, getter)()
+            actual = getattr(snapshot, getter)()
+            if expected != actual:
+                differences += 1
+                print("{} {}: expected {!r}, found {!r}".format(file_path, getter, expected, actual))
+
+    print("{} differences".format(differences))
@@ -0,0 +1,231 @@
+from multiprocessing import Pool
+import audio_utils
+import batch_utils
+import save_journal
+from id3_reader import read_tag
+
+# The hashlib algorithm used for new checksums. Stored checksums name their own algorithm, so this can change safely.
+CHECKSUM_ALGORITHM = "sha1"
+
+# The number of files handed to a worker process at a time.
+_POOL_CHUNK_SIZE = 64
+
+# Verification outcomes.
+STATUS_OK = "ok"
+STATUS_MISMATCH = "mismatch"
+STATUS_MISSING = "missing"
+STATUS_ERROR = "error"
+
+
+class IntegrityReport:
+    """The result of storing or verifying audio checksums over a set of files."""
+
+    def __init__(self):
+        # A map of statuses to lists of (file path, detail) tuples.
+        self.results = {STATUS_OK: [], STATUS_MISMATCH: [], STATUS_MISSING: [], STATUS_ERROR: []}
+
+    def add(self, path, status, detail=""):
+        """Record the outcome for a file.
+
+        :param path: The file path.
+        :type path: str
+
+        :param status: One of the STATUS_* values.
+        :type status: str
+
+        :param detail: Extra information such as an error message. Defaults to an empty string.
+        :type detail: str
+        """
+
+        self.results[status].append((path, detail))
+
+    def is_ok(self):
+        """Whether or not every file passed.
+
+        :returns: True if no file had a mismatched checksum or an error, false otherwise.
+        :rtype: bool
+        """
+
+        return len(self.results[STATUS_MISMATCH]) == 0 and len(self.results[STATUS_ERROR]) == 0
+
+    def __str__(self):
+        lines = ["{}: {}".format(status, len(entries)) for (status, entries) in self.results.items()]
+
+        for status in (STATUS_MISMATCH, STATUS_ERROR):
+            for (file_path, detail) in sorted(self.results[status]):
+                lines.append("{} {} {}".format(status.upper(), file_path, detail).rstrip())
+
+        return "\n".join(lines)
+
+
+def compute_checksum(path, algorithm=CHECKSUM_ALGORITHM):
+    """Compute the checksum of the audio data of an MP3 file, leaving out all tag regions.
+
+    :param path: The path to the MP3 file.
+    :type path: str
+
+    :param algorithm: The name of a hashlib algorithm. Defaults to CHECKSUM_ALGORITHM.
+    :type algorithm: str
+
+    :returns: The checksum of form "<algorithm>:<hex digest>".
+    :rtype: str
+
+    :raise IOError: Error reading file.
+    """
+
+    return algorithm + ":" + audio_utils.hash_audio(path, algorithm)
+
+
+def store_checksums(paths, processes=None, overwrite=False, journal_directory=save_journal.JOURNAL_DIRECTORY):
+    """Compute audio checksums in parallel and store them in each file's tag.
+
+    The checksums are computed in a pool of worker processes, then saved as one journaled batch with
+    batch_utils.save_assignments(), so every file is either fully saved or untouched.
+
+    :param paths: The paths of the MP3 files.
+    :type paths: list
+
+    :param processes: The number of worker processes to use. Defaults to the number of CPUs.
+    :type processes: int or None
+
+    :param overwrite: True to replace checksums that are already stored, false to leave them alone. Defaults to False.
+    :type overwrite: bool
+
+    :param journal_directory: The directory to keep the journal of the batch in. Defaults to
+        save_journal.JOURNAL_DIRECTORY.
+    :type journal_directory: str
+
+    :returns: A report where STATUS_OK means a checksum is now stored.
+    :rtype: IntegrityReport
+
+    :raise IOError: Error writing journal.
+    """
+
+    report = IntegrityReport()
+    assignments = {}
+
+    with Pool(processes) as pool:
+        arguments = [(path, overwrite) for path in paths]
+        for (file_path, checksum, error) in pool.imap_unordered(_compute_new_checksum, arguments, _POOL_CHUNK_SIZE):
+            if error is not None:
+                report.add(file_path, STATUS_ERROR, error)
+            elif checksum is None:
+                report.add(file_path, STATUS_OK)
+            else:
+                assignments[file_path] = {"set_audio_checksum": checksum}
+
+    failures = dict(batch_utils.save_assignments(assignments, journal_directory=journal_directory))
+    for file_path in assignments:
+        if file_path in failures:
+            report.add(file_path, STATUS_ERROR, str(failures[file_path]))
+        else:
+            report.add(file_path, STATUS_OK)
+
+    return report
+
+
+def verify_checksums(paths, processes=None):
+    """Verify the stored audio checksums of a set of files, in parallel.
+
+    :param paths: The paths of the MP3 files.
+    :type paths: list
+
+    :param processes: The number of worker processes to use. Defaults to the number of CPUs.
+    :type processes: int or None
+
+    :returns: A report of which files passed, failed, or had no checksum stored.
+    :rtype: IntegrityReport
+    """
+
+    return _run(_verify_checksum, paths, processes)
+
+
+def _run(function, arguments, processes):
+    """Run a worker function over a list of arguments in a process pool and collect the outcomes into a report.
+
+    :param function: A module level function returning a (file path, status, detail) tuple.
+    :type function: function
+
+    :param arguments: The arguments to call the function with, one per call.
+    :type arguments: list
+
+    :param processes: The number of worker processes to use.
+    :type processes: int or None
+
+    :returns: A report of all outcomes.
+    :rtype: IntegrityReport
+    """
+
+    report = IntegrityReport()
+
+    with Pool(processes) as pool:
+        for (file_path, status, detail) in pool.imap_unordered(function, arguments, _POOL_CHUNK_SIZE):
+            report.add(file_path, status, detail)
+
+    return report
+
+
+def _compute_new_checksum(arguments):
+    """Compute a file's audio checksum unless one is stored and should be kept. Runs in a worker process.
+
+    :param arguments: A tuple of the file path and whether or not to overwrite an existing checksum.
+    :type arguments: tuple
+
+    :returns: A tuple of the file path, the checksum to store or None if the stored one is kept, and an error message
+        or None.
+    :rtype: tuple
+    """
+
+    (path, overwrite) = arguments
+
+    try:
+        if not overwrite and read_tag(path).get_audio_checksum() is not None:
+            return (path, None, None)
+
+        return (path, compute_checksum(path), None)
+    except IOError as error:
+        return (path, None, str(error))
+
+
+def _verify_checksum(path):
+    """Compare a file's stored audio checksum against its actual audio data. Runs in a worker process.
+
+    :param path: The file path.
+    :type path: str
+
+    :returns: A tuple of the file path, a status, and a detail message.
+    :rtype: tuple
+    """
+
+    try:
+        stored_checksum = read_tag(path).get_audio_checksum()
+        if stored_checksum is None:
+            return (path, STATUS_MISSING, "")
+
+        (algorithm, _, _) = stored_checksum.partition(":")
+        actual_checksum = compute_checksum(path, algorithm)
+    except (IOError, ValueError) as error:
+        # A ValueError means the stored checksum names an algorithm hashlib does not have.
+        return (path, STATUS_ERROR, str(error))
+
+    if actual_checksum != stored_checksum:
+        return (path, STATUS_MISMATCH, "expected {}, found {}".format(stored_checksum, actual_checksum))
+
+    return (path, STATUS_OK, "")
+
+if __name__ == "__main__":
+    import sys
+    from file_utils import get_mp3_files
+
+    if len(sys.argv) != 3 or sys.argv[1] not in ("store", "verify"):
+        print("Usage: python3 integrity_utils.py store|verify <folder>")
+        exit(2)
+
+    mp3_files = get_mp3_files(sys.argv[2], recursive=True)
+    if sys.argv[1] == "store":
+        integrity_report = store_checksums(mp3_files)
+    else:
+        integrity_report = verify_checksums(mp3_files)
+
+    print(integrity_report)
+    exit(0 if integrity_report.is_ok() else 1)
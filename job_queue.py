@@ -0,0 +1,582 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import batch_utils
+
+# Where the default queue is kept. An SQLite queue is shared by the worker processes of one machine only, so workers on
+# several machines use a Redis queue instead.
+JOB_QUEUE_PATH = os.path.join(os.path.expanduser("~"), ".mp3_tagger", "jobs.sqlite3")
+
+# The number of files in a work unit. Each unit is saved as one group by batch_utils, so they match.
+DEFAULT_UNIT_SIZE = batch_utils.SYNC_GROUP_SIZE
+
+# How long a worker has to finish a unit before it is given to another worker.
+DEFAULT_LEASE_SECONDS = 300
+
+# How many times a unit is tried before it is given up on.
+DEFAULT_MAX_ATTEMPTS = 3
+
+# How long an idle worker waits before asking the queue for work again.
+_POLL_SECONDS = 1
+
+# Leases a unit of a Redis queue, after putting units whose lease expired back in line. It runs as a script so that the
+# whole lease is atomic, and a worker that dies part way cannot leave a unit out of every list.
+# KEYS: the pending list and the lease set.
+# ARGV: now, when the new lease expires, the worker ID, the maximum attempts, the unit key prefix, the expired lease
+# result, and the pending, leased, and failed states.
+_REDIS_LEASE_SCRIPT = """
+for _, unit_id in ipairs(redis.call("ZRANGEBYSCORE", KEYS[2], 0, ARGV[1])) do
+    local unit_key = ARGV[5] .. unit_id
+    redis.call("ZREM", KEYS[2], unit_id)
+    if tonumber(redis.call("HGET", unit_key, "attempts")) >= tonumber(ARGV[4]) then
+        redis.call("HSET", unit_key, "state", ARGV[9], "result", ARGV[6])
+    else
+        redis.call("HSET", unit_key, "state", ARGV[7])
+        redis.call("RPUSH", KEYS[1], unit_id)
+    end
+end
+
+local unit_id = redis.call("LPOP", KEYS[1])
+if not unit_id then
+    return nil
+end
+
+local unit_key = ARGV[5] .. unit_id
+redis.call("ZADD", KEYS[2], ARGV[2], unit_id)
+redis.call("HSET", unit_key, "state", ARGV[8], "worker", ARGV[3])
+redis.call("HINCRBY", unit_key, "attempts", 1)
+
+return {unit_id, redis.call("HGET", unit_key, "payload")}
+"""
+
+# Marks a unit of a Redis queue as done unless it is already finished, taking it out of line in case its lease expired
+# and it is waiting to be tried again.
+# KEYS: the pending list, the lease set, and the unit's hash.
+# ARGV: the unit ID, the result, and the pending, leased, and done states.
+_REDIS_COMPLETE_SCRIPT = """
+local state = redis.call("HGET", KEYS[3], "state")
+if state ~= ARGV[3] and state ~= ARGV[4] then
+    return 0
+end
+
+redis.call("ZREM", KEYS[2], ARGV[1])
+redis.call("LREM", KEYS[1], 0, ARGV[1])
+redis.call("HSET", KEYS[3], "state", ARGV[5], "result", ARGV[2])
+
+return 1
+"""
+
+# Gives up on an attempt at a unit of a Redis queue, putting it back in line unless it has used up all of its attempts.
+# Does nothing unless the unit is still leased to the worker giving up.
+# KEYS: the pending list, the lease set, and the unit's hash.
+# ARGV: the unit ID, the worker ID, the maximum attempts, the result, and the pending and failed states.
+_REDIS_FAIL_SCRIPT = """
+if redis.call("HGET", KEYS[3], "worker") ~= ARGV[2] or redis.call("ZREM", KEYS[2], ARGV[1]) == 0 then
+    return 0
+end
+
+if tonumber(redis.call("HGET", KEYS[3], "attempts")) >= tonumber(ARGV[3]) then
+    redis.call("HSET", KEYS[3], "state", ARGV[6], "result", ARGV[4])
+else
+    redis.call("HSET", KEYS[3], "state", ARGV[5], "result", ARGV[4])
+    redis.call("RPUSH", KEYS[1], ARGV[1])
+end
+
+return 1
+"""
+
+# Work unit states.
+STATE_PENDING = "pending"
+STATE_LEASED = "leased"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+class JobResults:
+    """The aggregated results of every work unit of a batch."""
+
+    def __init__(self):
+        # A map of unit states to the number of units in that state.
+        self.unit_counts = {STATE_PENDING: 0, STATE_LEASED: 0, STATE_DONE: 0, STATE_FAILED: 0}
+
+        # A list of (file path, error message) tuples for the files that failed in finished units.
+        self.file_failures = []
+
+        # A list of (unit ID, error message) tuples for the units that failed every attempt.
+        self.unit_failures = []
+
+    def is_finished(self):
+        """Whether or not every unit of the batch is either done or has failed for good.
+
+        :returns: True if the batch is finished, false otherwise.
+        :rtype: bool
+        """
+
+        return self.unit_counts[STATE_PENDING] == 0 and self.unit_counts[STATE_LEASED] == 0
+
+    def __str__(self):
+        lines = ["{}: {}".format(state, count) for (state, count) in self.unit_counts.items()]
+        lines.extend("unit {}: {}".format(unit_id, error) for (unit_id, error) in self.unit_failures)
+        lines.extend("{}: {}".format(file_path, error) for (file_path, error) in self.file_failures)
+
+        return "\n".join(lines)
+
+
+class SQLiteJobQueue:
+    """A work unit queue kept in an SQLite database, shared by every worker process on one machine that opens the same
+    file. The database is in WAL mode, which needs memory shared between the processes, so it must not be opened from
+    several machines over a network file system. Use a RedisJobQueue for that.
+
+    A worker leases a unit for a limited time. If it does not complete or fail the unit in time, for example because it
+    died, the unit is leased to the next worker that asks. Leasing again is safe because a unit only sets tag fields to
+    fixed values and each file is saved atomically, so applying a unit twice has the same result as applying it once.
+    Only the first result reported for a unit is kept.
+    """
+
+    def __init__(self, path=JOB_QUEUE_PATH, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Open a queue, creating it if it does not exist.
+
+        :param path: The path of the database. Defaults to JOB_QUEUE_PATH.
+        :type path: str
+
+        :param lease_seconds: How long a worker has to finish a unit. Defaults to DEFAULT_LEASE_SECONDS.
+        :type lease_seconds: float
+
+        :param max_attempts: How many times a unit is tried. Defaults to DEFAULT_MAX_ATTEMPTS.
+        :type max_attempts: int
+
+        :raise sqlite3.Error: Error opening database.
+        """
+
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Transactions are begun explicitly so that leasing can take the write lock before it reads. WAL lets results be
+        # read while a worker writes, but limits the queue to one machine. See the class docstring.
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""CREATE TABLE IF NOT EXISTS units (
+                                        id INTEGER PRIMARY KEY,
+                                        batch TEXT NOT NULL,
+                                        payload TEXT NOT NULL,
+                                        state TEXT NOT NULL,
+                                        attempts INTEGER NOT NULL DEFAULT 0,
+                                        lease_expires REAL,
+                                        worker TEXT,
+                                        result TEXT)""")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS units_by_state ON units (state, lease_expires)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS units_by_batch ON units (batch)")
+
+    def put(self, batch_id, units):
+        """Add the work units of a batch to the queue.
+
+        :param batch_id: The ID of the batch.
+        :type batch_id: str
+
+        :param units: The work units, as made by build_work_units().
+        :type units: iterable
+        """
+
+        with self._transaction():
+            self._connection.executemany("INSERT INTO units (batch, payload, state) VALUES (?, ?, ?)",
+                                         ((batch_id, json.dumps(unit), STATE_PENDING) for unit in units))
+
+    def lease(self, worker_id):
+        """Lease the next unit that is pending or whose lease has expired.
+
+        :param worker_id: The ID of the worker taking the unit.
+        :type worker_id: str
+
+        :returns: A (unit ID, work unit) tuple, or None if there is nothing to do.
+        :rtype: tuple or None
+        """
+
+        now = time.time()
+        with self._transaction():
+            # Units whose lease expired on their last attempt have used up all of their attempts.
+            self._connection.execute("UPDATE units SET state = ?, result = ? WHERE state = ? AND lease_expires < ? AND "
+                                     "attempts >= ?", (STATE_FAILED, json.dumps({"error": "Lease expired."}),
+                                                       STATE_LEASED, now, self.max_attempts))
+
+            row = self._connection.execute("SELECT id, payload FROM units WHERE state = ? OR (state = ? AND "
+                                           "lease_expires < ?) ORDER BY id LIMIT 1",
+                                           (STATE_PENDING, STATE_LEASED, now)).fetchone()
+            if row is None:
+                return None
+
+            self._connection.execute("UPDATE units SET state = ?, attempts = attempts + 1, lease_expires = ?, "
+                                     "worker = ? WHERE id = ?", (STATE_LEASED, now + self.lease_seconds, worker_id,
+                                                                 row[0]))
+
+        return (row[0], json.loads(row[1]))
+
+    def complete(self, unit_id, failures):
+        """Mark a unit as done. Does nothing if the unit was already finished by another worker.
+
+        :param unit_id: The ID of the unit.
+        :type unit_id: int
+
+        :param failures: A list of (file path, error message) tuples for the files of the unit that failed.
+        :type failures: list
+        """
+
+        with self._transaction():
+            self._connection.execute("UPDATE units SET state = ?, result = ? WHERE id = ? AND state IN (?, ?)",
+                                     (STATE_DONE, json.dumps({"failures": failures}), unit_id, STATE_PENDING,
+                                      STATE_LEASED))
+
+    def fail(self, unit_id, worker_id, error):
+        """Give up on an attempt at a unit. The unit is tried again unless it has used up all of its attempts. Does
+        nothing if the unit has since been leased to another worker.
+
+        :param unit_id: The ID of the unit.
+        :type unit_id: int
+
+        :param worker_id: The ID of the worker giving up.
+        :type worker_id: str
+
+        :param error: A message describing why the attempt failed.
+        :type error: str
+        """
+
+        with self._transaction():
+            self._connection.execute("UPDATE units SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END, result = ?, "
+                                     "lease_expires = NULL WHERE id = ? AND state = ? AND worker = ?",
+                                     (self.max_attempts, STATE_FAILED, STATE_PENDING, json.dumps({"error": error}),
+                                      unit_id, STATE_LEASED, worker_id))
+
+    def get_results(self, batch_id):
+        """Aggregate the results of every unit of a batch.
+
+        :param batch_id: The ID of the batch.
+        :type batch_id: str
+
+        :returns: The results.
+        :rtype: JobResults
+        """
+
+        results = JobResults()
+        now = time.time()
+        for (unit_id, state, lease_expires, result) in self._connection.execute(
+                "SELECT id, state, lease_expires, result FROM units WHERE batch = ? ORDER BY id", (batch_id,)):
+            # A unit whose lease expired is waiting for another worker.
+            if state == STATE_LEASED and lease_expires < now:
+                state = STATE_PENDING
+            results.unit_counts[state] += 1
+
+            if state == STATE_DONE:
+                results.file_failures.extend(tuple(failure) for failure in json.loads(result)["failures"])
+            elif state == STATE_FAILED:
+                results.unit_failures.append((unit_id, json.loads(result)["error"]))
+
+        return results
+
+    def close(self):
+        """Close the database."""
+
+        self._connection.close()
+
+    def _transaction(self):
+        """Begin a transaction that holds the write lock from the start, so no two workers can lease the same unit.
+
+        :returns: A context manager that commits the transaction on success and rolls it back on error.
+        :rtype: _Transaction
+        """
+
+        return _Transaction(self._connection)
+
+
+class _Transaction:
+    """A context manager for an immediate SQLite transaction."""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exception_type, exception, traceback):
+        self._connection.execute("COMMIT" if exception_type is None else "ROLLBACK")
+
+
+class RedisJobQueue:
+    """A work unit queue kept in Redis or any server that speaks its protocol, for workers on several machines.
+
+    It behaves the same as SQLiteJobQueue. Units wait in a list, leased units are kept in a sorted set scored by when
+    their lease expires, and each unit's payload, attempts, and result are kept in a hash. Leasing, completing, and
+    failing each run as a Lua script, so that they are atomic, and the server has to support EVAL. The redis package is
+    only imported when a Redis queue is opened, so it is not needed otherwise.
+    """
+
+    def __init__(self, url, prefix="mp3_tagger", lease_seconds=DEFAULT_LEASE_SECONDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        """Connect to a queue.
+
+        :param url: The URL of the server, for example "redis://localhost:6379/0".
+        :type url: str
+
+        :param prefix: The prefix of every key the queue uses. Defaults to "mp3_tagger".
+        :type prefix: str
+
+        :param lease_seconds: How long a worker has to finish a unit. Defaults to DEFAULT_LEASE_SECONDS.
+        :type lease_seconds: float
+
+        :param max_attempts: How many times a unit is tried. Defaults to DEFAULT_MAX_ATTEMPTS.
+        :type max_attempts: int
+
+        :raise ImportError: The redis package is not installed.
+        """
+
+        import redis
+
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._prefix = prefix
+        self._lease_script = self._redis.register_script(_REDIS_LEASE_SCRIPT)
+        self._complete_script = self._redis.register_script(_REDIS_COMPLETE_SCRIPT)
+        self._fail_script = self._redis.register_script(_REDIS_FAIL_SCRIPT)
+
+    def put(self, batch_id, units):
+        """See SQLiteJobQueue.put()."""
+
+        pipeline = self._redis.pipeline()
+        for unit in units:
+            unit_id = self._redis.incr(self._key("next_id"))
+            pipeline.hset(self._key("unit", unit_id), mapping={"batch": batch_id, "payload": json.dumps(unit),
+                                                                "state": STATE_PENDING, "attempts": 0})
+            pipeline.rpush(self._key("batch", batch_id), unit_id)
+            pipeline.rpush(self._key("pending"), unit_id)
+        pipeline.execute()
+
+    def lease(self, worker_id):
+        """See SQLiteJobQueue.lease()."""
+
+        now = time.time()
+        leased = self._lease_script(keys=[self._key("pending"), self._key("leased")],
+                                    args=[repr(now), repr(now + self.lease_seconds), worker_id, self.max_attempts,
+                                          self._key("unit", ""), json.dumps({"error": "Lease expired."}),
+                                          STATE_PENDING, STATE_LEASED, STATE_FAILED])
+        if leased is None:
+            return None
+
+        (unit_id, payload) = leased
+        return (int(unit_id), json.loads(payload))
+
+    def complete(self, unit_id, failures):
+        """See SQLiteJobQueue.complete()."""
+
+        self._complete_script(keys=[self._key("pending"), self._key("leased"), self._key("unit", unit_id)],
+                              args=[unit_id, json.dumps({"failures": failures}), STATE_PENDING, STATE_LEASED,
+                                    STATE_DONE])
+
+    def fail(self, unit_id, worker_id, error):
+        """See SQLiteJobQueue.fail()."""
+
+        self._fail_script(keys=[self._key("pending"), self._key("leased"), self._key("unit", unit_id)],
+                          args=[unit_id, worker_id, self.max_attempts, json.dumps({"error": error}), STATE_PENDING,
+                                STATE_FAILED])
+
+    def get_results(self, batch_id):
+        """See SQLiteJobQueue.get_results()."""
+
+        unit_ids = self._redis.lrange(self._key("batch", batch_id), 0, -1)
+        pipeline = self._redis.pipeline(transaction=False)
+        for unit_id in unit_ids:
+            pipeline.hgetall(self._key("unit", unit_id))
+            pipeline.zscore(self._key("leased"), unit_id)
+        replies = pipeline.execute()
+
+        results = JobResults()
+        now = time.time()
+        for (unit_id, unit, lease_expires) in zip(unit_ids, replies[0::2], replies[1::2]):
+            state = unit["state"]
+            # A unit whose lease expired is waiting for another worker.
+            if state == STATE_LEASED and lease_expires is not None and lease_expires < now:
+                state = STATE_PENDING
+            results.unit_counts[state] += 1
+
+            if state == STATE_DONE:
+                results.file_failures.extend(tuple(failure) for failure in json.loads(unit["result"])["failures"])
+            elif state == STATE_FAILED:
+                results.unit_failures.append((int(unit_id), json.loads(unit["result"])["error"]))
+
+        return results
+
+    def close(self):
+        """Close the connection."""
+
+        self._redis.close()
+
+    def _key(self, *parts):
+        return ":".join((self._prefix,) + tuple(str(part) for part in parts))
+
+
+def open_queue(location=JOB_QUEUE_PATH):
+    """Open a queue from its location.
+
+    :param location: A redis:// or rediss:// URL for a Redis queue, or the path of an SQLite queue. Defaults to
+        JOB_QUEUE_PATH.
+    :type location: str
+
+    :returns: The queue.
+    :rtype: SQLiteJobQueue or RedisJobQueue
+
+    :raise ImportError: A Redis queue was asked for but the redis package is not installed.
+    """
+
+    if location.startswith(("redis://", "rediss://", "unix://")):
+        return RedisJobQueue(location)
+
+    return SQLiteJobQueue(location)
+
+
+def build_work_units(assignments, unit_size=DEFAULT_UNIT_SIZE):
+    """Split a batch of field assignments into work units.
+
+    :param assignments: A map of file paths to maps of setter method names to values, in the form
+        batch_utils.save_assignments() takes. Setters must be in batch_utils.FIELD_SETTERS, and values must be JSON
+        serializable.
+    :type assignments: dict
+
+    :param unit_size: The number of files in a unit. Defaults to DEFAULT_UNIT_SIZE.
+    :type unit_size: int
+
+    :returns: A list of work units, each of the form {"assignments": {...}}.
+    :rtype: list
+
+    :raise ValueError: A setter is not in batch_utils.FIELD_SETTERS.
+    """
+
+    # Workers check the setters of every unit they take as well, as anyone who can write to the queue can add units.
+    for assignment in assignments.values():
+        batch_utils.check_setters(assignment)
+
+    file_paths = list(assignments)
+
+    return [{"assignments": {file_path: assignments[file_path] for file_path in file_paths[start:start + unit_size]}}
+            for start in range(0, len(file_paths), unit_size)]
+
+
+def submit_assignments(queue, assignments, unit_size=DEFAULT_UNIT_SIZE):
+    """Split a batch of field assignments into work units and add them to a queue.
+
+    :param queue: The queue.
+    :type queue: SQLiteJobQueue or RedisJobQueue
+
+    :param assignments: See build_work_units().
+    :type assignments: dict
+
+    :param unit_size: The number of files in a unit. Defaults to DEFAULT_UNIT_SIZE.
+    :type unit_size: int
+
+    :returns: The ID of the batch, for get_results().
+    :rtype: str
+
+    :raise ValueError: A setter is not in batch_utils.FIELD_SETTERS.
+    """
+
+    batch_id = uuid.uuid4().hex
+    queue.put(batch_id, build_work_units(assignments, unit_size))
+
+    return batch_id
+
+
+def run_worker(queue, worker_id=None, max_workers=batch_utils.DEFAULT_SAVE_WORKERS, wait=False):
+    """Take work units from a queue and save them until there are none left.
+
+    Each unit is applied with batch_utils.save_assignments(), which loads, assigns, and saves its files in parallel
+    threads. Files that fail, including files whose assignment names a setter that is not in batch_utils.FIELD_SETTERS,
+    are reported in the unit's result. A unit only fails, and is tried again, if it could not be applied at all.
+
+    :param queue: The queue.
+    :type queue: SQLiteJobQueue or RedisJobQueue
+
+    :param worker_id: An ID for this worker. Defaults to the host name and process ID.
+    :type worker_id: str or None
+
+    :param max_workers: The number of threads to load and save with. Defaults to batch_utils.DEFAULT_SAVE_WORKERS.
+    :type max_workers: int
+
+    :param wait: True to keep waiting for new units when the queue is empty, false to return. Defaults to False.
+    :type wait: bool
+
+    :returns: The number of units this worker completed.
+    :rtype: int
+    """
+
+    worker_id = worker_id or "{}:{}".format(socket.gethostname(), os.getpid())
+    completed = 0
+
+    while True:
+        leased = queue.lease(worker_id)
+        if leased is None:
+            if not wait:
+                return completed
+            time.sleep(_POLL_SECONDS)
+            continue
+
+        (unit_id, unit) = leased
+        try:
+            # The queue already records which units are finished, so the save journal is not needed.
+            failures = batch_utils.save_assignments(unit["assignments"], max_workers=max_workers,
+                                                    journal_directory=None)
+        except Exception as error:
+            queue.fail(unit_id, worker_id, "{}: {}".format(type(error).__name__, error))
+            continue
+
+        queue.complete(unit_id, [(file_path, "{}: {}".format(type(error).__name__, error))
+                                 for (file_path, error) in failures])
+        completed += 1
+
+
+def _run_worker_process(location, wait):
+    """Open a queue in a new process and work on it."""
+
+    queue = open_queue(location)
+    try:
+        run_worker(queue, wait=wait)
+    finally:
+        queue.close()
+
+if __name__ == "__main__":
+    # Submit a batch, run workers, or show the results of a batch from the command line.
+    import sys
+    from multiprocessing import Process
+
+    usage = ("Usage: python3 job_queue.py submit <queue> <assignments.json>\n"
+             "       python3 job_queue.py work <queue> [<processes>] [--wait]\n"
+             "       python3 job_queue.py status <queue> <batch id>\n"
+             "<queue> is the path of an SQLite queue or a redis:// URL.")
+
+    if len(sys.argv) < 4 and not (len(sys.argv) >= 3 and sys.argv[1] == "work"):
+        print(usage)
+        exit(2)
+
+    (command, queue_location) = sys.argv[1:3]
+    if command == "submit":
+        with open(sys.argv[3], encoding="utf8") as assignments_file:
+            print(submit_assignments(open_queue(queue_location), json.load(assignments_file)))
+    elif command == "work":
+        arguments = [argument for argument in sys.argv[3:] if argument != "--wait"]
+        processes = [Process(target=_run_worker_process, args=(queue_location, "--wait" in sys.argv))
+                     for _ in range(int(arguments[0]) if arguments else os.cpu_count() or 1)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    elif command == "status":
+        batch_results = open_queue(queue_location).get_results(sys.argv[3])
+        print(batch_results)
+        exit(0 if batch_results.is_finished() and not batch_results.unit_failures else 1)
+    else:
+        print(usage)
+        exit(2)
@@ -0,0 +1,188 @@
+import mmap
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+# Set to False to always use buffered reads.
+USE_MMAP = True
+
+# Regions smaller than this are read with buffered I/O. For a few kilobytes, a single read costs less than setting up
+# and tearing down a mapping; mapping pays off for tags carrying large pictures.
+MMAP_THRESHOLD = 64 * 1024
+
+# Network and userspace filesystems where a shared mapping may not stay coherent with other clients, or where touching a
+# page can kill the process with SIGBUS if the server goes away or the file is truncated underneath us.
+MMAP_UNSAFE_FILESYSTEMS = frozenset(["nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "fuse",
+                                     "fuse.sshfs", "fuse.rclone", "fuse.s3fs", "davfs", "ceph", "glusterfs"])
+
+_MOUNTS_PATH = "/proc/self/mounts"
+_MOUNT_ESCAPE_PATTERN = re.compile(r"\\([0-7]{3})")
+
+# A list of (mount point, filesystem type) tuples, longest mount point first. Loaded on first use.
+_mount_points = None
+_mount_points_lock = threading.Lock()
+
+
+def is_mmap_safe(path):
+    """Whether or not a file can safely be accessed through a memory mapping.
+
+    On Linux the filesystem type is looked up in the mount table. Elsewhere, only USE_MMAP is checked.
+
+    :param path: The path to the file.
+    :type path: str
+
+    :returns: True if the file is not on a filesystem listed in MMAP_UNSAFE_FILESYSTEMS, false otherwise.
+    :rtype: bool
+    """
+
+    if not USE_MMAP:
+        return False
+
+    path = os.path.realpath(path)
+    for (mount_point, filesystem_type) in _get_mount_points():
+        if path == mount_point or path.startswith(mount_point.rstrip("/") + "/"):
+            return filesystem_type not in MMAP_UNSAFE_FILESYSTEMS
+
+    return True
+
+
+@contextmanager
+def map_file_region(file, length):
+    """Give access to the start of a file, mapping it into memory when that is worthwhile and safe.
+
+    Only the first length bytes are mapped, so the audio data of a large file is never touched. Views taken of the
+    region must not be kept beyond the with block.
+
+    :param file: A binary file object opened for reading.
+    :type file: file
+
+    :param length: The number of bytes to access from the start of the file.
+    :type length: int
+
+    :returns: A context manager giving a read only view of the region. The view is shorter than length if the file is.
+    :rtype: contextmanager
+    """
+
+    mapping = None
+    if length >= MMAP_THRESHOLD and is_mmap_safe(file.name):
+        try:
+            mapping = mmap.mmap(file.fileno(), length, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Raised for files shorter than length, and for files that cannot be mapped at all.
+            mapping = None
+
+    if mapping is None:
+        file.seek(0)
+        yield memoryview(file.read(length))
+        return
+
+    region = memoryview(mapping)
+    try:
+        yield region
+    finally:
+        region.release()
+        try:
+            mapping.close()
+        except BufferError:
+            # A view of the region outlived the with block. The mapping is closed when the last view goes away.
+            pass
+
+
+def _get_mount_points():
+    """Get the mount table, loading it on first use.
+
+    :returns: A list of (mount point, filesystem type) tuples, longest mount point first. Empty if there is no mount
+              table to read.
+    :rtype: list
+    """
+
+    global _mount_points
+
+    with _mount_points_lock:
+        if _mount_points is None:
+            _mount_points = _load_mount_points(_MOUNTS_PATH)
+
+        return _mount_points
+
+
+def _load_mount_points(mounts_path):
+    """Read a mount table in the format of /proc/mounts.
+
+    :param mounts_path: The path to the mount table.
+    :type mounts_path: str
+
+    :returns: A list of (mount point, filesystem type) tuples, longest mount point first.
+    :rtype: list
+    """
+
+    mount_points = []
+    try:
+        with open(mounts_path, encoding="utf8", errors="replace") as mounts_file:
+            for line in mounts_file:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Spaces and other special characters in mount points are escaped as octal.
+                mount_point = _MOUNT_ESCAPE_PATTERN.sub(lambda match: chr(int(match.group(1), 8)), fields[1])
+                mount_points.append((mount_point, fields[2]))
+    except OSError:
+        return []
+
+    mount_points.sort(key=lambda mount: len(mount[0]), reverse=True)
+
+    return mount_points
+
+
+if __name__ == "__main__":
+    # Benchmark reading every file in a folder through the buffered and memory mapped paths, against loading and saving
+    # with mutagenx.
+    import shutil
+    import sys
+    import tempfile
+    import time
+    import tracemalloc
+    import mmap_io
+    from file_utils import get_mp3_files
+    from id3_reader import read_tag
+    from mp3_track import MP3Track
+
+    def benchmark(label, function, paths):
+        # Time a pass without tracing first, as tracemalloc slows down every allocation.
+        start = time.perf_counter()
+        for file_path in paths:
+            function(file_path)
+        elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        for file_path in paths:
+            function(file_path)
+        (_, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print("{:<24} {:8.3f} ms/file {:10.1f} KiB peak".format(label, elapsed * 1000 / max(len(paths), 1),
+                                                                peak / 1024))
+
+    def save(file_path):
+        mp3_track = MP3Track(file_path)
+        mp3_track.set_title(mp3_track.get_title() or "")
+        mp3_track.save_tag()
+
+    mp3_files = get_mp3_files(sys.argv[1], recursive=True)
+
+    # Map every tag regardless of size, so the two paths are compared like for like.
+    mmap_io.MMAP_THRESHOLD = 0
+    for use_mmap in (False, True):
+        mmap_io.USE_MMAP = use_mmap
+        benchmark("read_tag " + ("mmap" if use_mmap else "buffered"), read_tag, mp3_files)
+
+    benchmark("MP3Track load", lambda file_path: MP3Track(file_path, create_tag=False), mp3_files)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Save copies, so that the files being benchmarked are left alone.
+        copies = []
+        for (index, file_path) in enumerate(mp3_files):
+            copies.append(os.path.join(directory, "{}.mp3".format(index)))
+            shutil.copyfile(file_path, copies[-1])
+
+        benchmark("MP3Track save", save, copies)
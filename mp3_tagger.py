@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 
 import os
-import webbrowser
 import npyscreen
 import album_art_utils
-from mp3_track import MP3Track
-from file_utils import get_mp3_files
+import batch_utils
+import edit_history
+import genre_utils
+import save_journal
+from workspace import Workspace
 
 # TODO:
 # - Look into best-guess auto-tagging based existing tag information leveraging some third-party service.
 # - Add support for x/y disc number frame.
 # - Add support for different file renaming patterns.
-# - Support genre int -> genre mapping.
 # - Add mouse support so you don't have to use tab and arrow keys so much.
 # - Add some sort of indicator that tags have been changed, but not saved.
-# - Sort by track number if possible and and auto-track numbering. Add a way to re-order list before auto-numbering.
-#   Maybe do this in a popup window.
+# - Add a way to re-order list before auto-numbering. Maybe do this in a popup window.
 # - When selecting a titled widget, the title turns white. See if it is possible to stop this from happening.
 # - Figure out how to to put boxes around certain groups of widgets to add polish to the UI.
 # - Check out this page for more tags to support. It is much better than the actual official spec sheet.
@@ -45,7 +45,7 @@ class Field:
     # The text to display in entry_widget when multiple tracks with different values are selected at the same time.
     MULTIPLE_VALUES_TEXT = "Multiple Values"
 
-    def __init__(self, name, toggle, getter, setter, parent_form):
+    def __init__(self, name, toggle, getter, setter, parent_form, normalizer=None):
         """Create a new field and add it to a parent form.
 
         :param name: The field label.
@@ -62,11 +62,16 @@ class Field:
 
         :param parent_form: The form this field should be added to.
         :type parent_form: str
+
+        :param normalizer: A function applied to values read with the getter before they are compared and shown, so
+            that values that only differ in representation do not show as multiple values. Defaults to None.
+        :type normalizer: function or None
         """
 
         self.toggle = toggle
         self.getter = getter
         self.setter = setter
+        self.normalizer = normalizer
 
         # TODO: Figure out why the value text sometimes disappears/gets covered up if I don't specify max_width.
         checkbox_max_width = len(name) + Field.CHECKBOX_BUILT_IN_WIDTH
@@ -135,10 +140,10 @@ class Field:
         random_track = mp3_tracks.pop()
         mp3_tracks.add(random_track)
         # Set that track's value as the entry field's value.
-        self.entry_widget.value = getattr(random_track, self.getter)()
+        self.entry_widget.value = self.get_value_from_track(random_track)
         # Loop through all of tracks and change the entry field value to indicate multiple values of necessary.
         for track in mp3_tracks:
-            if self.entry_widget.value != getattr(track, self.getter)():
+            if self.entry_widget.value != self.get_value_from_track(track):
                 if self.toggle:
                     self.entry_widget.name = Field.MULTIPLE_VALUES_TEXT
                 else:
@@ -148,17 +153,43 @@ class Field:
         # Refresh the UI.
         self.entry_widget.update()
 
+    def get_value_from_track(self, mp3_track):
+        """Read this field's value from a track using this field's associated getter and normalizer.
+
+        :param mp3_track: The track to read the value from.
+        :type mp3_track: MP3Track or MusicTrack
+
+        :returns: The normalized value.
+        :rtype: str or bool
+        """
+
+        value = getattr(mp3_track, self.getter)()
+
+        if self.normalizer is not None:
+            value = self.normalizer(value)
+
+        return value
+
     def apply_value_to_track(self, mp3_track):
         """Apply the entry widget value to a track using this field's associated setter.
 
         Note: This does not call save on the track. The change will not persist unless the track is saved.
 
-        :param mp3_track: The MP3Track to to apply the entry widget value to.
-        :type mp3_track: MP3Track
+        :param mp3_track: The track to to apply the entry widget value to.
+        :type mp3_track: MP3Track or MusicTrack
         """
 
         getattr(mp3_track, self.setter)(self.entry_widget.value)
 
+    def get_assignment(self):
+        """Get the entry widget value as an assignment that can be applied to tracks later, as batch_utils does.
+
+        :returns: A tuple of this field's setter name and the entry widget value.
+        :rtype: tuple
+        """
+
+        return (self.setter, self.entry_widget.value)
+
 
 class TrackEditorForm(npyscreen.FormBaseNew):
     """The main form that includes all widgets that make up the UI."""
@@ -176,8 +207,14 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         self.load_button = None
         self.file_list = None
         self.select_all_files_button = None
+        self.query_input = None
+        self.query_button = None
         self.save_button = None
         self.rename_button = None
+        self.number_button = None
+        self.genre_button = None
+        self.undo_button = None
+        self.redo_button = None
         self.album_art_search_box = None
         self.search_button = None
         self.debug_button = None
@@ -185,18 +222,25 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         # A set of editor fields including a checkbox and an entry widget.
         self.fields = set()
 
-        # A map of filenames to their corresponding mp3_track wrappers.
-        self.mp3_tracks = {}
+        # The open folders, which keep the tracks loaded from them and an index of their tag data.
+        self.workspace = Workspace()
 
         # A set of the selected mp3_track wrappers.
         self.selected_mp3_tracks = set()
 
+        # Whether or not the user has been asked about interrupted saves yet.
+        self.checked_journals = False
+
+        # The undo and redo history of tag edits, which is kept on disk across sessions.
+        self.history = edit_history.EditHistory()
+
         # Call super after initializing member variables as super calls self.create() and we do not want to overwrite.
         super().__init__(*args, **keywords)
 
     def create(self):
         """Called when the form's widgets should be initialized and added."""
 
+        # Several folders can be opened at once by separating them with os.pathsep (":" on Unix, ";" on Windows).
         self.folder_input = self.add(npyscreen.TitleFilename, name="Enter folder using the tab key for auto-complete:",
                                      use_two_lines=True, begin_entry_at=0)
         self.folder_input.set_value(os.getcwd())
@@ -218,13 +262,18 @@ class TrackEditorForm(npyscreen.FormBaseNew):
                                                 color=TrackEditorForm.BUTTON_COLOR)
         self.select_all_files_button.whenPressed = self.select_all_files
 
+        self.query_input = self.add(npyscreen.TitleText, name="Select Query:", use_two_lines=False, begin_entry_at=17)
+        self.query_button = self.add(npyscreen.ButtonPress, name="[Select Matching Files]", relx=18,
+                                     color=TrackEditorForm.BUTTON_COLOR)
+        self.query_button.whenPressed = self.select_matching_files
+
         self.nextrely += 1
 
         self.fields.add(Field("Title:", False, "get_title", "set_title", self))
         self.fields.add(Field("Artist:", False, "get_artist", "set_artist", self))
         self.fields.add(Field("Album Artist:", False, "get_album_artist", "set_album_artist", self))
         self.fields.add(Field("Album:", False, "get_album", "set_album", self))
-        self.fields.add(Field("Genre:", False, "get_genre", "set_genre", self))
+        self.fields.add(Field("Genre:", False, "get_genre", "set_genre", self, genre_utils.normalise_genre))
         self.fields.add(Field("Year:", False, "get_year", "set_year", self))
         self.fields.add(Field("Track:", False, "get_track", "set_track", self))
         self.fields.add(Field("Comment:", False, "get_comments", "add_comment", self))
@@ -234,13 +283,24 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         self.save_button.whenPressed = self.save_entries_to_tracks
         self.rename_button = self.add(npyscreen.ButtonPress, name="[Rename Files Based On Tags]", color=TrackEditorForm.BUTTON_COLOR)
         self.rename_button.whenPressed = self.rename_files
+        self.number_button = self.add(npyscreen.ButtonPress, name="[Auto Number Tracks]",
+                                      color=TrackEditorForm.BUTTON_COLOR)
+        self.number_button.whenPressed = self.number_tracks
+        self.genre_button = self.add(npyscreen.ButtonPress, name="[Normalise Genres]",
+                                     color=TrackEditorForm.BUTTON_COLOR)
+        self.genre_button.whenPressed = self.normalise_genres
+        self.undo_button = self.add(npyscreen.ButtonPress, name="[Undo]", color=TrackEditorForm.BUTTON_COLOR)
+        self.undo_button.whenPressed = self.undo
+        self.redo_button = self.add(npyscreen.ButtonPress, name="[Redo]", relx=11, rely=self.undo_button.rely,
+                                    color=TrackEditorForm.BUTTON_COLOR)
+        self.redo_button.whenPressed = self.redo
 
         self.nextrely += 1
 
-        # TODO: Clean this search UI and code up. Launch a popup with a list of launchable image URLs to choose from.
+        # Leave the query empty to look up every selected album based on its tags.
         self.album_art_search_box = self.add(npyscreen.TitleText, name="Album Art Query:", use_two_lines=False,
                                              begin_entry_at=17)
-        self.search_button = self.add(npyscreen.ButtonPress, name="[Search]", relx=18,
+        self.search_button = self.add(npyscreen.ButtonPress, name="[Find Album Art]", relx=18,
                                       color=TrackEditorForm.BUTTON_COLOR)
         self.search_button.whenPressed = self.lookup_album_art
 
@@ -250,8 +310,42 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         # self.debug_button = self.add(npyscreen.ButtonPress, name="[Debug]", color=TrackEditorForm.BUTTON_COLOR)
         # self.debug_button.whenPressed = self.debug
 
+    def beforeEditing(self):
+        """Called by npyscreen before the form is edited. Load the album art sizes found by earlier runs and offer to
+        finish or discard any batch of saves that was interrupted or failed.
+        """
+
+        if self.checked_journals:
+            return
+        self.checked_journals = True
+
+        # There are no sizes to load on the first run.
+        try:
+            album_art_utils.load_resolved_sizes()
+        except (IOError, ValueError):
+            pass
+
+        for journal in save_journal.find_unfinished_journals():
+            try:
+                file_count = len(journal.get_pending())
+                if journal.has_failures():
+                    (message, title) = ("Saving {} file(s) failed last time. Try saving them again now?".format(
+                        file_count), "Failed Save")
+                else:
+                    (message, title) = ("Saving {} file(s) was interrupted. Finish saving them now?".format(
+                        file_count), "Interrupted Save")
+
+                if npyscreen.notify_yes_no(message, title):
+                    self.show_save_failures(batch_utils.resume_assignments(journal))
+                elif npyscreen.notify_yes_no("Discard these saves for good? The file(s) keep their current tags. "
+                                             "Choose No to be asked again next time.", title):
+                    batch_utils.discard_assignments(journal)
+            except IOError as error:
+                npyscreen.notify_confirm("Unable to finish saving. " + str(error), "Error", wide=True)
+
     def format_file_list_line(self, line):
-        """A formatter run on each line of the file list. Shortens each file path down to its base name.
+        """A formatter run on each line of the file list. Shortens each file path down to its base name, keeping the
+        name of its folder if more than one folder is open.
 
         :param line: The unformatted line.
         :type line: str
@@ -260,10 +354,12 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         :rtype str
         """
 
-        return os.path.basename(line)
+        return self.workspace.get_display_name(line)
 
     def update_file_list(self):
-        """Update the file list based on the selected folder."""
+        """Update the file list based on the selected folders. Folders that were opened before are only scanned for
+        new, changed, and removed files, and keep the tracks already loaded from unchanged files.
+        """
 
         # Simply calling self.file_list.set_values() to refresh the list while files are already present causes
         # weird selection issues. I think this may be an issue with the npyscreen module. Manually clear selection to
@@ -280,15 +376,28 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         self.selected_mp3_tracks.clear()
 
         if self.folder_input.get_value() is not None:
-            mp3_files = get_mp3_files(self.folder_input.get_value())
+            folders = [folder for folder in self.folder_input.get_value().split(os.pathsep) if folder.strip()]
+            scan_failures = self.workspace.open(folders)
+            if len(scan_failures) > 0:
+                error_string = "Unable to open the following folder(s):\n- "
+                error_string += '\n- '.join("{}: {}".format(folder, error) for (folder, error) in scan_failures)
+                npyscreen.notify_confirm(error_string, "Error", wide=True)
+
+            file_failures = self.workspace.get_scan_errors()
+            if len(file_failures) > 0:
+                error_string = "Unable to read the following file(s):\n- "
+                error_string += '\n- '.join("{}: {}".format(file_path, error) for (file_path, error) in file_failures)
+                npyscreen.notify_confirm(error_string, "Error", wide=True)
+
+            music_files = self.workspace.get_file_paths()
 
-            # Use the filenames are values rather than MP3Tracks. If the folder has a large number of MP3 files and the
-            # user does not want to edit them all, creating MP3Tracks for each file could be needlessly expensive.
-            self.file_list.set_values(mp3_files)
+            # Use the file paths as values rather than tracks. If the folder has a large number of music files and the
+            # user does not want to edit them all, creating tracks for each file could be needlessly expensive.
+            self.file_list.set_values(music_files)
             self.file_list.update()
 
-            if len(mp3_files) == 0:
-                npyscreen.notify_confirm("No MP3 files found in selected folder.", "Error")
+            if len(music_files) == 0:
+                npyscreen.notify_confirm("No music files found in selected folder.", "Error")
                 self.set_list_and_editor_visibility(False)
                 return
             else:
@@ -305,8 +414,14 @@ class TrackEditorForm(npyscreen.FormBaseNew):
 
         self.file_list.hidden = hidden
         self.select_all_files_button.hidden = hidden
+        self.query_input.hidden = hidden
+        self.query_button.hidden = hidden
         self.save_button.hidden = hidden
         self.rename_button.hidden = hidden
+        self.number_button.hidden = hidden
+        self.genre_button.hidden = hidden
+        self.undo_button.hidden = hidden
+        self.redo_button.hidden = hidden
         self.album_art_search_box.hidden = hidden
         self.search_button.hidden = hidden
         for field in self.fields:
@@ -322,20 +437,194 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         # Manually setting the values does not trigger the listener so call it directly.
         self.on_file_list_selection_change()
 
+    def select_matching_files(self):
+        """Select all files in the file list whose tags match the query in the query input.
+
+        See TrackIndex for the query syntax.
+        """
+
+        file_paths = self.file_list.entry_widget.values
+
+        # Every file was indexed when its folder was opened.
+        try:
+            matching_file_paths = self.workspace.query(self.query_input.get_value() or "")
+        except ValueError as error:
+            npyscreen.notify_confirm(str(error), "Error")
+            return
+
+        self.file_list.value = [i for (i, file_path) in enumerate(file_paths) if file_path in matching_file_paths]
+
+        # Manually setting the values does not trigger the listener so call it directly.
+        self.on_file_list_selection_change()
+
+    def get_track(self, file_path):
+        """Get the track for a file, creating it with the track class for its format and indexing it if it has not been
+        loaded yet. Tracks are kept by the workspace, so they survive opening other folders.
+
+        :param file_path: The path of the file.
+        :type file_path: str
+
+        :returns: The track for the file.
+        :rtype: MP3Track or MusicTrack
+        """
+
+        return self.workspace.get_track(file_path)
+
     def save_entries_to_tracks(self):
-        """Apply selected editor field values to selected tracks and save each file."""
+        """Apply selected editor field values to selected tracks and save them all in one journaled batch."""
 
-        for track in self.selected_mp3_tracks:
-            for field in self.fields:
-                if field.is_selected():
-                    field.apply_value_to_track(track)
+        field_assignments = dict(field.get_assignment() for field in self.fields if field.is_selected())
+        assignments = {track.get_file_path(): field_assignments for track in self.selected_mp3_tracks}
+
+        before = self.capture_history()
+        try:
+            failures = batch_utils.save_assignments(assignments, self.workspace.get_loaded_tracks())
+        except IOError as error:
+            npyscreen.notify_confirm("Unable to write save journal: {}".format(error), "Error")
+            return
+
+        self.show_save_failures(failures)
+        self.record_history("Save Tags", before, failures)
+
+        self.workspace.update_index(self.selected_mp3_tracks)
+
+    def number_tracks(self):
+        """Number the selected tracks album by album based on their existing track numbers and save them."""
+
+        if len(self.selected_mp3_tracks) == 0:
+            npyscreen.notify_confirm("No files selected to number.", "Error")
+            return
+
+        before = self.capture_history()
+        failures = batch_utils.apply_track_numbers(self.selected_mp3_tracks)
+        self.show_save_failures(failures)
+        self.record_history("Auto Number Tracks", before, failures)
+
+        self.workspace.update_index(self.selected_mp3_tracks)
+
+        # Refresh the fields to show the new track numbers.
+        self.on_file_list_selection_change()
+
+    def normalise_genres(self):
+        """Rewrite the genres of the selected tracks as genre names, saving only the tracks that change."""
+
+        if len(self.selected_mp3_tracks) == 0:
+            npyscreen.notify_confirm("No files selected to normalise.", "Error")
+            return
+
+        before = self.capture_history()
+        (changed_tracks, failures) = genre_utils.normalise_genres(self.selected_mp3_tracks)
+        self.show_save_failures(failures)
+        self.record_history("Normalise Genres", before, failures)
+
+        self.workspace.update_index(changed_tracks)
+
+        self.on_file_list_selection_change()
+
+    def capture_history(self):
+        """Capture the frames of the selected tracks before an edit, to pass to record_history() after it.
+
+        :returns: The captured frames, or None if they could not be written to the undo history.
+        :rtype: FrameCapture or None
+        """
+
+        try:
+            return self.history.capture(self.selected_mp3_tracks)
+        except IOError as error:
+            npyscreen.notify_confirm("Unable to write undo history: {}".format(error), "Error")
+            return None
+
+    def record_history(self, description, before, failures):
+        """Record an edit of the selected tracks in the undo history.
+
+        :param description: A short description of the edit.
+        :type description: str
+
+        :param before: The frames of the selected tracks captured before the edit, or None if they could not be.
+        :type before: FrameCapture or None
+
+        :param failures: The (track or file path, exception) tuples of tracks that failed to save.
+        :type failures: list
+        """
+
+        if before is None:
+            return
+
+        try:
+            self.history.record(description, before, self.selected_mp3_tracks, failures)
+        except IOError as error:
+            npyscreen.notify_confirm("Unable to write undo history: {}".format(error), "Error")
+
+    def undo(self):
+        """Undo the last edit, even one made in an earlier session, and refresh the fields."""
+
+        if not self.history.can_undo():
+            npyscreen.notify_confirm("Nothing to undo.", "Error")
+            return
+
+        if npyscreen.notify_yes_no("Undo {}?".format(self.history.get_undo_description()), "Undo"):
+            self.apply_history(self.history.undo, self.history.get_undo_missing_files)
+
+    def redo(self):
+        """Redo the last undone edit and refresh the fields."""
+
+        if not self.history.can_redo():
+            npyscreen.notify_confirm("Nothing to redo.", "Error")
+            return
 
-            track.save_tag()
+        if npyscreen.notify_yes_no("Redo {}?".format(self.history.get_redo_description()), "Redo"):
+            self.apply_history(self.history.redo, self.history.get_redo_missing_files)
+
+    def apply_history(self, step, get_missing_files):
+        """Undo or redo an edit, updating the tracks that are loaded and reindexing them. If any of the edited files no
+        longer exist, offer to skip them so the rest of the edit can be undone or redone.
+
+        :param step: Either self.history.undo or self.history.redo.
+        :type step: callable
+
+        :param get_missing_files: Either self.history.get_undo_missing_files or self.history.get_redo_missing_files.
+        :type get_missing_files: callable
+        """
+
+        try:
+            missing_file_paths = get_missing_files()
+            skip_missing = False
+            if len(missing_file_paths) > 0:
+                message = "The following file(s) no longer exist:\n- " + "\n- ".join(missing_file_paths)
+                message += ("\n\nSkip them? Otherwise, the other files are still changed, but the edit can only be "
+                            "finished once the missing files are back.")
+                skip_missing = npyscreen.notify_yes_no(message, "Missing Files", wide=True)
+
+            failures = step(self.workspace.get_loaded_tracks(), skip_missing=skip_missing)
+        except IOError as error:
+            npyscreen.notify_confirm("Unable to read undo history: {}".format(error), "Error")
+            return
+
+        self.show_save_failures(failures)
+
+        self.workspace.update_index(self.workspace.get_loaded_tracks().values())
+
+        self.on_file_list_selection_change()
+
+    def show_save_failures(self, failures):
+        """Show an error message listing tracks that failed to save, if there are any.
+
+        :param failures: A list of (track, exception) tuples as returned by batch_utils.save_tracks(), or of (file path,
+            exception) tuples as returned by batch_utils.save_assignments().
+        :type failures: list
+        """
+
+        if len(failures) > 0:
+            error_string = "Unable to save the following file(s):\n- "
+            error_string += '\n- '.join(
+                "{}: {}".format(track if isinstance(track, str) else track.get_file_path(), error)
+                for (track, error) in failures)
+            npyscreen.notify_confirm(error_string, "Error", wide=True)
 
     def rename_files(self):
         """Rename the selected files based on their saved tag information.
 
-        The files are saved in the form: "<artist> - <album> - <title>.mp3"
+        The files are saved in the form: "<artist> - <album> - <title>.<extension>", keeping their extension.
         """
 
         selected_file_paths = self.file_list.get_selected_objects()
@@ -347,7 +636,7 @@ class TrackEditorForm(npyscreen.FormBaseNew):
             files_already_exist = []
 
             for file_path in selected_file_paths:
-                track = self.mp3_tracks[file_path]
+                track = self.get_track(file_path)
                 artist = track.get_artist()
                 album = track.get_album()
                 title = track.get_title()
@@ -363,7 +652,7 @@ class TrackEditorForm(npyscreen.FormBaseNew):
                 new_base_filename = ""
 
                 if len(file_name_info) > 0:
-                    new_base_filename = ' - '.join(file_name_info) + ".mp3"
+                    new_base_filename = ' - '.join(file_name_info) + os.path.splitext(file_path)[1]
                 else:
                     # If there isn't enough metadata to create a filename, keep track of the file for an error later.
                     files_not_enough_info.append(file_path)
@@ -380,10 +669,8 @@ class TrackEditorForm(npyscreen.FormBaseNew):
                     files_already_exist.append(file_path)
                     continue
 
-                # The filename has changed, so the keys in the filename => MP3Track map must be updated.
-                del self.mp3_tracks[file_path]
-                # To be consistent, make sure to key on the entire path, not just the new base filename.
-                self.mp3_tracks[track.get_file_path()] = track
+                # The filename has changed, so the workspace must move the track to its new path.
+                self.workspace.rename_track(file_path, track)
 
             # Construct and show an error message if necessary.
             error_string = ""
@@ -415,35 +702,62 @@ class TrackEditorForm(npyscreen.FormBaseNew):
         else:
             # For each selected file, create an MP3Track wrapper if one has not already been created.
             for file_path in selected_file_paths:
-                if file_path not in self.mp3_tracks:
-                    self.mp3_tracks[file_path] = MP3Track(file_path)
-
-                self.selected_mp3_tracks.add(self.mp3_tracks.get(file_path))
+                self.selected_mp3_tracks.add(self.get_track(file_path))
 
         for field in self.fields:
             field.update_value_from_tracks(self.selected_mp3_tracks)
 
     def lookup_album_art(self):
-        # TODO: Document this once I figure out what this method is going to do exactly.
+        """Find album art for the selected tracks and apply the best match without asking.
+
+        If the album art query is empty, the selected tracks are grouped into albums and each album is looked up based
+        on its album artist and album. Otherwise, the query is used to look up art for all selected tracks as one album.
+        Either way, art is only applied if the best result scores at least album_art_utils.DEFAULT_MIN_SCORE.
+        """
+
+        if len(self.selected_mp3_tracks) == 0:
+            npyscreen.notify_confirm("No files selected to find album art for.", "Error")
+            return
+
+        # Imported here rather than at startup as it is slow to import. Looking up album art imports it anyway.
+        import requests
 
-        album_art_urls = album_art_utils.fetch_album_art(self.album_art_search_box.get_value())
+        query = self.album_art_search_box.get_value()
+        before = self.capture_history()
 
-        # For now, just launch the five first hits.
-        for i in range(5):
-            if i < len(album_art_urls):
-                webbrowser.open_new_tab(album_art_urls[i])
+        try:
+            if query:
+                # Rank against what was typed rather than the tags, which may be what the query is working around.
+                ranked_results = album_art_utils.rank_album_art(album_art_utils.fetch_album_art_results(query), "",
+                                                                query, resolve_ties=True)
+                if len(ranked_results) == 0 or ranked_results[0][0] < album_art_utils.DEFAULT_MIN_SCORE:
+                    npyscreen.notify_confirm("No album art found that matches query: " + query, "Error")
+                    return
+
+                failures = album_art_utils.apply_album_art(self.selected_mp3_tracks, ranked_results[0][1])
+                unmatched_albums = []
             else:
-                break
+                (unmatched_albums, failures) = album_art_utils.tag_album_art(self.selected_mp3_tracks)
+        except (requests.RequestException, ValueError) as error:
+            npyscreen.notify_confirm("Unable to add album art. " + str(error), "Error", wide=True)
+            return
+
+        # The sizes are only a cache, so failing to keep them for the next run is not worth reporting.
+        try:
+            album_art_utils.save_resolved_sizes()
+        except IOError:
+            pass
+
+        self.show_save_failures(failures)
+        self.record_history("Find Album Art", before, failures)
+
+        if len(unmatched_albums) > 0:
+            error_string = "Unable to find album art for the following album(s):\n- "
+            error_string += '\n- '.join(album_tracks[0].get_album() or os.path.basename(album_tracks[0].get_file_path())
+                                         for album_tracks in unmatched_albums)
+            npyscreen.notify_confirm(error_string, "Error", wide=True)
 
-        # TODO: Eventually apply a chosen URL all of the selected tracks.
-        # try:
-        #     track.clear_pictures()
-        #     track.add_picture_from_url(chosen_album_art_url)
-        #     track.save_tag()
-        # except (ValueError, URLError) as error:
-        #             print("Error: Unable to add album art. " + error.message)
-        # else:
-        #     print("Error: Unable to find album art.")
+        self.workspace.update_index(self.selected_mp3_tracks)
 
     def adjust_widgets(self):
         """This method can be overloaded by derived classes. It is called when editing any widget, as opposed to the
@@ -460,7 +774,7 @@ class TrackEditorForm(npyscreen.FormBaseNew):
     def debug(self):
         """Fired when the debug button is pressed."""
         file = open("debug", "w+")
-        file.write(("\n".join(list(self.mp3_tracks.keys()))))
+        file.write(("\n".join(list(self.workspace.get_loaded_tracks().keys()))))
         file.close()
 
 
@@ -3,9 +3,8 @@ import file_utils
 import os
 import re
 from urllib.error import URLError
-from urllib.request import urlopen
 from mutagenx._id3util import ID3NoHeaderError
-from mutagenx.id3 import ID3, COMM, TIT2, TPE1, TALB, TCON, TDRC, TRCK, TPE2, TCMP, APIC
+from mutagenx.id3 import ID3, Frames, COMM, TIT2, TPE1, TALB, TCON, TDRC, TRCK, TPE2, TCMP, APIC, TXXX
 
 
 class MP3Track:
@@ -25,11 +24,30 @@ class MP3Track:
     _KEY_COMPILATION = "TCMP"
     _KEY_COMMENT = "COMM"
     _KEY_PICTURE = "APIC"
+    _KEY_USER_TEXT = "TXXX"
+
+    # The description of the user defined text frame that holds the audio checksum.
+    _AUDIO_CHECKSUM_DESCRIPTION = "AUDIO_CHECKSUM"
+
+    def __init__(self, path, create_tag=True):
+        """Load the ID3 tag of an MP3 file.
+
+        :param path: The path to the MP3 file.
+        :type path: str
+
+        :param create_tag: True to write a blank tag to the file if it has none, false to leave the file untouched and
+            start with an empty tag in memory. Defaults to True.
+        :type create_tag: bool
+        """
 
-    def __init__(self, path):
         try:
             self._id3 = ID3(path)
         except ID3NoHeaderError:
+            if not create_tag:
+                self._id3 = ID3()
+                self._id3.filename = path
+                return
+
             # If there is no ID3 tag already, just create one by saving a blank title tag.
             self._id3 = ID3()
             self._id3.add(TIT2())
@@ -244,6 +262,15 @@ class MP3Track:
         # Clear all picture frames (no pun intended).
         self._delete_frames(MP3Track._KEY_PICTURE)
 
+    def has_picture(self):
+        """Get whether or not this track has a picture.
+
+        :returns: True if the track has at least one picture, false otherwise.
+        :rtype: bool
+        """
+
+        return len(self._get_frames(MP3Track._KEY_PICTURE)) > 0
+
     def add_picture_from_file(self, path, clear_existing_pictures=True):
         """ Add a picture (more specifically an album cover) from a file.
 
@@ -293,6 +320,9 @@ class MP3Track:
         if not mime_type in ["image/png", "image/jpeg"]:
             raise ValueError("Picture mime type must be either image/png or image/jpeg.")
 
+        # Imported here as it pulls in the HTTP client, which nothing else needs.
+        from urllib.request import urlopen
+
         try:
             with urlopen(url) as file:
                 # A type of 3 refers to the album front cover.
@@ -300,6 +330,51 @@ class MP3Track:
         except URLError:
             raise URLError("Unable to read url into tag: " + url)
 
+    def add_picture_from_data(self, data, mime_type, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from image data that has already been read.
+
+        This is useful when applying the same picture to many tracks, so it only has to be read or downloaded once.
+
+        :param data: The image data.
+        :type data: bytes
+
+        :param mime_type: The mime type of the image data.
+        :type mime_type: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        """
+
+        if not mime_type in ["image/png", "image/jpeg"]:
+            raise ValueError("Picture mime type must be either image/png or image/jpeg.")
+
+        # There may already be a multiple picture frames. Delete them if it is requested.
+        if clear_existing_pictures:
+            self.clear_pictures()
+
+        # A type of 3 refers to the album front cover.
+        self._id3.add(APIC(encoding=3, mime=mime_type, type=3, desc="Front Cover", data=data))
+
+    def set_audio_checksum(self, checksum):
+        """Set the checksum of the audio data, which is used to verify that tag edits never corrupt the audio.
+
+        :param checksum: The checksum of form "<algorithm>:<hex digest>".
+        :type checksum: str
+        """
+
+        self._id3.add(TXXX(encoding=3, desc=MP3Track._AUDIO_CHECKSUM_DESCRIPTION, text=checksum))
+
+    def get_audio_checksum(self):
+        """Get the stored checksum of the audio data.
+
+        :returns: The checksum of form "<algorithm>:<hex digest>" or None if no checksum is stored.
+        :rtype: str or None
+        """
+
+        return self._get_frames_text(MP3Track._KEY_USER_TEXT + ":" + MP3Track._AUDIO_CHECKSUM_DESCRIPTION)
+
     def clear_tag(self):
         """Clear all metadata from the ID3 tag.
 
@@ -315,9 +390,15 @@ class MP3Track:
         # we are left with a cleared ID3 tag.
         self._id3.add(TIT2())
 
-    def save_tag(self):
-        """Save all changes to file."""
-        self._id3.save()
+    def save_tag(self, path=None):
+        """Save all changes to file.
+
+        :param path: The file to save to instead of this track's own file, which must hold a copy of it. Defaults to
+            None, which saves to this track's own file.
+        :type path: str or None
+        """
+
+        self._id3.save(path)
 
     def get_file_path(self):
         """Get the file path for this track.
@@ -351,6 +432,32 @@ class MP3Track:
         # Reload ID3 object so its filename attribute is up to date.
         self._id3.load(new_path)
 
+    def get_frames(self):
+        """Get every frame of the tag in an encoded form that can be compared, stored, and restored with set_frames().
+
+        :returns: A map of frame hash keys to encoded frames.
+        :rtype: dict
+        """
+
+        return {key: _encode_frame(frame) for (key, frame) in self._id3.items()}
+
+    def set_frames(self, frames):
+        """Replace or delete frames with frames encoded by get_frames().
+
+        A save is still necessary for this change to persist.
+
+        :param frames: A map of frame hash keys to encoded frames, or to None to delete the frame.
+        :type frames: dict
+        """
+
+        for (key, encoded_frame) in frames.items():
+            if encoded_frame is None:
+                if key in self._id3:
+                    del self._id3[key]
+                continue
+
+            self._id3[key] = _decode_frame(self._id3, encoded_frame)
+
     def _get_frames_text(self, identifier):
         """Get the text from all frames with a given frame identifier (frame type) as one string.
 
@@ -409,6 +516,40 @@ class MP3Track:
     def __str__(self):
         return self._id3.pprint()
 
+
+# mutagenx has no public way to turn a frame into bytes and back, so the two functions below use its private
+# Frame._writeData() and Frame.fromData(). They are the only code that does, and they are written against mutagenx 1.23
+# as pinned in requirements.txt. Check them whenever mutagenx is upgraded.
+
+def _encode_frame(frame):
+    """Encode a frame as its frame class name and its data without a frame header.
+
+    :param frame: The frame.
+    :type frame: Frame
+
+    :returns: The encoded frame.
+    :rtype: bytes
+    """
+
+    return type(frame).__name__.encode("ascii") + b":" + frame._writeData()
+
+
+def _decode_frame(id3, encoded_frame):
+    """Decode a frame encoded by _encode_frame().
+
+    :param id3: The tag the frame is for, which gives the ID3 version to decode with.
+    :type id3: ID3
+
+    :param encoded_frame: The encoded frame.
+    :type encoded_frame: bytes
+
+    :returns: The frame.
+    :rtype: Frame
+    """
+
+    (frame_id, _, data) = encoded_frame.partition(b":")
+    return Frames[frame_id.decode("ascii")].fromData(id3, 0, data)
+
 if __name__ == "__main__":
     song = MP3Track("/Users/stephen/Downloads/song.mp3")
 
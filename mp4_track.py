@@ -0,0 +1,119 @@
+from mutagenx.mp4 import MP4, MP4Cover
+from music_track import MusicTrack
+
+
+class MP4Track(MusicTrack):
+    """An MP4 (M4A, M4B) wrapper that allows for the reading and writing of its iTunes metadata atoms."""
+
+    _KEY_TITLE = "\xa9nam"
+    _KEY_ARTIST = "\xa9ART"
+    _KEY_ALBUM_ARTIST = "aART"
+    _KEY_ALBUM = "\xa9alb"
+    _KEY_GENRE = "\xa9gen"
+    _KEY_YEAR = "\xa9day"
+    _KEY_TRACK = "trkn"
+    _KEY_COMPILATION = "cpil"
+    _KEY_COMMENT = "\xa9cmt"
+    _KEY_PICTURE = "covr"
+
+    # Freeform atoms hold raw bytes, which MusicTrack decodes as UTF-8 when reading.
+    _KEY_AUDIO_CHECKSUM = "----:com.apple.iTunes:AUDIO_CHECKSUM"
+
+    _COVER_FORMATS = {"image/png": MP4Cover.FORMAT_PNG, "image/jpeg": MP4Cover.FORMAT_JPEG}
+
+    def set_part_of_compilation(self, is_part):
+        """ Set whether or not this track is part of a compilation.
+
+        :param is_part: True to set the track as part of a compilation, false otherwise.
+        :type is_part: bool
+        """
+
+        self._file.tags[MP4Track._KEY_COMPILATION] = bool(is_part)
+
+    def get_part_of_compilation(self):
+        """Get whether ot not this track is part of a compilation.
+
+        :returns: True if the track is part of a compilation, false otherwise
+        :rtype: bool
+        """
+
+        return bool(self._file.tags.get(MP4Track._KEY_COMPILATION, False))
+
+    def clear_pictures(self):
+        """Clear all pictures."""
+
+        self._delete(MP4Track._KEY_PICTURE)
+
+    def has_picture(self):
+        """Get whether or not this track has a picture.
+
+        :returns: True if the track has at least one picture, false otherwise.
+        :rtype: bool
+        """
+
+        return len(self._file.tags.get(MP4Track._KEY_PICTURE, [])) > 0
+
+    def add_picture_from_data(self, data, mime_type, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from image data that has already been read.
+
+        :param data: The image data.
+        :type data: bytes
+
+        :param mime_type: The mime type of the image data.
+        :type mime_type: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        """
+
+        if not mime_type in MP4Track._COVER_FORMATS:
+            raise ValueError("Picture mime type must be either image/png or image/jpeg.")
+
+        covers = [] if clear_existing_pictures else list(self._file.tags.get(MP4Track._KEY_PICTURE, []))
+        covers.append(MP4Cover(data, MP4Track._COVER_FORMATS[mime_type]))
+        self._file.tags[MP4Track._KEY_PICTURE] = covers
+
+    def set_audio_checksum(self, checksum):
+        """Set the checksum of the audio data, which is used to verify that tag edits never corrupt the audio.
+
+        :param checksum: The checksum of form "<algorithm>:<hex digest>".
+        :type checksum: str
+        """
+
+        self._file.tags[MP4Track._KEY_AUDIO_CHECKSUM] = [checksum.encode("utf8")]
+
+    def _load(self, path):
+        return MP4(path)
+
+    def _encode_bytes(self, data):
+        item = super()._encode_bytes(data)
+        if isinstance(data, MP4Cover):
+            item["imageformat"] = data.imageformat
+
+        return item
+
+    def _decode_bytes(self, item):
+        data = super()._decode_bytes(item)
+        if "imageformat" in item:
+            return MP4Cover(data, item["imageformat"])
+
+        return data
+
+    def _get_track_numbers(self):
+        # Track numbers are stored as a list holding one (number, total) tuple, where 0 means not set.
+        track_numbers = self._file.tags.get(MP4Track._KEY_TRACK)
+        if not track_numbers:
+            return (None, None)
+
+        (number, total) = track_numbers[0]
+
+        return (str(number) if number else None, str(total) if total else None)
+
+    def _set_track_numbers(self, number, total):
+        if not number and not total:
+            self._delete(MP4Track._KEY_TRACK)
+            return
+
+        self._file.tags[MP4Track._KEY_TRACK] = [(int(number or 0), int(total or 0))]
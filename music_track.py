@@ -0,0 +1,540 @@
+import base64
+import json
+import mimetypes
+import os
+import re
+from abc import ABC, abstractmethod
+from urllib.error import URLError
+import file_utils
+
+
+class MusicTrack(ABC):
+    """A base for tracks whose tags are a mapping of keys to lists of text values, as is the case for every format
+    mutagenx supports except ID3. Subclasses give the keys to use and the format specific parts.
+
+    Every track, whatever its format, has the same getter and setter methods as MP3Track, so the editor and the batch
+    utilities never need to know what format a file is in.
+    """
+
+    # Subclasses set these to the keys of their format.
+    _KEY_TITLE = None
+    _KEY_ARTIST = None
+    _KEY_ALBUM_ARTIST = None
+    _KEY_ALBUM = None
+    _KEY_GENRE = None
+    _KEY_YEAR = None
+    _KEY_COMMENT = None
+    _KEY_AUDIO_CHECKSUM = None
+
+    def __init__(self, path, create_tag=True):
+        """Load the tag of a music file.
+
+        :param path: The path to the music file.
+        :type path: str
+
+        :param create_tag: Accepted for compatibility with MP3Track. Files of these formats are never written to when
+            loading. A file without a tag starts with an empty tag in memory, which is written on the next save.
+        :type create_tag: bool
+        """
+
+        self._file = self._load(path)
+        if self._file.tags is None:
+            self._file.add_tags()
+
+    def set_title(self, title):
+        """Set the title.
+
+        :param title: The title to set.
+        :type title: str
+        """
+
+        self._set_text(self._KEY_TITLE, title)
+
+    def get_title(self):
+        """Get the title.
+
+        :returns: The title.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_TITLE)
+
+    def set_artist(self, artist):
+        """Set the artist.
+
+        :param artist: The artist to set.
+        :type artist: str
+        """
+
+        self._set_text(self._KEY_ARTIST, artist)
+
+    def get_artist(self):
+        """Get the artist.
+
+        :returns: The artist.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_ARTIST)
+
+    def set_album_artist(self, album_artist):
+        """Set the album artist.
+
+        :param album_artist: The album artist to set.
+        :type album_artist: str
+        """
+
+        self._set_text(self._KEY_ALBUM_ARTIST, album_artist)
+
+    def get_album_artist(self):
+        """Get the album artist.
+
+        :returns: The album artist.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_ALBUM_ARTIST)
+
+    def set_album(self, album):
+        """Set the album.
+
+        :param album: The album to set.
+        :type album: str
+        """
+
+        self._set_text(self._KEY_ALBUM, album)
+
+    def get_album(self):
+        """Get the album.
+
+        :returns: The album.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_ALBUM)
+
+    def set_genre(self, genre):
+        """Set the genre.
+
+        :param genre: The genre to set.
+        :type genre: str
+        """
+
+        self._set_text(self._KEY_GENRE, genre)
+
+    def get_genre(self):
+        """Get the genre.
+
+        :returns: The genre.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_GENRE)
+
+    def set_year(self, year):
+        """Set the year.
+
+        :param year: The year to set.
+        :type year: str
+
+        :raise ValueError: Incorrect year format.
+        """
+
+        if re.match("^[0-9]{4}$", year):
+            self._set_text(self._KEY_YEAR, year)
+        else:
+            raise ValueError("Year must be of the form \"YYYY\".")
+
+    def get_year(self):
+        """Get the year.
+
+        :returns: The year.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_YEAR)
+
+    def set_track(self, track):
+        """ Set the track number and total track count.
+
+        :param track: Track information of form "<track_number>", "<track_number>/<total_tracks>", or "/<total_tracks>."
+        :type track: str
+
+        :raise ValueError: Incorrect track format.
+        """
+
+        if not re.match("^[0-9]*/[0-9]*$", track):
+            raise ValueError("Track must be of the form \"^[0-9]*/[0-9]*.\"")
+
+        (number, _, total) = track.partition("/")
+        self._set_track_numbers(number, total)
+
+    def get_track(self):
+        """Get the track number and total track count.
+
+        :returns: Track information of form "<track_number>", "<track_number>/<total_tracks>", or "/<total_tracks>."
+        :rtype: str
+        """
+
+        (number, total) = self._get_track_numbers()
+        if not number and not total:
+            return None
+        if not total:
+            return number
+
+        return (number or "") + "/" + total
+
+    @abstractmethod
+    def set_part_of_compilation(self, is_part):
+        """ Set whether or not this track is part of a compilation.
+
+        :param is_part: True to set the track as part of a compilation, false otherwise.
+        :type is_part: bool
+        """
+
+    @abstractmethod
+    def get_part_of_compilation(self):
+        """Get whether ot not this track is part of a compilation.
+
+        :returns: True if the track is part of a compilation, false otherwise
+        :rtype: bool
+        """
+
+    def clear_comments(self):
+        """Clear all comments."""
+
+        self._delete(self._KEY_COMMENT)
+
+    def add_comment(self, comment, key="comment_key", clear_existing_comments=True):
+        """ Add a comment.
+
+        :param comment: A comment.
+        :type comment: str
+
+        :param key: Accepted for compatibility with MP3Track. Comments in these formats have no key.
+        :type key: str
+
+        :param clear_existing_comments: True to clear all existing comments, false to keep them. Defaults to True.
+        :type clear_existing_comments: bool
+        """
+
+        comments = [] if clear_existing_comments else list(self._file.tags.get(self._KEY_COMMENT, []))
+        comments.append(comment)
+        self._file.tags[self._KEY_COMMENT] = comments
+
+    def get_comments(self):
+        """Get all comments.
+
+        :returns: All comments.
+        :rtype: str
+        """
+
+        return self._get_text(self._KEY_COMMENT)
+
+    @abstractmethod
+    def clear_pictures(self):
+        """Clear all pictures."""
+
+    @abstractmethod
+    def has_picture(self):
+        """Get whether or not this track has a picture.
+
+        :returns: True if the track has at least one picture, false otherwise.
+        :rtype: bool
+        """
+
+    def add_picture_from_file(self, path, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from a file.
+
+        :param path: The path to the picture file to set as the picture.
+        :type path: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        :raise IOError: Error opening file.
+        """
+
+        mime_type = mimetypes.guess_type(path)[0]
+
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except IOError:
+            raise IOError("Unable to read file into tag: " + path)
+
+        self.add_picture_from_data(data, mime_type, clear_existing_pictures)
+
+    def add_picture_from_url(self, url, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from a URL.
+
+        :param url: The url to the picture file to set as the picture.
+        :type url: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        :raise URLError: Error opening URL.
+        """
+
+        mime_type = mimetypes.guess_type(url)[0]
+
+        # Deferred so that runs which never download anything do not load the HTTP client.
+        from urllib.request import urlopen
+
+        try:
+            with urlopen(url) as file:
+                data = file.read()
+        except URLError:
+            raise URLError("Unable to read url into tag: " + url)
+
+        self.add_picture_from_data(data, mime_type, clear_existing_pictures)
+
+    @abstractmethod
+    def add_picture_from_data(self, data, mime_type, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from image data that has already been read.
+
+        :param data: The image data.
+        :type data: bytes
+
+        :param mime_type: The mime type of the image data.
+        :type mime_type: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        """
+
+    def set_audio_checksum(self, checksum):
+        """Set the checksum of the audio data, which is used to verify that tag edits never corrupt the audio.
+
+        :param checksum: The checksum of form "<algorithm>:<hex digest>".
+        :type checksum: str
+        """
+
+        self._set_text(self._KEY_AUDIO_CHECKSUM, checksum)
+
+    def get_audio_checksum(self):
+        """Get the stored checksum of the audio data.
+
+        :returns: The checksum of form "<algorithm>:<hex digest>" or None if no checksum is stored.
+        :rtype: str or None
+        """
+
+        return self._get_text(self._KEY_AUDIO_CHECKSUM)
+
+    def clear_tag(self):
+        """Clear all metadata from the tag.
+
+        A save is still necessary for this change to persist.
+        """
+
+        self._file.tags.clear()
+        self.clear_pictures()
+
+    def save_tag(self, path=None):
+        """Save all changes to file.
+
+        :param path: The file to save to instead of this track's own file, which must hold a copy of it. Defaults to
+            None, which saves to this track's own file.
+        :type path: str or None
+        """
+
+        self._file.save(path)
+
+    def get_file_path(self):
+        """Get the file path for this track.
+
+        :return: The file path for this track.
+        :rtype: str
+        """
+
+        return self._file.filename
+
+    def rename_file(self, new_base_filename):
+        """Renames this track's base filename.
+
+        :param new_base_filename: The base filename to rename this track to. Does not include prefix path.
+        :type new_base_filename: str
+
+        :raise FileExistsError: File with the same name already exists.
+        """
+
+        original_path = self._file.filename
+        prefix_path = os.path.dirname(original_path)
+        valid_filename = file_utils.ensure_valid_filename(new_base_filename)
+        new_path = os.path.join(prefix_path, valid_filename)
+
+        if os.path.exists(new_path):
+            raise FileExistsError("Cannot rename file. File with same name already exists.")
+
+        os.replace(original_path, new_path)
+
+        # Reload the file so its filename attribute is up to date.
+        self._file = self._load(new_path)
+        if self._file.tags is None:
+            self._file.add_tags()
+
+    def get_frames(self):
+        """Get every field of the tag in an encoded form that can be compared, stored, and restored with set_frames().
+
+        :returns: A map of keys to encoded field values.
+        :rtype: dict
+        """
+
+        return {key: self._encode_value(self._file.tags[key]) for key in self._file.tags.keys()}
+
+    def set_frames(self, frames):
+        """Replace or delete fields with values encoded by get_frames().
+
+        A save is still necessary for this change to persist.
+
+        :param frames: A map of keys to encoded field values, or to None to delete the field.
+        :type frames: dict
+        """
+
+        for (key, encoded_value) in frames.items():
+            if encoded_value is None:
+                self._delete(key)
+            else:
+                self._file.tags[key] = self._decode_value(encoded_value)
+
+    @abstractmethod
+    def _load(self, path):
+        """Load a file with the mutagenx class for this format.
+
+        :param path: The path to the file.
+        :type path: str
+
+        :returns: The loaded file.
+        :rtype: mutagenx.FileType
+        """
+
+    @abstractmethod
+    def _get_track_numbers(self):
+        """Get the track number and total track count as they are stored.
+
+        :returns: A tuple of the track number and total track count, each a string or None.
+        :rtype: tuple
+        """
+
+    @abstractmethod
+    def _set_track_numbers(self, number, total):
+        """Store the track number and total track count.
+
+        :param number: The track number, or an empty string for none.
+        :type number: str
+
+        :param total: The total track count, or an empty string for none.
+        :type total: str
+        """
+
+    def _get_text(self, key):
+        """Get all values of a key as one string.
+
+        :param key: The key.
+        :type key: str
+
+        :returns: All values joined with spaces, like MP3Track does with frames. None if the key has no values.
+        :rtype: str or None
+        """
+
+        values = self._file.tags.get(key)
+        if not values:
+            return None
+
+        return " ".join(value.decode("utf8", "replace") if isinstance(value, bytes) else str(value)
+                        for value in values).rstrip()
+
+    def _set_text(self, key, text):
+        """Replace all values of a key with a single value.
+
+        :param key: The key.
+        :type key: str
+
+        :param text: The value to set.
+        :type text: str
+        """
+
+        self._file.tags[key] = [text]
+
+    def _delete(self, key):
+        """Delete all values of a key.
+
+        :param key: The key.
+        :type key: str
+        """
+
+        if key in self._file.tags:
+            del self._file.tags[key]
+
+    def _encode_value(self, value):
+        """Encode a field value as canonical JSON, so that equal values always encode the same.
+
+        :param value: The value, a list of values, or a tuple of values. Values are strings, numbers, booleans, or
+            bytes.
+        :type value: object
+
+        :returns: The encoded value.
+        :rtype: bytes
+        """
+
+        def convert(item):
+            if isinstance(item, (list, tuple)):
+                return {"tuple" if isinstance(item, tuple) else "list": [convert(part) for part in item]}
+            if isinstance(item, bytes):
+                return self._encode_bytes(item)
+            return item
+
+        return json.dumps(convert(value), sort_keys=True, separators=(",", ":")).encode("utf8")
+
+    def _decode_value(self, encoded_value):
+        """Decode a field value encoded by _encode_value().
+
+        :param encoded_value: The encoded value.
+        :type encoded_value: bytes
+
+        :returns: The value.
+        :rtype: object
+        """
+
+        def convert(item):
+            if isinstance(item, dict):
+                if "list" in item:
+                    return [convert(part) for part in item["list"]]
+                if "tuple" in item:
+                    return tuple(convert(part) for part in item["tuple"])
+                return self._decode_bytes(item)
+            return item
+
+        return convert(json.loads(encoded_value.decode("utf8")))
+
+    def _encode_bytes(self, data):
+        """Encode a bytes value for _encode_value(). Subclasses with bytes values of other types extend this.
+
+        :param data: The bytes value.
+        :type data: bytes
+
+        :returns: A JSON serializable map.
+        :rtype: dict
+        """
+
+        return {"bytes": base64.b64encode(data).decode("ascii")}
+
+    def _decode_bytes(self, item):
+        """Decode a bytes value encoded by _encode_bytes().
+
+        :param item: The map returned by _encode_bytes().
+        :type item: dict
+
+        :returns: The bytes value.
+        :rtype: bytes
+        """
+
+        return base64.b64decode(item["bytes"])
+
+    def __str__(self):
+        return self._file.pprint()
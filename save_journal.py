@@ -0,0 +1,357 @@
+import glob
+import json
+import os
+import tempfile
+import file_utils
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock(). Nothing is locked there, so a batch running in another process looks interrupted.
+    fcntl = None
+
+# Where journals of bulk saves are kept while they run.
+JOURNAL_DIRECTORY = os.path.join(os.path.expanduser("~"), ".mp3_tagger", "journals")
+
+_JOURNAL_SUFFIX = ".jsonl"
+
+
+class SaveJournal:
+    """A write-ahead journal for one batch of saves.
+
+    Before anything is saved, the journal records every file in the batch with the field assignments to apply to it.
+    As files are saved, they are marked as saved. If the process dies part way, the journal is left behind and the
+    batch can be resumed with only the files that were not saved yet. A finished batch deletes its journal, and a batch
+    that finished with files that failed marks them as failed and keeps its journal so they can be retried.
+
+    The process running a batch owns its journal and holds an exclusive lock on it until the batch ends, so journals of
+    batches still running in other processes are never taken for interrupted ones. The lock goes away with the
+    process, however it dies.
+
+    The journal is a JSON lines file. Owner records are of the form {"owner": <process ID>} and are written whenever a
+    process takes over the batch. Intent records are of the form {"path": ..., "assignments": {...}}, saved records are
+    of the form {"saved": ...}, and failed records are of the form {"failed": [...]}.
+    """
+
+    def __init__(self, path):
+        """Open an existing journal without taking ownership of it. See acquire().
+
+        :param path: The path to the journal.
+        :type path: str
+        """
+
+        self.path = path
+
+        # The open journal file holding the lock while this process owns the journal, None otherwise.
+        self._lock_file = None
+
+    @classmethod
+    def create(cls, assignments, directory=JOURNAL_DIRECTORY):
+        """Create a journal for a new batch, owned by this process, and make it durable before returning.
+
+        :param assignments: A map of file paths to maps of setter method names to values. Values must be JSON
+            serializable.
+        :type assignments: dict
+
+        :param directory: The directory to create the journal in. Defaults to JOURNAL_DIRECTORY.
+        :type directory: str
+
+        :returns: The new journal.
+        :rtype: SaveJournal
+
+        :raise IOError: Error writing journal.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        (file_descriptor, path) = tempfile.mkstemp(prefix="save-", suffix=_JOURNAL_SUFFIX, dir=directory)
+
+        # Lock the journal before anything can find it, and keep it locked until the batch ends.
+        file = os.fdopen(file_descriptor, "w", encoding="utf8")
+        try:
+            try_lock(file)
+            file.write(json.dumps({"owner": os.getpid()}) + "\n")
+            for (file_path, file_assignments) in assignments.items():
+                file.write(json.dumps({"path": file_path, "assignments": file_assignments}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            file.close()
+            raise
+
+        sync_directories([directory])
+
+        journal = cls(path)
+        journal._lock_file = file
+
+        return journal
+
+    def acquire(self):
+        """Take ownership of the journal to resume or discard its batch.
+
+        :raise IOError: Error writing journal, or the journal is owned by another running process, in which case a
+            BlockingIOError is raised.
+        """
+
+        if self._lock_file is not None:
+            return
+
+        file = open(self.path, "a", encoding="utf8")
+        try:
+            if not try_lock(file):
+                raise BlockingIOError("The batch is being saved by another process: " + self.path)
+            file.write(json.dumps({"owner": os.getpid()}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        except BaseException:
+            file.close()
+            raise
+
+        self._lock_file = file
+
+    def release(self, failed_file_paths=()):
+        """Give up ownership of the journal once its batch has ended without every file being saved, keeping it so the
+        batch can be resumed.
+
+        :param failed_file_paths: The paths of the files that failed to save, if the batch finished. Leave empty if it
+            was cut short. Defaults to an empty tuple.
+        :type failed_file_paths: iterable
+
+        :raise IOError: Error writing journal.
+        """
+
+        if self._lock_file is None:
+            return
+
+        try:
+            failed_file_paths = list(failed_file_paths)
+            if len(failed_file_paths) > 0:
+                self._lock_file.write(json.dumps({"failed": failed_file_paths}) + "\n")
+                self._lock_file.flush()
+                os.fsync(self._lock_file.fileno())
+        finally:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def is_locked(self):
+        """Whether or not the journal is owned by a running process, this one included.
+
+        :returns: True if the journal is owned or no longer exists, false otherwise.
+        :rtype: bool
+        """
+
+        if self._lock_file is not None:
+            return True
+
+        try:
+            with open(self.path, "rb") as file:
+                return not try_lock(file)
+        except FileNotFoundError:
+            return True
+
+    def get_pending(self):
+        """Get the assignments of every file in the batch that has not been marked as saved.
+
+        :returns: A map of file paths to maps of setter method names to values, in the order they were recorded.
+        :rtype: dict
+
+        :raise IOError: Error reading journal.
+        """
+
+        pending = {}
+
+        for record in self._read_records():
+            if "saved" in record:
+                pending.pop(record["saved"], None)
+            elif "path" in record:
+                pending[record["path"]] = record["assignments"]
+
+        return pending
+
+    def has_failures(self):
+        """Whether or not the last run of the batch finished with files that failed to save, as opposed to being
+        interrupted.
+
+        :returns: True if the last run finished with failures, false if it was interrupted.
+        :rtype: bool
+
+        :raise IOError: Error reading journal.
+        """
+
+        has_failures = False
+
+        for record in self._read_records():
+            if "owner" in record:
+                has_failures = False
+            elif "failed" in record:
+                has_failures = True
+
+        return has_failures
+
+    def mark_saved(self, file_paths):
+        """Mark files as saved. The marks are synced to disk in one go, so call this once per group of files rather
+        than once per file.
+
+        :param file_paths: The paths of the files that were saved.
+        :type file_paths: iterable
+
+        :raise IOError: Error writing journal.
+        """
+
+        with open(self.path, "a", encoding="utf8") as file:
+            for file_path in file_paths:
+                file.write(json.dumps({"saved": file_path}) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+    def remove_temp_files(self):
+        """Remove temp files left behind by saves that were interrupted before they could be swapped in. Temp files
+        still locked by saves running in other processes are left alone.
+
+        :raise IOError: Error reading journal.
+        """
+
+        for file_path in self.get_pending():
+            for temp_path in find_temp_files(file_path, file_utils.TEMP_FILE_SUFFIX):
+                try:
+                    with open(temp_path, "rb") as temp_file:
+                        if try_lock(temp_file):
+                            os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def close(self):
+        """Delete the journal once its batch has finished, giving up ownership of it."""
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _read_records(self):
+        """Read the records of the journal.
+
+        :returns: A generator of record dicts, in the order they were written.
+        :rtype: generator
+
+        :raise IOError: Error reading journal.
+        """
+
+        with open(self.path, encoding="utf8") as file:
+            for line in file:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # The last line can be cut short if the process died while writing it.
+                    continue
+
+
+def find_unfinished_journals(directory=JOURNAL_DIRECTORY):
+    """Find the journals of batches that were interrupted or finished with failures. Journals of batches that are still
+    running, in this process or another, are left out.
+
+    :param directory: The directory to look in. Defaults to JOURNAL_DIRECTORY.
+    :type directory: str
+
+    :returns: The journals, oldest first.
+    :rtype: list
+    """
+
+    journals = []
+    for path in glob.glob(os.path.join(glob.escape(directory), "*" + _JOURNAL_SUFFIX)):
+        try:
+            journals.append((os.path.getmtime(path), SaveJournal(path)))
+        except OSError:
+            # Finished and deleted since it was listed.
+            continue
+    journals.sort(key=lambda journal: journal[0])
+
+    return [journal for (_, journal) in journals if not journal.is_locked()]
+
+
+def find_temp_files(file_path, suffix):
+    """Find the hidden files made next to a file while saving it, which are named after it.
+
+    :param file_path: The path to the file.
+    :type file_path: str
+
+    :param suffix: The suffix of the files to find, e.g. file_utils.TEMP_FILE_SUFFIX.
+    :type suffix: str
+
+    :returns: The paths to the files.
+    :rtype: list
+    """
+
+    (directory, filename) = os.path.split(file_path)
+
+    return glob.glob(os.path.join(glob.escape(directory), "." + glob.escape(filename) + ".*" + suffix))
+
+
+def try_lock(file):
+    """Take an exclusive lock on an open file without waiting. The lock lasts until the file is closed.
+
+    :param file: The open file.
+    :type file: file
+
+    :returns: True if the file was locked, or if this platform cannot lock files, false if another open file holds the
+        lock.
+    :rtype: bool
+
+    :raise IOError: Error locking file.
+    """
+
+    if fcntl is None:
+        return True
+
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+
+    return True
+
+
+def sync_directories(directories):
+    """Sync directories to disk, which makes files created, renamed, or deleted in them durable.
+
+    Platforms that cannot open directories, such as Windows, are skipped silently.
+
+    :param directories: The paths of the directories.
+    :type directories: iterable
+    """
+
+    for directory in directories:
+        try:
+            file_descriptor = os.open(directory or ".", os.O_RDONLY)
+        except OSError:
+            continue
+
+        try:
+            os.fsync(file_descriptor)
+        except OSError:
+            pass
+        finally:
+            os.close(file_descriptor)
+
+if __name__ == "__main__":
+    # List, resume, or discard every interrupted or failed batch from the command line.
+    import sys
+    import batch_utils
+
+    if len(sys.argv) > 2 or (len(sys.argv) == 2 and sys.argv[1] not in ("list", "resume", "discard")):
+        print("Usage: python3 save_journal.py [list|resume|discard]")
+        exit(2)
+
+    command = sys.argv[1] if len(sys.argv) == 2 else "resume"
+    for journal in find_unfinished_journals():
+        state = "failed" if journal.has_failures() else "interrupted"
+        print("{} {} ({} files left, {})".format(command.capitalize(), journal.path, len(journal.get_pending()),
+                                                 state))
+        if command == "resume":
+            for (file_path, error) in batch_utils.resume_assignments(journal):
+                print("  {}: {}".format(file_path, error))
+        elif command == "discard":
+            batch_utils.discard_assignments(journal)
@@ -0,0 +1,51 @@
+import struct
+
+
+def encode_syncsafe(value):
+    """Encode an integer as a 4 byte syncsafe integer."""
+
+    return bytes([(value >> 21) & 0x7f, (value >> 14) & 0x7f, (value >> 7) & 0x7f, value & 0x7f])
+
+
+def build_frame(frame_id, data, major_version):
+    """Build an ID3V2.3 or ID3V2.4 frame without flags."""
+
+    size = encode_syncsafe(len(data)) if major_version == 4 else struct.pack(">L", len(data))
+    return frame_id.encode("latin1") + size + b"\x00\x00" + data
+
+
+def text_data(*texts):
+    """Build the data of a latin1 text frame."""
+
+    return b"\x00" + "\x00".join(texts).encode("latin1")
+
+
+def build_tag(frames, major_version, flags=0, unsynchronise=False, padding=0):
+    """Build an ID3V2 tag from (frame identifier, frame data) tuples, followed by padding bytes. Unless unsynchronise
+    is set, the body is written as is even if the flags say it is unsynchronised."""
+
+    body = b"".join(build_frame(frame_id, data, major_version) for (frame_id, data) in frames)
+    if unsynchronise:
+        flags |= 0x80
+        body = body.replace(b"\xff", b"\xff\x00")
+    body += b"\x00" * padding
+    return b"ID3" + bytes([major_version, 0, flags]) + encode_syncsafe(len(body)) + body
+
+
+def build_ape_tag(items, with_header=True):
+    """Build an APEV2 tag from a map of keys to text values, with or without its optional header."""
+
+    body = b"".join(struct.pack("<II", len(value.encode("utf8")), 0) + key.encode("ascii") + b"\x00" +
+                    value.encode("utf8") for (key, value) in items.items())
+    size = len(body) + 32
+    flags = 0x80000000 if with_header else 0
+    footer = b"APETAGEX" + struct.pack("<IIII", 2000, size, len(items), flags) + b"\x00" * 8
+    header = b"APETAGEX" + struct.pack("<IIII", 2000, size, len(items), flags | 0x20000000) + b"\x00" * 8
+
+    return (header if with_header else b"") + body + footer
+
+
+def build_id3v1_tag(title):
+    """Build an ID3V1 tag with only a title."""
+
+    return b"TAG" + title.encode("latin1").ljust(30, b"\x00") + b"\x00" * 94 + b"\xff"
@@ -0,0 +1,118 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import album_art_utils
+
+
+class ArtworkHandler(BaseHTTPRequestHandler):
+    """Answers HEAD requests for artwork URLs of the form /<artwork>/<size>x<size>bb.jpg.
+
+    The server's existing_sizes are answered with 200, its broken_sizes have their connection dropped without an
+    answer, and every other size is answered with 404.
+    """
+
+    def do_HEAD(self):
+        size = int(self.path.rsplit("/", 1)[1].split("x")[0])
+
+        if size in self.server.broken_sizes:
+            self.close_connection = True
+            self.connection.close()
+            return
+
+        self.send_response(200 if size in self.server.existing_sizes else 404)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ResolveAlbumArtUrlTest(unittest.TestCase):
+    """Tests album art size probing against a local server."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ArtworkHandler)
+        self.server.existing_sizes = set()
+        self.server.broken_sizes = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.session = requests.Session()
+        self.url_format = "http://127.0.0.1:{}/art/{{0}}x{{0}}bb.jpg".format(self.server.server_address[1])
+        album_art_utils.clear_resolved_sizes()
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        album_art_utils.clear_resolved_sizes()
+
+    def resolve(self):
+        return album_art_utils.resolve_album_art_url(self.url_format.format(100), session=self.session)
+
+    def test_largest_existing_size_wins_and_is_cached(self):
+        self.server.existing_sizes = {600, 300, 100}
+
+        self.assertEqual(self.resolve(), self.url_format.format(600))
+
+        # Once cached, the server is not asked again.
+        self.server.existing_sizes = {1400}
+        self.assertEqual(self.resolve(), self.url_format.format(600))
+
+    def test_no_existing_size_is_cached(self):
+        self.assertEqual(self.resolve(), self.url_format.format(100))
+
+        self.server.existing_sizes = {1400}
+        self.assertEqual(self.resolve(), self.url_format.format(100))
+
+    def test_network_error_on_larger_size_is_not_cached(self):
+        self.server.existing_sizes = {1400, 600}
+        self.server.broken_sizes = {1400}
+
+        # The smaller size is used for now, but not remembered, so the larger one is found once it answers.
+        self.assertEqual(self.resolve(), self.url_format.format(600))
+
+        self.server.broken_sizes = set()
+        self.assertEqual(self.resolve(), self.url_format.format(1400))
+
+    def test_network_error_on_smaller_size_is_cached(self):
+        self.server.existing_sizes = {1000}
+        self.server.broken_sizes = {300}
+
+        self.assertEqual(self.resolve(), self.url_format.format(1000))
+
+        self.server.existing_sizes = {1400}
+        self.assertEqual(self.resolve(), self.url_format.format(1000))
+
+    def test_network_error_without_existing_size_is_not_cached(self):
+        self.server.broken_sizes = set(album_art_utils.ART_SIZES)
+
+        self.assertEqual(self.resolve(), self.url_format.format(100))
+
+        self.server.broken_sizes = set()
+        self.server.existing_sizes = {1200}
+        self.assertEqual(self.resolve(), self.url_format.format(1200))
+
+    def test_resolved_sizes_are_kept_between_runs(self):
+        self.server.existing_sizes = {600}
+        self.assertEqual(self.resolve(), self.url_format.format(600))
+
+        folder = tempfile.mkdtemp()
+        try:
+            path = os.path.join(folder, "cache", "sizes.json")
+            album_art_utils.save_resolved_sizes(path)
+
+            # A new run starts with an empty cache and loads the sizes found by this one.
+            album_art_utils.clear_resolved_sizes()
+            album_art_utils.load_resolved_sizes(path)
+        finally:
+            shutil.rmtree(folder)
+
+        self.server.existing_sizes = {1400}
+        self.assertEqual(self.resolve(), self.url_format.format(600))
+
+if __name__ == "__main__":
+    unittest.main()
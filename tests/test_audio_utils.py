@@ -0,0 +1,74 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import audio_utils
+from helpers import build_ape_tag, build_id3v1_tag, build_tag, text_data
+
+# Stands in for MPEG audio frames. Only its bytes matter to the hash.
+AUDIO = b"\xff\xfb\x90\x00" + bytes(range(256)) * 64
+
+
+class HashAudioTest(unittest.TestCase):
+    """Tests that hashing leaves out every kind of tag, so files that differ only in their tags hash the same."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as file:
+            file.write(data)
+
+        return path
+
+    def test_tags_are_left_out(self):
+        id3v2_tag = build_tag([("TIT2", text_data("Title"))], 4)
+        other_id3v2_tag = build_tag([("TIT2", text_data("Another title")), ("TPE1", text_data("Artist"))], 3)
+
+        # An ID3V2.4 tag with a footer has the header repeated after the frames.
+        footer_tag = bytearray(build_tag([("TALB", text_data("Album"))], 4, flags=0x10))
+        footer_tag += b"3DI" + footer_tag[3:10]
+
+        file_paths = [
+            self.write("bare.mp3", AUDIO),
+            self.write("id3v2.mp3", id3v2_tag + AUDIO),
+            self.write("id3v2_id3v1.mp3", other_id3v2_tag + AUDIO + build_id3v1_tag("Title")),
+            self.write("two_id3v2.mp3", id3v2_tag + other_id3v2_tag + AUDIO),
+            self.write("footer.mp3", bytes(footer_tag) + AUDIO),
+            self.write("ape.mp3", AUDIO + build_ape_tag({"Title": "Title"})),
+            self.write("ape_no_header.mp3", AUDIO + build_ape_tag({"Artist": "Artist"}, with_header=False)),
+            self.write("all.mp3", id3v2_tag + AUDIO + build_ape_tag({"Title": "Title"}) + build_id3v1_tag("Title")),
+        ]
+
+        expected = hashlib.sha1(AUDIO).hexdigest()
+        for file_path in file_paths:
+            with self.subTest(file=os.path.basename(file_path)):
+                self.assertEqual(audio_utils.hash_audio(file_path), expected)
+
+    def test_bounds(self):
+        id3v2_tag = build_tag([("TIT2", text_data("Title"))], 3)
+        file_path = self.write("a.mp3", id3v2_tag + AUDIO + build_id3v1_tag("Title"))
+
+        self.assertEqual(audio_utils.get_audio_bounds(file_path), (len(id3v2_tag), len(id3v2_tag) + len(AUDIO)))
+
+    def test_small_chunks(self):
+        file_path = self.write("a.mp3", build_tag([("TIT2", text_data("Title"))], 4) + AUDIO)
+
+        self.assertEqual(audio_utils.hash_audio(file_path, chunk_size=1000), hashlib.sha1(AUDIO).hexdigest())
+
+    def test_different_audio_hashes_differently(self):
+        self.assertNotEqual(audio_utils.hash_audio(self.write("a.mp3", AUDIO)),
+                            audio_utils.hash_audio(self.write("b.mp3", AUDIO[:-1] + b"\x00")))
+
+    def test_tag_only_file_has_empty_audio(self):
+        file_path = self.write("a.mp3", build_tag([("TIT2", text_data("Title"))], 4))
+
+        self.assertEqual(audio_utils.hash_audio(file_path), hashlib.sha1(b"").hexdigest())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+import unittest
+import auto_tag_utils
+from auto_tag_utils import ReferenceCatalogue
+
+RECORDS = [
+    {"title": "Paranoid Android", "artist": "Radiohead", "album": "OK Computer", "year": "1997", "track": "2"},
+    {"title": "Karma Police", "artist": "Radiohead", "album": "OK Computer", "year": "1997", "track": "6"},
+    {"title": "Teardrop", "artist": "Massive Attack", "album": "Mezzanine", "year": "1998", "track": "3"},
+]
+
+
+class FieldTrack:
+    """The part of a track auto tagging uses, with fields kept in a dict."""
+
+    def __init__(self, file_path, fields, year_error=None):
+        self.file_path = file_path
+        self.fields = dict(fields)
+        self.year_error = year_error
+        self.saved_paths = []
+
+    def __getattr__(self, name):
+        (prefix, _, field) = name.partition("_")
+        if prefix == "get":
+            return lambda: self.fields.get(field)
+        if prefix == "set":
+            return lambda value: self.fields.__setitem__(field, value)
+        raise AttributeError(name)
+
+    def get_file_path(self):
+        return self.file_path
+
+    def set_year(self, year):
+        if self.year_error is not None:
+            raise self.year_error
+        self.fields["year"] = year
+
+    def get_frames(self):
+        return dict(self.fields)
+
+    def set_frames(self, frames):
+        for (key, value) in frames.items():
+            if value is None:
+                self.fields.pop(key, None)
+            else:
+                self.fields[key] = value
+
+    def save_tag(self, path=None):
+        self.saved_paths.append(path)
+
+
+class MatchTest(unittest.TestCase):
+    """Tests fuzzy matching against a small catalogue."""
+
+    def setUp(self):
+        self.catalogue = ReferenceCatalogue(RECORDS)
+
+    def test_exact_words_match(self):
+        (record, score) = self.catalogue.match("Karma Police", "Radiohead")
+
+        self.assertEqual(record["title"], "Karma Police")
+        self.assertAlmostEqual(score, 1.0)
+
+    def test_misspelled_words_match_by_trigrams(self):
+        (record, score) = self.catalogue.match("Paranoyd Androyd", "Radiohaed")
+
+        self.assertEqual(record["title"], "Paranoid Android")
+        self.assertGreater(score, 0.5)
+
+    def test_min_score(self):
+        (_, score) = self.catalogue.match("Paranoyd Androyd", "Radiohaed")
+        track = FieldTrack("Radiohaed - Paranoyd Androyd.mp3", {})
+
+        self.assertEqual(auto_tag_utils.propose_fills(self.catalogue, track, min_score=score + 0.01), {})
+        self.assertEqual(auto_tag_utils.propose_fills(self.catalogue, track, min_score=score)["set_year"], "1997")
+
+    def test_nothing_matches(self):
+        self.assertEqual(self.catalogue.match("Zzyzx"), (None, 0.0))
+        self.assertEqual(self.catalogue.match(), (None, 0.0))
+
+    def test_cache_belongs_to_the_catalogue(self):
+        self.assertEqual(self.catalogue.match("Teardrop")[0]["artist"], "Massive Attack")
+
+        other_catalogue = ReferenceCatalogue([{"title": "Teardrop", "artist": "Elbow"}])
+        self.assertEqual(other_catalogue.match("Teardrop")[0]["artist"], "Elbow")
+        self.assertEqual(self.catalogue.match("Teardrop")[0]["artist"], "Massive Attack")
+
+    def test_cache_is_cleared_when_records_are_added(self):
+        self.assertIsNone(self.catalogue.match("Unravel")[0])
+
+        self.catalogue.add({"title": "Unravel", "artist": "Björk"})
+
+        self.assertEqual(self.catalogue.match("Unravel")[0]["artist"], "Björk")
+
+
+class AutoTagTracksTest(unittest.TestCase):
+    """Tests that a track whose fills cannot be applied is reported without stopping the rest of the batch."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.catalogue = ReferenceCatalogue(RECORDS)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def create_track(self, filename, year_error=None):
+        file_path = os.path.join(self.folder, filename)
+        with open(file_path, "wb") as file:
+            file.write(b"audio")
+        return FieldTrack(file_path, {"artist": "Radiohead"}, year_error)
+
+    def test_failing_setter_is_reported(self):
+        error = ValueError("bad year")
+        failing_track = self.create_track("Karma Police.mp3", error)
+        track = self.create_track("Paranoid Android.mp3")
+
+        (applied_fills, failures) = auto_tag_utils.auto_tag_tracks(self.catalogue, [failing_track, track])
+
+        self.assertEqual(failures, [(failing_track, error)])
+        self.assertEqual(list(applied_fills), [track])
+
+        # The fills set before the error are undone and the track is not saved.
+        self.assertEqual(failing_track.fields, {"artist": "Radiohead"})
+        self.assertEqual(failing_track.saved_paths, [])
+
+        self.assertEqual(track.fields["title"], "Paranoid Android")
+        self.assertEqual(track.fields["year"], "1997")
+        self.assertEqual(len(track.saved_paths), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,289 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+import batch_utils
+import file_utils
+import id3_reader
+import save_journal
+from helpers import build_tag, text_data
+
+try:
+    from mp3_track import MP3Track
+except ImportError:
+    MP3Track = None
+
+# The MPEG audio frames after the tag, which a save must never change.
+AUDIO = b"\xff\xfb\x90\x00" + bytes(range(256)) * 16
+
+
+class NumberedTrack:
+    """The part of a track that album grouping and track numbering use."""
+
+    def __init__(self, file_path, album, track=None, artist="Artist", album_artist=None):
+        self.file_path = file_path
+        self.album = album
+        self.track = track
+        self.artist = artist
+        self.album_artist = album_artist
+        self.saved_paths = []
+
+    def get_file_path(self):
+        return self.file_path
+
+    def get_album(self):
+        return self.album
+
+    def get_artist(self):
+        return self.artist
+
+    def get_album_artist(self):
+        return self.album_artist
+
+    def get_track(self):
+        return self.track
+
+    def set_track(self, track):
+        self.track = track
+
+    def save_tag(self, path=None):
+        self.saved_paths.append(path)
+
+
+class NumberTracksTest(unittest.TestCase):
+    """Tests album grouping and track numbering."""
+
+    def get_numbers(self, tracks, by_filename=False):
+        return {os.path.relpath(track.get_file_path(), "/music"): number
+                for (track, number) in batch_utils.number_tracks(tracks, by_filename).items()}
+
+    def test_albums_are_grouped_by_album_artist_and_album(self):
+        tracks = [
+            NumberedTrack("/music/a.mp3", "Album", "2", artist="One", album_artist="Various"),
+            NumberedTrack("/music/b.mp3", " album ", "1", artist="Two", album_artist="VARIOUS"),
+            NumberedTrack("/music/c.mp3", "Album", "1", artist="Three"),
+            NumberedTrack("/music/d.mp3", "Other", "5", artist="Three"),
+        ]
+
+        albums = batch_utils.group_tracks_by_album(tracks)
+        self.assertEqual(sorted(len(album_tracks) for album_tracks in albums.values()), [1, 1, 2])
+        self.assertEqual(self.get_numbers(tracks), {"a.mp3": "2/2", "b.mp3": "1/2", "c.mp3": "1/1", "d.mp3": "1/1"})
+
+    def test_gaps_and_missing_numbers(self):
+        tracks = [
+            NumberedTrack("/music/10 - j.mp3", "Album"),
+            NumberedTrack("/music/x.mp3", "Album", "9/12"),
+            NumberedTrack("/music/2 - b.mp3", "Album"),
+            NumberedTrack("/music/y.mp3", "Album", "03"),
+        ]
+
+        self.assertEqual(self.get_numbers(tracks),
+                         {"y.mp3": "1/4", "x.mp3": "2/4", "2 - b.mp3": "3/4", "10 - j.mp3": "4/4"})
+
+    def test_by_filename(self):
+        tracks = [
+            NumberedTrack("/music/10 - j.mp3", "Album", "1"),
+            NumberedTrack("/music/2 - b.mp3", "Album", "2"),
+            NumberedTrack("/music/1 - a.mp3", "Album", "3"),
+        ]
+
+        self.assertEqual(self.get_numbers(tracks, by_filename=True),
+                         {"1 - a.mp3": "1/3", "2 - b.mp3": "2/3", "10 - j.mp3": "3/3"})
+
+    def test_discs_in_folders(self):
+        tracks = [
+            NumberedTrack("/music/Disc 10/01.mp3", "Album", "1"),
+            NumberedTrack("/music/Disc 2/02.mp3", "Album", "2"),
+            NumberedTrack("/music/Disc 2/01.mp3", "Album", "1"),
+            NumberedTrack("/music/Disc 1/01.mp3", "Album", "1"),
+        ]
+
+        self.assertEqual(self.get_numbers(tracks), {"Disc 1/01.mp3": "1/4", "Disc 2/01.mp3": "2/4",
+                                                    "Disc 2/02.mp3": "3/4", "Disc 10/01.mp3": "4/4"})
+
+
+class ApplyTrackNumbersTest(unittest.TestCase):
+    """Tests that only tracks whose number changed are saved."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_only_changed_tracks_are_saved(self):
+        tracks = []
+        for (filename, track_number) in (("1.mp3", "1/2"), ("2.mp3", "5")):
+            file_path = os.path.join(self.folder, filename)
+            with open(file_path, "wb") as file:
+                file.write(b"audio")
+            tracks.append(NumberedTrack(file_path, "Album", track_number))
+
+        self.assertEqual(batch_utils.apply_track_numbers(tracks), [])
+
+        self.assertEqual([track.get_track() for track in tracks], ["1/2", "2/2"])
+        self.assertEqual(tracks[0].saved_paths, [])
+        self.assertEqual(len(tracks[1].saved_paths), 1)
+
+
+class SaveAssignmentsTest(unittest.TestCase):
+    """Tests that the journal of a batch is only deleted once every file in it has been saved."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.journal_directory = os.path.join(self.folder, "journals")
+        self.missing_file_path = os.path.join(self.folder, "missing.mp3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_journal_is_kept_when_a_file_fails(self):
+        failures = batch_utils.save_assignments({self.missing_file_path: {"set_title": "Title"}},
+                                                journal_directory=self.journal_directory)
+
+        self.assertEqual([file_path for (file_path, error) in failures], [self.missing_file_path])
+        self.assertIsInstance(failures[0][1], OSError)
+
+        journals = save_journal.find_unfinished_journals(self.journal_directory)
+        self.assertEqual(len(journals), 1)
+        self.assertEqual(list(journals[0].get_pending()), [self.missing_file_path])
+
+        # Resuming fails again, so the journal is still kept.
+        self.assertEqual(len(batch_utils.resume_assignments(journals[0])), 1)
+        self.assertEqual(len(save_journal.find_unfinished_journals(self.journal_directory)), 1)
+
+    def test_journal_is_deleted_when_nothing_fails(self):
+        self.assertEqual(batch_utils.save_assignments({}, journal_directory=self.journal_directory), [])
+        self.assertEqual(save_journal.find_unfinished_journals(self.journal_directory), [])
+
+
+class TitleTrack:
+    """A track that saves its title the way mutagenx saves an ID3 tag: over the old tag if it fits in its space, and by
+    moving the audio along to make room if it does not."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.title = None
+
+    def get_file_path(self):
+        return self.file_path
+
+    def set_title(self, title):
+        self.title = title
+
+    def save_tag(self, path=None):
+        with open(path or self.file_path, "rb+") as file:
+            data = file.read()
+            old_size = 0
+            if data.startswith(b"ID3"):
+                old_size = 10 + sum((byte & 0x7f) << (7 * (3 - index)) for (index, byte) in enumerate(data[6:10]))
+
+            tag = build_tag([("TIT2", text_data(self.title))], 4)
+            tag = build_tag([("TIT2", text_data(self.title))], 4, padding=max(old_size - len(tag), 0))
+
+            file.seek(0)
+            file.write(tag + data[old_size:])
+            file.truncate()
+
+
+def crash_while_writing_tag(file_path, journal_directory):
+    """Save a new title in place, but kill the process half way through writing it over the old one."""
+
+    def write_half_and_crash(file_path, region, id3v1_tag):
+        with open(file_path, "rb+") as file:
+            file.write(region[:len(region) // 2])
+        os._exit(1)
+
+    batch_utils._write_tag_region = write_half_and_crash
+    track = TitleTrack(file_path)
+    batch_utils.save_assignments({file_path: {"set_title": "New"}}, {file_path: track},
+                                 journal_directory=journal_directory)
+
+
+class SaveInPlaceTest(unittest.TestCase):
+    """Tests that journaled saves write tags that fit in place and only copy files whose tag grows."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.journal_directory = os.path.join(self.folder, "journals")
+        self.file_path = os.path.join(self.folder, "a.mp3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_file(self, padding):
+        with open(self.file_path, "wb") as file:
+            file.write(build_tag([("TIT2", text_data("Old"))], 4, padding=padding) + AUDIO)
+
+        return os.stat(self.file_path)
+
+    def save_title(self, title):
+        track = TitleTrack(self.file_path)
+        return batch_utils.save_assignments({self.file_path: {"set_title": title}}, {self.file_path: track},
+                                            journal_directory=self.journal_directory)
+
+    def assert_saved(self, title):
+        self.assertEqual(id3_reader.read_tag(self.file_path).get_title(), title)
+        with open(self.file_path, "rb") as file:
+            self.assertTrue(file.read().endswith(AUDIO))
+
+        # No scratch files, backups, or journals are left behind.
+        self.assertEqual(set(os.listdir(self.folder)) - {"journals"}, {"a.mp3"})
+        self.assertEqual(save_journal.find_unfinished_journals(self.journal_directory), [])
+
+    def test_tag_that_fits_is_written_in_place(self):
+        before = self.write_file(padding=100)
+
+        self.assertEqual(self.save_title("New"), [])
+
+        self.assert_saved("New")
+        after = os.stat(self.file_path)
+        self.assertEqual((after.st_ino, after.st_size), (before.st_ino, before.st_size))
+
+    def test_tag_that_grows_is_saved_to_a_copy(self):
+        before = self.write_file(padding=0)
+
+        self.assertEqual(self.save_title("A longer title"), [])
+
+        self.assert_saved("A longer title")
+        self.assertNotEqual(os.stat(self.file_path).st_ino, before.st_ino)
+
+    def test_tracks_saved_without_a_journal_are_copied(self):
+        before = self.write_file(padding=100)
+        track = TitleTrack(self.file_path)
+        track.set_title("New")
+
+        self.assertEqual(batch_utils.save_tracks([track]), [])
+
+        self.assert_saved("New")
+        self.assertNotEqual(os.stat(self.file_path).st_ino, before.st_ino)
+
+    def test_interrupted_write_is_restored_on_resume(self):
+        self.write_file(padding=100)
+
+        process = multiprocessing.Process(target=crash_while_writing_tag, args=(self.file_path, self.journal_directory))
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 1)
+
+        # The crash left half a tag behind, with a backup of the old one next to it.
+        backup_paths = [filename for filename in os.listdir(self.folder)
+                        if filename.endswith(file_utils.TAG_BACKUP_SUFFIX)]
+        self.assertEqual(len(backup_paths), 1)
+        [journal] = save_journal.find_unfinished_journals(self.journal_directory)
+
+        failures = batch_utils.resume_assignments(journal)
+
+        if MP3Track is None:
+            # The file cannot be loaded to be saved again, but its old tag is back.
+            self.assertEqual([file_path for (file_path, error) in failures], [self.file_path])
+            self.assertEqual(id3_reader.read_tag(self.file_path).get_title(), "Old")
+        else:
+            self.assertEqual(failures, [])
+            self.assertEqual(id3_reader.read_tag(self.file_path).get_title(), "New")
+        self.assertEqual([filename for filename in os.listdir(self.folder)
+                          if filename.endswith(file_utils.TAG_BACKUP_SUFFIX)], [])
+
+if __name__ == "__main__":
+    unittest.main()
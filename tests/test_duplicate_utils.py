@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+import duplicate_utils
+from helpers import build_id3v1_tag, build_tag, text_data
+
+AUDIO = b"\xff\xfb\x90\x00" + bytes(range(256)) * 16
+OTHER_AUDIO = b"\xff\xfb\x90\x00" + bytes(reversed(range(256))) * 16
+
+
+def build_mp3(title, artist, album, track, audio):
+    """Build an MP3 file with an ID3V2.4 tag."""
+
+    return build_tag([("TIT2", text_data(title)), ("TPE1", text_data(artist)), ("TALB", text_data(album)),
+                      ("TRCK", text_data(track))], 4) + audio
+
+
+class FindDuplicatesTest(unittest.TestCase):
+    """Tests grouping by audio and by tags across worker processes."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as file:
+            file.write(data)
+
+        return path
+
+    def test_groups(self):
+        original = self.write("a.mp3", build_mp3("Title", "Artist", "Album", "1", AUDIO))
+        # The same audio tagged differently, with an ID3V1 tag as well.
+        retagged = self.write("b.mp3", build_mp3("Other", "Someone", "Else", "7", AUDIO) + build_id3v1_tag("Other"))
+        # The same track from another rip, tagged with cosmetic differences.
+        other_rip = self.write("c.mp3", build_mp3("  TITLE", "artist", "Album ", "01/12", OTHER_AUDIO))
+        missing = os.path.join(self.folder, "missing.mp3")
+
+        report = duplicate_utils.find_duplicates([original, retagged, other_rip, missing], processes=2)
+
+        self.assertEqual(report.audio_groups, [[original, retagged]])
+        self.assertEqual(report.tag_groups, [[original, other_rip]])
+        self.assertEqual([file_path for (file_path, error) in report.errors], [missing])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+import edit_history
+
+
+class FrameTrack:
+    """The part of a track the history captures, restores, and saves."""
+
+    def __init__(self, file_path, frames):
+        self.file_path = file_path
+        self.frames = frames
+
+    def get_file_path(self):
+        return self.file_path
+
+    def get_frames(self):
+        return dict(self.frames)
+
+    def set_frames(self, frames):
+        for (key, frame) in frames.items():
+            if frame is None:
+                self.frames.pop(key, None)
+            else:
+                self.frames[key] = frame
+
+    def save_tag(self, path=None):
+        pass
+
+
+# A frame too large to be stored inline, such as a picture.
+PICTURE = b"APIC:" + bytes(range(256)) * 4
+
+
+class EditHistoryTestCase(unittest.TestCase):
+    """Records an edit of the titles of two tracks."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.history = edit_history.EditHistory(os.path.join(self.folder, "history"))
+
+        self.tracks = {}
+        for filename in ("a.mp3", "b.mp3"):
+            file_path = os.path.join(self.folder, filename)
+            with open(file_path, "wb") as file:
+                file.write(b"audio")
+            self.tracks[file_path] = FrameTrack(file_path, {"TIT2": b"TIT2:before", "APIC:": PICTURE})
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def edit(self, frames):
+        before = self.history.capture(self.tracks.values())
+        for track in self.tracks.values():
+            track.frames.update(frames)
+        self.assertTrue(self.history.record("Save Tags", before, self.tracks.values()))
+
+    def get_titles(self):
+        return [track.frames["TIT2"] for track in self.tracks.values()]
+
+    def get_blob_count(self):
+        return sum(len(filenames) for (_, _, filenames) in os.walk(os.path.join(self.history.directory, "blobs")))
+
+
+class UndoRedoTest(EditHistoryTestCase):
+    """Tests undoing and redoing, including when files have gone missing since the edit."""
+
+    def test_undo_and_redo(self):
+        self.edit({"TIT2": b"TIT2:after"})
+
+        self.assertEqual(self.history.undo(self.tracks), [])
+        self.assertEqual(self.get_titles(), [b"TIT2:before"] * 2)
+        self.assertFalse(self.history.can_undo())
+
+        self.assertEqual(self.history.redo(self.tracks), [])
+        self.assertEqual(self.get_titles(), [b"TIT2:after"] * 2)
+        self.assertFalse(self.history.can_redo())
+
+    def test_missing_file_keeps_the_action_until_skipped(self):
+        self.edit({"TIT2": b"TIT2:after"})
+        (file_path, missing_file_path) = list(self.tracks)
+        os.remove(missing_file_path)
+
+        self.assertEqual(self.history.get_undo_missing_files(), [missing_file_path])
+
+        # The file that still exists is restored, but the action stays applied, on disk as well.
+        failures = self.history.undo(self.tracks)
+        self.assertEqual([failed_file_path for (failed_file_path, error) in failures], [missing_file_path])
+        self.assertEqual(self.tracks[file_path].frames["TIT2"], b"TIT2:before")
+        self.assertTrue(edit_history.EditHistory(self.history.directory).can_undo())
+
+        self.assertEqual(self.history.undo(self.tracks, skip_missing=True), [])
+        self.assertTrue(self.history.can_redo())
+        self.assertFalse(self.history.can_undo())
+
+        self.assertEqual(len(self.history.redo(self.tracks)), 1)
+        self.assertTrue(self.history.can_redo())
+
+        self.assertEqual(self.history.redo(self.tracks, skip_missing=True), [])
+        self.assertEqual(self.tracks[file_path].frames["TIT2"], b"TIT2:after")
+        self.assertTrue(self.history.can_undo())
+
+
+class CaptureTest(EditHistoryTestCase):
+    """Tests that only the frames an edit changes are kept."""
+
+    def test_unchanged_large_frames_are_not_kept(self):
+        self.edit({"TIT2": b"TIT2:after"})
+
+        self.assertEqual(self.get_blob_count(), 0)
+
+    def test_changed_large_frames_are_kept(self):
+        self.edit({"APIC:": PICTURE[::-1]})
+
+        self.assertEqual(self.get_blob_count(), 2)
+
+        self.assertEqual(self.history.undo(self.tracks), [])
+        self.assertEqual([track.frames["APIC:"] for track in self.tracks.values()], [PICTURE] * 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import file_utils
+
+
+def build_box(box_type, *children):
+    """Build an MP4 box from its type and the data of its children."""
+
+    body = b"".join(children)
+    return struct.pack(">I", 8 + len(body)) + box_type + body
+
+
+def build_mp4(brand, handler_types, movie_first=True):
+    """Build an MP4 file of a major brand with one track per handler type."""
+
+    ftyp = build_box(b"ftyp", brand, b"\x00\x00\x00\x00", brand)
+    traks = [build_box(b"trak", build_box(b"tkhd", b"\x00" * 84),
+                       build_box(b"mdia", build_box(b"hdlr", b"\x00" * 8, handler_type, b"\x00" * 13)))
+             for handler_type in handler_types]
+    moov = build_box(b"moov", build_box(b"mvhd", b"\x00" * 100), *traks)
+    mdat = build_box(b"mdat", b"\x00" * 4096)
+
+    return ftyp + (moov + mdat if movie_first else mdat + moov)
+
+
+class GetFileFormatTest(unittest.TestCase):
+    """Tests that MP4 files are only taken for music when they hold no video."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def get_format(self, filename, data):
+        file_path = os.path.join(self.folder, filename)
+        with open(file_path, "wb") as file:
+            file.write(data)
+
+        return file_utils.get_file_format(file_path)
+
+    def test_audio_brands(self):
+        self.assertEqual(self.get_format("a.mp4", build_mp4(b"M4A ", [b"soun"])), file_utils.FORMAT_MP4)
+        self.assertEqual(self.get_format("b.m4b", build_mp4(b"M4B ", [b"soun"])), file_utils.FORMAT_MP4)
+
+    def test_generic_brand_with_audio_extension(self):
+        self.assertEqual(self.get_format("a.m4a", build_mp4(b"isom", [b"vide", b"soun"])), file_utils.FORMAT_MP4)
+
+    def test_generic_brand_without_video(self):
+        self.assertEqual(self.get_format("a.mp4", build_mp4(b"mp42", [b"soun"])), file_utils.FORMAT_MP4)
+        self.assertEqual(self.get_format("b.mp4", build_mp4(b"dash", [b"soun"], movie_first=False)),
+                         file_utils.FORMAT_MP4)
+
+    def test_generic_brand_with_video(self):
+        self.assertIsNone(self.get_format("a.mp4", build_mp4(b"isom", [b"soun", b"vide"])))
+        self.assertIsNone(self.get_format("b.mp4", build_mp4(b"mp41", [b"vide"], movie_first=False)))
+
+    def test_generic_brand_without_movie_box(self):
+        self.assertIsNone(self.get_format("a.mp4", build_box(b"ftyp", b"iso2", b"\x00" * 4)))
+
+    def test_other_brands(self):
+        self.assertIsNone(self.get_format("a.m4a", build_mp4(b"qt  ", [b"soun"])))
+
+if __name__ == "__main__":
+    unittest.main()
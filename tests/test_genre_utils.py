@@ -0,0 +1,50 @@
+import unittest
+import genre_utils
+
+
+class GenreTrack:
+    """The part of a track that genre normalisation uses."""
+
+    def __init__(self, genre):
+        self.genre = genre
+
+    def get_genre(self):
+        return self.genre
+
+    def set_genre(self, genre):
+        self.genre = genre
+
+
+class NormaliseGenreTest(unittest.TestCase):
+    """Tests the conversion of raw genre text into genre names."""
+
+    def test_references(self):
+        self.assertEqual(genre_utils.normalise_genre("17"), "Rock")
+        self.assertEqual(genre_utils.normalise_genre("(17)"), "Rock")
+        self.assertEqual(genre_utils.normalise_genre("(17)Rock"), "Rock")
+        self.assertEqual(genre_utils.normalise_genre("(17)(18)"), "Rock / Techno")
+        self.assertEqual(genre_utils.normalise_genre("(RX)(CR)"), "Remix / Cover")
+        self.assertEqual(genre_utils.normalise_genre("(17)Indie Rock"), "Rock / Indie Rock")
+
+    def test_numbers_beyond_a_byte_are_kept(self):
+        self.assertEqual(genre_utils.normalise_genre("1999"), "1999")
+        self.assertEqual(genre_utils.normalise_genre(" 256 "), "256")
+
+    def test_unknown_references_are_kept(self):
+        self.assertEqual(genre_utils.normalise_genre("(200)"), "(200)")
+        self.assertEqual(genre_utils.normalise_genre("(1999)"), "(1999)")
+
+    def test_names(self):
+        self.assertEqual(genre_utils.normalise_genre("  rock "), "Rock")
+        self.assertEqual(genre_utils.normalise_genre("((Drum) and Bass"), "(Drum) and Bass")
+        self.assertEqual(genre_utils.normalise_genre("Vaporwave"), "Vaporwave")
+        self.assertIsNone(genre_utils.normalise_genre(None))
+
+    def test_tracks_with_normal_genres_are_left_alone(self):
+        tracks = [GenreTrack("1999"), GenreTrack("Rock"), GenreTrack(None)]
+
+        self.assertEqual(genre_utils.normalise_genres(tracks), ([], []))
+        self.assertEqual([track.get_genre() for track in tracks], ["1999", "Rock", None])
+
+if __name__ == "__main__":
+    unittest.main()
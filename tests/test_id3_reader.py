@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+import id3_reader
+from helpers import build_tag, text_data
+
+try:
+    from mp3_track import MP3Track
+except ImportError:
+    MP3Track = None
+
+# The getters a snapshot shares with MP3Track.
+GETTERS = ["get_title", "get_artist", "get_album_artist", "get_album", "get_genre", "get_year", "get_track",
+           "get_part_of_compilation", "get_comments", "get_audio_checksum", "has_picture"]
+
+
+# Tags covering the conversions a snapshot has to do the same way as mutagenx.
+TAGS = {
+    "v23_basic": build_tag([
+        ("TIT2", text_data("Title")),
+        ("TPE1", text_data("Artist")),
+        ("TPE2", text_data("Album Artist")),
+        ("TALB", text_data("Album")),
+        ("TCON", text_data("(17)Rock")),
+        ("TYER", text_data("2001")),
+        ("TDAT", text_data("0302")),
+        ("TRCK", text_data("3/12")),
+        ("TCMP", text_data("1")),
+        ("COMM", b"\x00eng\x00Comment"),
+        ("TXXX", text_data("AUDIO_CHECKSUM", "abc123")),
+    ], 3),
+    "v24_numeric_genres": build_tag([("TCON", text_data("17", "1999", "300", "255"))], 4),
+    "v24_referenced_genres": build_tag([("TCON", text_data("(300)(17)(CR)Refined"))], 4),
+    "v23_numeric_genre": build_tag([("TCON", text_data("1999"))], 3),
+    "v23_valid_unsynch": build_tag([("TIT2", b"\x00A\xffB"), ("TALB", text_data("Album"))], 3, unsynchronise=True),
+    "v23_invalid_unsynch": build_tag([("TIT2", b"\x00A\xff\xe0B"), ("TALB", text_data("Album"))], 3, 0x80),
+}
+
+
+class TagTestCase(unittest.TestCase):
+    """Writes the test tags to files in a temporary folder."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_paths = {}
+        for (name, tag) in TAGS.items():
+            self.file_paths[name] = os.path.join(self.folder, name + ".mp3")
+            with open(self.file_paths[name], "wb") as file:
+                file.write(tag + b"\x00" * 128)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+
+class ReadTagTest(TagTestCase):
+    """Tests snapshots against known values."""
+
+    def test_basic_frames(self):
+        snapshot = id3_reader.read_tag(self.file_paths["v23_basic"])
+
+        self.assertEqual(snapshot.get_title(), "Title")
+        self.assertEqual(snapshot.get_genre(), "Rock")
+        self.assertEqual(snapshot.get_year(), "2001-02-03")
+        self.assertEqual(snapshot.get_track(), "3/12")
+        self.assertTrue(snapshot.get_part_of_compilation())
+        self.assertEqual(snapshot.get_comments(), "Comment")
+        self.assertEqual(snapshot.get_audio_checksum(), "abc123")
+
+    def test_numeric_genres_beyond_a_byte_are_kept(self):
+        self.assertEqual(id3_reader.read_tag(self.file_paths["v23_numeric_genre"]).get_genre(), "1999")
+        self.assertEqual(id3_reader.read_tag(self.file_paths["v24_numeric_genres"]).get_genre(),
+                         "Rock 1999 300 Unknown")
+
+    def test_referenced_genres(self):
+        self.assertEqual(id3_reader.read_tag(self.file_paths["v24_referenced_genres"]).get_genre(),
+                         "Unknown Rock Cover Refined")
+
+    def test_valid_tag_unsynchronisation_is_decoded(self):
+        self.assertEqual(id3_reader.read_tag(self.file_paths["v23_valid_unsynch"]).get_title(), "A\xffB")
+
+    def test_invalid_tag_unsynchronisation_falls_back_to_raw_data(self):
+        snapshot = id3_reader.read_tag(self.file_paths["v23_invalid_unsynch"])
+
+        self.assertEqual(snapshot.get_title(), "A\xff\xe0B")
+        self.assertEqual(snapshot.get_album(), "Album")
+
+
+@unittest.skipUnless(MP3Track is not None, "mutagenx is not installed")
+class DifferentialTest(TagTestCase):
+    """Tests that every getter of a snapshot returns what MP3Track returns for the same file."""
+
+    def test_getters_match_mp3_track(self):
+        for (name, file_path) in self.file_paths.items():
+            snapshot = id3_reader.read_tag(file_path)
+            mp3_track = MP3Track(file_path, create_tag=False)
+            for getter in GETTERS:
+                with self.subTest(tag=name, getter=getter):
+                    self.assertEqual(getattr(snapshot, getter)(), getattr(mp3_track, getter)())
+
+if __name__ == "__main__":
+    unittest.main()
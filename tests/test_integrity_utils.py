@@ -0,0 +1,108 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+import integrity_utils
+from helpers import build_id3v1_tag, build_tag, text_data
+
+try:
+    from mp3_track import MP3Track
+except ImportError:
+    MP3Track = None
+
+AUDIO = b"\xff\xfb\x90\x00" + bytes(range(256)) * 16
+CHECKSUM = "sha1:" + hashlib.sha1(AUDIO).hexdigest()
+
+
+class IntegrityTestCase(unittest.TestCase):
+    """Writes MP3 files to a temporary folder."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.journal_directory = os.path.join(self.folder, "journals")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write(self, name, frames, audio=AUDIO):
+        path = os.path.join(self.folder, name)
+        with open(path, "wb") as file:
+            file.write(build_tag(frames, 4) + audio)
+
+        return path
+
+    def get_statuses(self, report):
+        return {file_path: status for (status, entries) in report.results.items() for (file_path, _) in entries}
+
+
+class VerifyChecksumsTest(IntegrityTestCase):
+    """Tests verification against checksums written into the tags by hand."""
+
+    def test_statuses(self):
+        checksum_frame = ("TXXX", text_data("AUDIO_CHECKSUM", CHECKSUM))
+        ok = self.write("ok.mp3", [("TIT2", text_data("Title")), checksum_frame])
+        retagged = self.write("retagged.mp3", [("TIT2", text_data("A much longer title than before")),
+                                               ("TPE1", text_data("Artist")), checksum_frame])
+        with open(retagged, "ab") as file:
+            file.write(build_id3v1_tag("Title"))
+        damaged = self.write("damaged.mp3", [checksum_frame], AUDIO[:-1] + b"\x00")
+        missing = self.write("missing.mp3", [("TIT2", text_data("Title"))])
+        unknown_algorithm = self.write("unknown.mp3", [("TXXX", text_data("AUDIO_CHECKSUM", "nonsense:00"))])
+        unreadable = os.path.join(self.folder, "gone.mp3")
+
+        report = integrity_utils.verify_checksums([ok, retagged, damaged, missing, unknown_algorithm, unreadable],
+                                                  processes=2)
+
+        self.assertEqual(self.get_statuses(report), {
+            ok: integrity_utils.STATUS_OK,
+            retagged: integrity_utils.STATUS_OK,
+            damaged: integrity_utils.STATUS_MISMATCH,
+            missing: integrity_utils.STATUS_MISSING,
+            unknown_algorithm: integrity_utils.STATUS_ERROR,
+            unreadable: integrity_utils.STATUS_ERROR,
+        })
+        self.assertFalse(report.is_ok())
+
+
+@unittest.skipUnless(MP3Track is not None, "mutagenx is not installed")
+class StoreChecksumsTest(IntegrityTestCase):
+    """Tests storing checksums through the journaled batch save."""
+
+    def store(self, paths, overwrite=False):
+        return integrity_utils.store_checksums(paths, processes=2, overwrite=overwrite,
+                                               journal_directory=self.journal_directory)
+
+    def test_store_then_edit_then_verify(self):
+        file_path = self.write("a.mp3", [("TIT2", text_data("Title"))])
+
+        report = self.store([file_path])
+        self.assertEqual(self.get_statuses(report), {file_path: integrity_utils.STATUS_OK})
+        self.assertEqual(MP3Track(file_path, create_tag=False).get_audio_checksum(), CHECKSUM)
+        self.assertEqual(os.listdir(self.journal_directory), [])
+
+        track = MP3Track(file_path, create_tag=False)
+        track.set_title("A different title")
+        track.set_artist("Artist")
+        track.save_tag()
+
+        report = integrity_utils.verify_checksums([file_path], processes=1)
+        self.assertEqual(self.get_statuses(report), {file_path: integrity_utils.STATUS_OK})
+
+    def test_existing_checksum_is_kept_unless_overwritten(self):
+        file_path = self.write("a.mp3", [("TXXX", text_data("AUDIO_CHECKSUM", "sha1:stale"))])
+
+        self.store([file_path])
+        self.assertEqual(MP3Track(file_path, create_tag=False).get_audio_checksum(), "sha1:stale")
+
+        self.store([file_path], overwrite=True)
+        self.assertEqual(MP3Track(file_path, create_tag=False).get_audio_checksum(), CHECKSUM)
+
+    def test_unreadable_file_is_an_error(self):
+        file_path = os.path.join(self.folder, "gone.mp3")
+
+        report = self.store([file_path])
+        self.assertEqual(self.get_statuses(report), {file_path: integrity_utils.STATUS_ERROR})
+
+if __name__ == "__main__":
+    unittest.main()
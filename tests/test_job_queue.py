@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import id3_reader
+import job_queue
+from helpers import build_tag, text_data
+
+try:
+    from mp3_track import MP3Track
+except ImportError:
+    MP3Track = None
+
+# The number of worker processes each test runs.
+WORKERS = 3
+
+
+def lease_and_die(queue_path):
+    """Lease a unit with a short lease, then die without finishing it."""
+
+    queue = job_queue.SQLiteJobQueue(queue_path, lease_seconds=0.1)
+    queue.lease("crashed")
+    os._exit(1)
+
+
+class WorkerTest(unittest.TestCase):
+    """Tests worker processes sharing an SQLite queue."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.queue_path = os.path.join(self.folder, "jobs.sqlite3")
+        self.queue = job_queue.SQLiteJobQueue(self.queue_path)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.folder)
+
+    def write_files(self, count):
+        file_paths = []
+        for index in range(count):
+            file_paths.append(os.path.join(self.folder, "{:02}.mp3".format(index)))
+            with open(file_paths[-1], "wb") as file:
+                file.write(build_tag([("TIT2", text_data("Old"))], 4, padding=100) + b"\x00" * 128)
+
+        return file_paths
+
+    def run_workers(self):
+        processes = [multiprocessing.Process(target=job_queue._run_worker_process, args=(self.queue_path, False))
+                     for _ in range(WORKERS)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+
+    @unittest.skipUnless(MP3Track is not None, "mutagenx is not installed")
+    def test_workers_write_tags(self):
+        file_paths = self.write_files(12)
+        batch_id = job_queue.submit_assignments(self.queue, {file_path: {"set_title": "New {}".format(index)}
+                                                             for (index, file_path) in enumerate(file_paths)},
+                                                unit_size=4)
+
+        self.run_workers()
+
+        results = self.queue.get_results(batch_id)
+        self.assertTrue(results.is_finished())
+        self.assertEqual((results.unit_counts[job_queue.STATE_DONE], results.file_failures), (3, []))
+        self.assertEqual([id3_reader.read_tag(file_path).get_title() for file_path in file_paths],
+                         ["New {}".format(index) for index in range(12)])
+
+    def test_expired_lease_is_tried_again(self):
+        file_path = os.path.join(self.folder, "missing.mp3")
+        batch_id = job_queue.submit_assignments(self.queue, {file_path: {"set_title": "New"}})
+
+        process = multiprocessing.Process(target=lease_and_die, args=(self.queue_path,))
+        process.start()
+        process.join()
+        time.sleep(0.2)
+
+        # The unit is waiting for another worker.
+        self.assertEqual(self.queue.get_results(batch_id).unit_counts[job_queue.STATE_PENDING], 1)
+
+        self.run_workers()
+
+        # The file does not exist, so the unit is done with the file failed.
+        results = self.queue.get_results(batch_id)
+        self.assertEqual(results.unit_counts[job_queue.STATE_DONE], 1)
+        self.assertEqual([failed_file_path for (failed_file_path, error) in results.file_failures], [file_path])
+
+    def test_unit_fails_after_max_attempts(self):
+        # A unit without assignments cannot be applied at all.
+        self.queue.put("batch", [{}])
+
+        self.run_workers()
+
+        results = self.queue.get_results("batch")
+        self.assertEqual(results.unit_counts[job_queue.STATE_FAILED], 1)
+        self.assertEqual(len(results.unit_failures), 1)
+        self.assertIn("KeyError", results.unit_failures[0][1])
+        (attempts,) = self.queue._connection.execute("SELECT attempts FROM units").fetchone()
+        self.assertEqual(attempts, job_queue.DEFAULT_MAX_ATTEMPTS)
+
+    def test_only_field_setters_are_applied(self):
+        [file_path] = self.write_files(1)
+
+        with self.assertRaises(ValueError):
+            job_queue.build_work_units({file_path: {"rename_file": "/tmp/renamed.mp3"}})
+
+        # Units put on the queue some other way are checked by the worker as well.
+        self.queue.put("batch", [{"assignments": {file_path: {"set_title": "New", "rename_file": "renamed.mp3"}}}])
+        self.run_workers()
+
+        results = self.queue.get_results("batch")
+        self.assertEqual([(failed_file_path, error.split(":")[0])
+                          for (failed_file_path, error) in results.file_failures], [(file_path, "ValueError")])
+        self.assertTrue(os.path.exists(file_path))
+        self.assertEqual(id3_reader.read_tag(file_path).get_title(), "Old")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+import batch_utils
+import file_utils
+import save_journal
+
+
+def own_journal_until_stopped(journal_directory, file_path, created, stop):
+    """Start a batch in another process and keep it running until told to stop."""
+
+    journal = save_journal.SaveJournal.create({file_path: {"set_title": "Title"}}, journal_directory)
+    created.set()
+    stop.wait()
+    journal.close()
+
+
+@unittest.skipIf(save_journal.fcntl is None, "files cannot be locked on this platform")
+class OwnershipTest(unittest.TestCase):
+    """Tests that journals and temp files of running batches are left alone."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.journal_directory = os.path.join(self.folder, "journals")
+        self.file_path = os.path.join(self.folder, "a.mp3")
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_running_batch_is_not_unfinished(self):
+        journal = save_journal.SaveJournal.create({self.file_path: {"set_title": "Title"}}, self.journal_directory)
+        self.assertEqual(save_journal.find_unfinished_journals(self.journal_directory), [])
+
+        journal.release()
+
+        [unfinished_journal] = save_journal.find_unfinished_journals(self.journal_directory)
+        self.assertFalse(unfinished_journal.has_failures())
+        self.assertEqual(unfinished_journal.get_pending(), {self.file_path: {"set_title": "Title"}})
+
+    def test_batch_of_a_process_that_died_is_unfinished(self):
+        (created, stop) = (multiprocessing.Event(), multiprocessing.Event())
+        process = multiprocessing.Process(target=own_journal_until_stopped,
+                                          args=(self.journal_directory, self.file_path, created, stop))
+        process.start()
+        try:
+            self.assertTrue(created.wait(10))
+            self.assertEqual(save_journal.find_unfinished_journals(self.journal_directory), [])
+
+            [filename] = os.listdir(self.journal_directory)
+            journal = save_journal.SaveJournal(os.path.join(self.journal_directory, filename))
+            with self.assertRaises(BlockingIOError):
+                batch_utils.resume_assignments(journal)
+        finally:
+            process.terminate()
+            process.join()
+
+        [journal] = save_journal.find_unfinished_journals(self.journal_directory)
+        self.assertFalse(journal.has_failures())
+
+    def test_failed_batch_is_labelled(self):
+        failures = batch_utils.save_assignments({self.file_path: {"set_title": "Title"}},
+                                                journal_directory=self.journal_directory)
+        self.assertEqual(len(failures), 1)
+
+        [journal] = save_journal.find_unfinished_journals(self.journal_directory)
+        self.assertTrue(journal.has_failures())
+
+        # Taking the batch over starts a new run, which is interrupted until it finishes.
+        journal.acquire()
+        self.assertFalse(journal.has_failures())
+        journal.release()
+
+    def test_only_unlocked_temp_files_are_removed(self):
+        journal = save_journal.SaveJournal.create({self.file_path: {"set_title": "Title"}}, self.journal_directory)
+        journal.release()
+
+        stale_path = os.path.join(self.folder, ".a.mp3.stale" + file_utils.TEMP_FILE_SUFFIX)
+        temp_path = os.path.join(self.folder, ".a.mp3.saving" + file_utils.TEMP_FILE_SUFFIX)
+        with open(stale_path, "wb"):
+            pass
+
+        # A save still running holds a lock on its temp file.
+        with open(temp_path, "wb") as temp_file:
+            self.assertTrue(save_journal.try_lock(temp_file))
+            journal.remove_temp_files()
+
+            self.assertFalse(os.path.exists(stale_path))
+            self.assertTrue(os.path.exists(temp_path))
+
+    def test_discarded_batch_is_not_offered_again(self):
+        batch_utils.save_assignments({self.file_path: {"set_title": "Title"}}, journal_directory=self.journal_directory)
+        [journal] = save_journal.find_unfinished_journals(self.journal_directory)
+
+        batch_utils.discard_assignments(journal)
+
+        self.assertEqual(save_journal.find_unfinished_journals(self.journal_directory), [])
+
+if __name__ == "__main__":
+    unittest.main()
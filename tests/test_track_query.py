@@ -0,0 +1,63 @@
+import unittest
+from id3_reader import TagSnapshot
+from track_query import TrackIndex
+
+
+class TrackIndexTest(unittest.TestCase):
+    """Tests the query language against a small index of snapshots."""
+
+    def setUp(self):
+        self.index = TrackIndex()
+        self.index.add(TagSnapshot("a.mp3", {"TIT2": ["Airbag"], "TPE1": ["Radiohead"], "TDRC": ["1997-05-21"],
+                                             "TRCK": ["1/12"], "TCON": ["(17)"], "APIC:cover": []}))
+        self.index.add(TagSnapshot("b.mp3", {"TIT2": ["Everything In Its Right Place"], "TPE1": ["Radiohead"],
+                                             "TDRC": ["2000"], "TRCK": ["1/10"], "COMM::eng": ["Live at 12:30"]}))
+        self.index.add(TagSnapshot("c.mp3", {"TIT2": ["Teardrop"], "TPE1": ["Massive Attack"], "TDRC": ["1998"],
+                                             "TRCK": ["3"]}))
+
+    def test_field_equality_ignores_case_and_spacing(self):
+        self.assertEqual(self.index.query('artist:"  radiohead "'), {"a.mp3", "b.mp3"})
+        self.assertEqual(self.index.query("title:teardrop"), {"c.mp3"})
+
+    def test_genre_is_normalised(self):
+        self.assertEqual(self.index.query("genre:Rock"), {"a.mp3"})
+        self.assertEqual(self.index.query("genre:17"), {"a.mp3"})
+
+    def test_numeric_ranges(self):
+        self.assertEqual(self.index.query("year:<1998"), {"a.mp3"})
+        self.assertEqual(self.index.query("year:<=1998"), {"a.mp3", "c.mp3"})
+        self.assertEqual(self.index.query("year:>1998"), {"b.mp3"})
+        self.assertEqual(self.index.query("year:>=1997 year:<2000"), {"a.mp3", "c.mp3"})
+        self.assertEqual(self.index.query("track:=1"), {"a.mp3", "b.mp3"})
+
+    def test_missing_and_has(self):
+        self.assertEqual(self.index.query("missing:art"), {"b.mp3", "c.mp3"})
+        self.assertEqual(self.index.query("has:art"), {"a.mp3"})
+        self.assertEqual(self.index.query("missing:comment"), {"a.mp3", "c.mp3"})
+        self.assertEqual(self.index.query("-missing:comment"), {"b.mp3"})
+
+        with self.assertRaises(ValueError):
+            self.index.query("missing:nonsense")
+
+    def test_words(self):
+        self.assertEqual(self.index.query("right place"), {"b.mp3"})
+        self.assertEqual(self.index.query("radiohead -airbag"), {"b.mp3"})
+        self.assertEqual(self.index.query(""), {"a.mp3", "b.mp3", "c.mp3"})
+
+    def test_unknown_field_prefix_is_a_word(self):
+        self.assertEqual(self.index.query("12:30"), {"b.mp3"})
+        self.assertEqual(self.index.query("live:12"), {"b.mp3"})
+
+    def test_remove(self):
+        self.index.remove("a.mp3")
+
+        self.assertEqual(self.index.query("artist:radiohead"), {"b.mp3"})
+        self.assertEqual(self.index.query("year:<2000"), {"c.mp3"})
+        self.assertEqual(len(self.index), 2)
+
+    def test_malformed_query(self):
+        with self.assertRaises(ValueError):
+            self.index.query('title:"unterminated')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+from helpers import build_tag, text_data
+import workspace
+from workspace import Workspace
+
+
+class ScanTest(unittest.TestCase):
+    """Tests that scans pick up files changed by other programs and report files that cannot be indexed."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.folder, "a.mp3")
+        self.write_title("Before", 1000000000)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def write_title(self, title, mtime):
+        with open(self.file_path, "wb") as file:
+            file.write(build_tag([("TIT2", text_data(title))], 4) + b"\x00" * 128)
+        os.utime(self.file_path, (mtime, mtime))
+
+    def test_changed_file_is_indexed_again(self):
+        workspace = Workspace()
+        workspace.open([self.folder])
+        self.assertEqual(workspace.query("title:before"), {self.file_path})
+
+        self.write_title("Afterwards", 2000000000)
+        workspace.open([self.folder])
+
+        self.assertEqual(workspace.query("title:before"), set())
+        self.assertEqual(workspace.query("title:afterwards"), {self.file_path})
+
+    def test_unchanged_file_is_not_indexed_again(self):
+        workspace = Workspace()
+        workspace.open([self.folder])
+
+        # Same size and modification time, so the file is taken to be unchanged.
+        self.write_title("Beforf", 1000000000)
+        workspace.open([self.folder])
+
+        self.assertEqual(workspace.query("title:before"), {self.file_path})
+
+    def test_file_that_cannot_be_indexed_is_reported(self):
+        broken_file_path = os.path.join(self.folder, "b.flac")
+        with open(broken_file_path, "wb") as file:
+            file.write(b"fLaC" + b"\xff" * 32)
+
+        workspace = Workspace()
+        self.assertEqual(workspace.open([self.folder]), [])
+
+        self.assertEqual(workspace.get_file_paths(), [self.file_path, broken_file_path])
+        self.assertEqual([file_path for (file_path, error) in workspace.get_scan_errors()], [broken_file_path])
+
+
+class ReadTracksTest(unittest.TestCase):
+    """Tests that tags parsed in a pool of processes are the same as those parsed in this one."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.file_paths = []
+        for index in range(workspace.PROCESS_POOL_THRESHOLD + 10):
+            self.file_paths.append(os.path.join(self.folder, "{:03}.mp3".format(index)))
+            with open(self.file_paths[-1], "wb") as file:
+                file.write(build_tag([("TIT2", text_data("Title {}".format(index)))], 4) + b"\x00" * 128)
+
+        # A file that is not music, and one that is not an MP3 file and so is read by this process.
+        self.file_paths.insert(5, os.path.join(self.folder, "text.ogg"))
+        with open(self.file_paths[5], "wb") as file:
+            file.write(b"Not music")
+        self.file_paths.insert(50, os.path.join(self.folder, "broken.flac"))
+        with open(self.file_paths[50], "wb") as file:
+            file.write(b"fLaC" + b"\xff" * 32)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def get_titles(self, results):
+        return [(track.get_title() if track is not None else None, type(error)) for (track, error) in results]
+
+    def test_pool_matches_serial(self):
+        parallel_results = workspace.read_tracks(self.file_paths, processes=2)
+        serial_results = workspace.read_tracks(self.file_paths, processes=1)
+
+        self.assertEqual(self.get_titles(parallel_results), self.get_titles(serial_results))
+        self.assertEqual(parallel_results[0][0].get_title(), "Title 0")
+        self.assertIsInstance(parallel_results[5][1], ValueError)
+        self.assertIsNone(parallel_results[50][0])
+        self.assertIsNotNone(parallel_results[50][1])
+
+if __name__ == "__main__":
+    unittest.main()
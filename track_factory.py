@@ -0,0 +1,102 @@
+import importlib
+import file_utils
+from id3_reader import read_tag
+
+# The module and name of the track class for each detectable format. Every class has the same getter and setter methods.
+# Classes are imported the first time a file of their format is opened, as importing mutagenx is slow and listing MP3
+# files with read_track() does not need it at all.
+TRACK_CLASSES = {
+    file_utils.FORMAT_MP3: ("mp3_track", "MP3Track"),
+    file_utils.FORMAT_FLAC: ("vorbis_track", "FLACTrack"),
+    file_utils.FORMAT_OGG_VORBIS: ("vorbis_track", "OggVorbisTrack"),
+    file_utils.FORMAT_MP4: ("mp4_track", "MP4Track"),
+}
+
+
+def open_track(path, create_tag=True):
+    """Load a music file for editing with the track class for its format, which is detected from its content.
+
+    :param path: The path to the music file.
+    :type path: str
+
+    :param create_tag: True to write a blank tag to an MP3 file if it has none, false to leave the file untouched.
+        Defaults to True. Other formats are never written to when loading.
+    :type create_tag: bool
+
+    :returns: The loaded track.
+    :rtype: MP3Track or MusicTrack
+
+    :raise ValueError: Unsupported format.
+    :raise IOError: Error reading file.
+    :raise ImportError: The track class for the format needs mutagenx, which is not installed.
+    """
+
+    return _import_track_class(_get_file_format(path))(path, create_tag)
+
+
+def read_track(path):
+    """Load a music file for reading only, taking the fastest path for its format.
+
+    MP3 files are read with the pure Python ID3 reader. Files of other formats are already quick to load, as mutagenx
+    only reads their metadata blocks, so they are loaded with their track class without being written to.
+
+    :param path: The path to the music file.
+    :type path: str
+
+    :returns: An object with the getters of a track.
+    :rtype: TagSnapshot or MusicTrack
+
+    :raise ValueError: Unsupported format.
+    :raise IOError: Error reading file.
+    :raise ImportError: The track class for a format other than MP3 needs mutagenx, which is not installed.
+    """
+
+    file_format = _get_file_format(path)
+    if file_format == file_utils.FORMAT_MP3:
+        return read_tag(path)
+
+    return _import_track_class(file_format)(path, create_tag=False)
+
+
+def _get_file_format(path):
+    """Get the format of a music file.
+
+    :param path: The path to the music file.
+    :type path: str
+
+    :returns: One of the file_utils.FORMAT_* values.
+    :rtype: str
+
+    :raise ValueError: Unsupported format.
+    :raise IOError: Error reading file.
+    """
+
+    file_format = file_utils.get_file_format(path)
+    if file_format is None:
+        raise ValueError("Unsupported music file format: " + path)
+
+    return file_format
+
+
+def _import_track_class(file_format):
+    """Get the track class for a format, importing its module if it has not been imported yet.
+
+    :param file_format: One of the file_utils.FORMAT_* values.
+    :type file_format: str
+
+    :returns: The track class.
+    :rtype: type
+
+    :raise ImportError: The module of the class needs mutagenx, which is not installed.
+    """
+
+    (module_name, class_name) = TRACK_CLASSES[file_format]
+
+    return getattr(importlib.import_module(module_name), class_name)
+
+if __name__ == "__main__":
+    import sys
+
+    for file_path in file_utils.get_music_files(sys.argv[1], recursive=True):
+        track = read_track(file_path)
+        print("{} [{}] {} - {}".format(file_path, type(track).__name__, track.get_artist(), track.get_title()))
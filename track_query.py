@@ -0,0 +1,341 @@
+import bisect
+import re
+import shlex
+import genre_utils
+
+
+class TrackIndex:
+    """An in-memory index over track metadata that can be searched with a small query language.
+
+    Each field has its own inverted index mapping a normalised value to the set of file paths that have it, so filters
+    are set operations rather than scans over every track. A query is a space separated list of terms that must all
+    match, for example: artist:"Radiohead" year:>=2000 missing:art
+
+    Supported terms:
+    - <field>:<value>     The field equals the value (case-insensitive).
+    - <field>:<op><num>   Numeric comparison on year or track where op is one of <, <=, >, >=, or =.
+    - missing:<field>     The field has no value. Use "art" for album art.
+    - has:<field>         The field has a value. Use "art" for album art.
+    - <word>              Any text field contains the word. A word with a colon that does not start with a field
+                          name, such as 12:30, is searched for as text.
+    - -<term>             Negates any of the above terms.
+    """
+
+    # Query field names mapped to the getter used to read that field from a track.
+    FIELD_GETTERS = {
+        "title": "get_title",
+        "artist": "get_artist",
+        "albumartist": "get_album_artist",
+        "album": "get_album",
+        "genre": "get_genre",
+        "year": "get_year",
+        "track": "get_track",
+        "comment": "get_comments",
+        "compilation": "get_part_of_compilation",
+    }
+
+    # Functions applied to field values before they are indexed so that equal values stored differently match.
+    FIELD_NORMALIZERS = {
+        "genre": genre_utils.normalise_genre,
+    }
+
+    # Fields that can be compared numerically.
+    NUMERIC_FIELDS = ("year", "track")
+
+    # The pseudo field used to refer to album art.
+    ART_FIELD = "art"
+
+    _COMPARISON_PATTERN = re.compile("^(<=|>=|<|>|=)([0-9]+)$")
+    _LEADING_NUMBER_PATTERN = re.compile(r"^\s*([0-9]+)")
+    _WORD_PATTERN = re.compile(r"\w+")
+
+    def __init__(self):
+        # A set of every indexed file path.
+        self._paths = set()
+
+        # A map of field names to maps of normalised values to sets of file paths.
+        self._value_index = {field: {} for field in TrackIndex.FIELD_GETTERS}
+
+        # A map of field names to sets of file paths that have no value for that field.
+        self._missing_index = {field: set() for field in TrackIndex.FIELD_GETTERS}
+        self._missing_index[TrackIndex.ART_FIELD] = set()
+
+        # A map of words found in any text field to the set of file paths containing them.
+        self._word_index = {}
+
+        # A map of numeric field names to sorted lists of (number, file path) tuples for range queries.
+        self._numeric_index = {field: [] for field in TrackIndex.NUMERIC_FIELDS}
+
+        # A map of file paths to the index entries that were created for them so they can be removed again.
+        self._entries = {}
+
+        # A map of file paths to the numbers that were indexed for them so they can be removed again.
+        self._numbers = {}
+
+    def __len__(self):
+        return len(self._paths)
+
+    def __contains__(self, path):
+        return path in self._paths
+
+    def add(self, track):
+        """Add a track to the index, replacing any entry that already exists for the same file.
+
+        :param track: The track to index.
+        :type track: MP3Track or TagSnapshot
+        """
+
+        path = track.get_file_path()
+        self.remove(path)
+
+        entries = {}
+        numbers = {}
+        for field, getter in TrackIndex.FIELD_GETTERS.items():
+            value = getattr(track, getter)()
+            if field in TrackIndex.FIELD_NORMALIZERS:
+                value = TrackIndex.FIELD_NORMALIZERS[field](value)
+            if isinstance(value, bool):
+                value = "1" if value else "0"
+
+            if value is None or value == "":
+                self._missing_index[field].add(path)
+                entries[field] = None
+                continue
+
+            normalised_value = TrackIndex._normalise(value)
+            self._value_index[field].setdefault(normalised_value, set()).add(path)
+            entries[field] = normalised_value
+
+            if field in TrackIndex.NUMERIC_FIELDS:
+                number = TrackIndex._leading_number(value)
+                if number is not None:
+                    bisect.insort(self._numeric_index[field], (number, path))
+                    numbers[field] = number
+
+            for word in TrackIndex._words(value):
+                self._word_index.setdefault(word, set()).add(path)
+
+        if not track.has_picture():
+            self._missing_index[TrackIndex.ART_FIELD].add(path)
+
+        self._paths.add(path)
+        self._entries[path] = entries
+        self._numbers[path] = numbers
+
+    def remove(self, path):
+        """Remove a file from the index. Does nothing if the file is not indexed.
+
+        :param path: The file path to remove.
+        :type path: str
+        """
+
+        entries = self._entries.pop(path, None)
+        if entries is None:
+            return
+
+        for field, normalised_value in entries.items():
+            if normalised_value is None:
+                continue
+
+            paths = self._value_index[field][normalised_value]
+            paths.discard(path)
+            if len(paths) == 0:
+                del self._value_index[field][normalised_value]
+
+            for word in TrackIndex._words(normalised_value):
+                paths = self._word_index.get(word)
+                if paths is not None:
+                    paths.discard(path)
+                    if len(paths) == 0:
+                        del self._word_index[word]
+
+        for field, number in self._numbers.pop(path).items():
+            numbers = self._numeric_index[field]
+            del numbers[bisect.bisect_left(numbers, (number, path))]
+
+        for paths in self._missing_index.values():
+            paths.discard(path)
+
+        self._paths.discard(path)
+
+    def query(self, query):
+        """Find all indexed files matching a query.
+
+        :param query: The query string. See the class documentation for the syntax.
+        :type query: str
+
+        :returns: The set of file paths that match every term of the query.
+        :rtype: set
+
+        :raise ValueError: Malformed query.
+        """
+
+        try:
+            terms = shlex.split(query)
+        except ValueError as error:
+            raise ValueError("Malformed query: " + str(error))
+
+        # An empty query matches everything.
+        result = set(self._paths)
+
+        # Apply the most selective positive terms first so the intersections stay small.
+        matches = []
+        for term in terms:
+            negate = term.startswith("-") and len(term) > 1
+            if negate:
+                term = term[1:]
+            matches.append((negate, self._match_term(term)))
+
+        for negate, paths in sorted(matches, key=lambda match: (match[0], len(match[1]))):
+            if negate:
+                result -= paths
+            else:
+                result &= paths
+
+            if len(result) == 0:
+                break
+
+        return result
+
+    def _match_term(self, term):
+        """Find all indexed files matching a single query term.
+
+        :param term: A query term without any negation prefix.
+        :type term: str
+
+        :returns: The set of matching file paths.
+        :rtype: set
+
+        :raise ValueError: Unknown missing or has field.
+        """
+
+        field, separator, value = term.partition(":")
+        field = field.lower()
+
+        if not separator or (field not in TrackIndex.FIELD_GETTERS and field not in ("missing", "has")):
+            return self._match_words(term)
+
+        if field in ("missing", "has"):
+            missing_field = value.lower()
+            if missing_field not in self._missing_index:
+                raise ValueError("Unknown field: " + value)
+            missing_paths = self._missing_index[missing_field]
+            return set(missing_paths) if field == "missing" else self._paths - missing_paths
+
+        comparison = TrackIndex._COMPARISON_PATTERN.match(value)
+        if comparison is not None and field in TrackIndex.NUMERIC_FIELDS:
+            return self._match_comparison(field, comparison.group(1), int(comparison.group(2)))
+
+        if field in TrackIndex.FIELD_NORMALIZERS:
+            value = TrackIndex.FIELD_NORMALIZERS[field](value)
+
+        return set(self._value_index[field].get(TrackIndex._normalise(value), set()))
+
+    def _match_words(self, term):
+        """Find all indexed files that have every word of a term in any of their text fields.
+
+        :param term: The term.
+        :type term: str
+
+        :returns: The set of matching file paths.
+        :rtype: set
+        """
+
+        words = TrackIndex._words(term)
+        if len(words) == 0:
+            return set(self._paths)
+
+        paths = set(self._word_index.get(words[0], set()))
+        for word in words[1:]:
+            paths &= self._word_index.get(word, set())
+
+        return paths
+
+    def _match_comparison(self, field, operator, number):
+        """Find all indexed files whose numeric field value compares true against a number.
+
+        :param field: A numeric field name.
+        :type field: str
+
+        :param operator: One of <, <=, >, >=, or =.
+        :type operator: str
+
+        :param number: The number to compare against.
+        :type number: int
+
+        :returns: The set of matching file paths.
+        :rtype: set
+        """
+
+        numbers = self._numeric_index[field]
+
+        # Paths sort after the empty string, so (number, "") sorts before every entry with that number.
+        lower = bisect.bisect_left(numbers, (number, ""))
+        upper = lower
+        while upper < len(numbers) and numbers[upper][0] == number:
+            upper += 1
+
+        if operator == "<":
+            entries = numbers[:lower]
+        elif operator == "<=":
+            entries = numbers[:upper]
+        elif operator == ">":
+            entries = numbers[upper:]
+        elif operator == ">=":
+            entries = numbers[lower:]
+        else:
+            entries = numbers[lower:upper]
+
+        return {path for (_, path) in entries}
+
+    @staticmethod
+    def _normalise(value):
+        """Normalise a value for case-insensitive comparison.
+
+        :param value: The value to normalise.
+        :type value: str
+
+        :returns: The normalised value.
+        :rtype: str
+        """
+
+        return " ".join(value.casefold().split())
+
+    @staticmethod
+    def _words(value):
+        """Split a value into normalised words.
+
+        :param value: The value to split.
+        :type value: str
+
+        :returns: A list of normalised words.
+        :rtype: list
+        """
+
+        return TrackIndex._WORD_PATTERN.findall(value.casefold())
+
+    @staticmethod
+    def _leading_number(value):
+        """Parse the number at the start of a value such as "2001-05-03" or "4/12".
+
+        :param value: The value to parse.
+        :type value: str
+
+        :returns: The leading number or None if the value does not start with one.
+        :rtype: int or None
+        """
+
+        match = TrackIndex._LEADING_NUMBER_PATTERN.match(value)
+        return int(match.group(1)) if match is not None else None
+
+if __name__ == "__main__":
+    import sys
+    from id3_reader import read_tag
+    from file_utils import get_mp3_files
+
+    index = TrackIndex()
+    for file_path in get_mp3_files(sys.argv[1]):
+        index.add(read_tag(file_path))
+
+    for file_path in sorted(index.query(" ".join(sys.argv[2:]))):
+        print(file_path)
@@ -0,0 +1,226 @@
+import base64
+from mutagenx.flac import FLAC, Picture
+from mutagenx.oggvorbis import OggVorbis
+from music_track import MusicTrack
+
+
+class VorbisTrack(MusicTrack):
+    """A track tagged with Vorbis comments, the tag format of both FLAC and Ogg Vorbis files.
+
+    Field names follow the Xiph recommendations, with the de facto standard ALBUMARTIST, TRACKTOTAL, and COMPILATION
+    fields that most taggers also write.
+    """
+
+    _KEY_TITLE = "TITLE"
+    _KEY_ARTIST = "ARTIST"
+    _KEY_ALBUM_ARTIST = "ALBUMARTIST"
+    _KEY_ALBUM = "ALBUM"
+    _KEY_GENRE = "GENRE"
+    _KEY_YEAR = "DATE"
+    _KEY_TRACK = "TRACKNUMBER"
+    _KEY_COMPILATION = "COMPILATION"
+    _KEY_COMMENT = "COMMENT"
+    _KEY_AUDIO_CHECKSUM = "AUDIO_CHECKSUM"
+    _KEY_PICTURE = "METADATA_BLOCK_PICTURE"
+
+    # Taggers disagree on the name of the total track count field. The first one is written, all of them are read.
+    _KEYS_TRACK_TOTAL = ("TRACKTOTAL", "TOTALTRACKS")
+
+    def set_part_of_compilation(self, is_part):
+        """ Set whether or not this track is part of a compilation.
+
+        :param is_part: True to set the track as part of a compilation, false otherwise.
+        :type is_part: bool
+        """
+
+        self._set_text(VorbisTrack._KEY_COMPILATION, "1" if is_part else "0")
+
+    def get_part_of_compilation(self):
+        """Get whether ot not this track is part of a compilation.
+
+        :returns: True if the track is part of a compilation, false otherwise
+        :rtype: bool
+        """
+
+        return self._get_text(VorbisTrack._KEY_COMPILATION) not in (None, "0")
+
+    def _get_track_numbers(self):
+        (number, _, total) = (self._get_text(VorbisTrack._KEY_TRACK) or "").partition("/")
+
+        # A total written into the track number field as "<number>/<total>" wins over a separate total field.
+        if not total:
+            for key in VorbisTrack._KEYS_TRACK_TOTAL:
+                total = self._get_text(key)
+                if total:
+                    break
+
+        return (number or None, total or None)
+
+    def _set_track_numbers(self, number, total):
+        for key in (VorbisTrack._KEY_TRACK,) + VorbisTrack._KEYS_TRACK_TOTAL:
+            self._delete(key)
+
+        if number:
+            self._set_text(VorbisTrack._KEY_TRACK, number)
+        if total:
+            self._set_text(VorbisTrack._KEYS_TRACK_TOTAL[0], total)
+
+    @staticmethod
+    def _build_picture(data, mime_type):
+        """Build a FLAC picture block for the album front cover.
+
+        :param data: The image data.
+        :type data: bytes
+
+        :param mime_type: The mime type of the image data.
+        :type mime_type: str
+
+        :returns: The picture block.
+        :rtype: Picture
+
+        :raise ValueError: Incompatible mime type.
+        """
+
+        if not mime_type in ["image/png", "image/jpeg"]:
+            raise ValueError("Picture mime type must be either image/png or image/jpeg.")
+
+        picture = Picture()
+        picture.data = data
+        picture.mime = mime_type
+        # A type of 3 refers to the album front cover.
+        picture.type = 3
+        picture.desc = "Front Cover"
+
+        return picture
+
+
+class FLACTrack(VorbisTrack):
+    """A FLAC wrapper that allows for the reading and writing of its Vorbis comments and pictures."""
+
+    # The key prefix of picture blocks in get_frames(). "~" cannot appear in a Vorbis comment field name.
+    _PICTURE_FRAME_PREFIX = "~PICTURE:"
+
+    def clear_pictures(self):
+        """Clear all pictures."""
+
+        self._file.clear_pictures()
+        # Pictures may also have been embedded in the comments the way Ogg files carry them.
+        self._delete(VorbisTrack._KEY_PICTURE)
+
+    def has_picture(self):
+        """Get whether or not this track has a picture.
+
+        :returns: True if the track has at least one picture, false otherwise.
+        :rtype: bool
+        """
+
+        return len(self._file.pictures) > 0 or VorbisTrack._KEY_PICTURE in self._file.tags
+
+    def add_picture_from_data(self, data, mime_type, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from image data that has already been read.
+
+        :param data: The image data.
+        :type data: bytes
+
+        :param mime_type: The mime type of the image data.
+        :type mime_type: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        """
+
+        picture = VorbisTrack._build_picture(data, mime_type)
+
+        if clear_existing_pictures:
+            self.clear_pictures()
+
+        self._file.add_picture(picture)
+
+    def get_frames(self):
+        """Get every field of the tag and every picture block in an encoded form. See MusicTrack.get_frames().
+
+        :returns: A map of keys to encoded field values and picture blocks.
+        :rtype: dict
+        """
+
+        frames = super().get_frames()
+        for (index, picture) in enumerate(self._file.pictures):
+            frames[FLACTrack._PICTURE_FRAME_PREFIX + str(index)] = picture.write()
+
+        return frames
+
+    def set_frames(self, frames):
+        """Replace or delete fields and picture blocks with values encoded by get_frames().
+
+        A save is still necessary for this change to persist.
+
+        :param frames: A map of keys to encoded field values or picture blocks, or to None to delete them.
+        :type frames: dict
+        """
+
+        picture_frames = {key: value for (key, value) in frames.items()
+                          if key.startswith(FLACTrack._PICTURE_FRAME_PREFIX)}
+        super().set_frames({key: value for (key, value) in frames.items() if key not in picture_frames})
+
+        if len(picture_frames) == 0:
+            return
+
+        # Picture blocks are kept in order, so rebuild the whole list around the changed positions.
+        pictures = {FLACTrack._PICTURE_FRAME_PREFIX + str(index): picture.write()
+                    for (index, picture) in enumerate(self._file.pictures)}
+        pictures.update(picture_frames)
+
+        self._file.clear_pictures()
+        for key in sorted((key for key in pictures if pictures[key] is not None),
+                          key=lambda key: int(key[len(FLACTrack._PICTURE_FRAME_PREFIX):])):
+            self._file.add_picture(Picture(pictures[key]))
+
+    def _load(self, path):
+        return FLAC(path)
+
+
+class OggVorbisTrack(VorbisTrack):
+    """An Ogg Vorbis wrapper that allows for the reading and writing of its Vorbis comments.
+
+    Ogg has no picture blocks, so pictures are stored base64 encoded in METADATA_BLOCK_PICTURE comments.
+    """
+
+    def clear_pictures(self):
+        """Clear all pictures."""
+
+        self._delete(VorbisTrack._KEY_PICTURE)
+
+    def has_picture(self):
+        """Get whether or not this track has a picture.
+
+        :returns: True if the track has at least one picture, false otherwise.
+        :rtype: bool
+        """
+
+        return VorbisTrack._KEY_PICTURE in self._file.tags
+
+    def add_picture_from_data(self, data, mime_type, clear_existing_pictures=True):
+        """ Add a picture (more specifically an album cover) from image data that has already been read.
+
+        :param data: The image data.
+        :type data: bytes
+
+        :param mime_type: The mime type of the image data.
+        :type mime_type: str
+
+        :param clear_existing_pictures: True to clear all existing pictures, false to keep them. Defaults to True.
+        :type clear_existing_pictures: bool
+
+        :raise ValueError: Incompatible mime type.
+        """
+
+        encoded_picture = base64.b64encode(VorbisTrack._build_picture(data, mime_type).write()).decode("ascii")
+
+        pictures = [] if clear_existing_pictures else list(self._file.tags.get(VorbisTrack._KEY_PICTURE, []))
+        pictures.append(encoded_picture)
+        self._file.tags[VorbisTrack._KEY_PICTURE] = pictures
+
+    def _load(self, path):
+        return OggVorbis(path)
@@ -0,0 +1,451 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import file_utils
+import track_factory
+from file_utils import get_music_files
+from id3_reader import read_tag
+from track_query import TrackIndex
+
+# The number of folders listed at once. Threads only overlap the time spent waiting on the file system, such as listing
+# folders on a network share.
+DEFAULT_SCAN_WORKERS = 8
+
+# The fewest files to read before their MP3 tags are parsed in a pool of processes. Parsing holds the GIL, so threads
+# cannot parse in parallel, but starting the processes costs about as much as parsing a few hundred tags.
+PROCESS_POOL_THRESHOLD = 256
+
+
+class WorkspaceRoot:
+    """One folder opened in a workspace, with the state that belongs to it.
+
+    Every music file in the folder is indexed when it is scanned, with the fast read-only reader for files that have not
+    been loaded for editing. Tracks loaded for editing are kept until the root is forgotten or their file is changed by
+    another program, so opening other folders and coming back does not parse them again.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The path of the folder.
+        :type path: str
+        """
+
+        self.path = path
+
+        # A sorted list of the music files in the folder as of the last scan.
+        self.file_paths = []
+
+        # A map of file paths to the tracks loaded for editing.
+        self.tracks = {}
+
+        # An index of the tag data of every file in the folder.
+        self.index = TrackIndex()
+
+        # A map of indexed file paths to the (modification time, size) of the file when it was indexed.
+        self._signatures = {}
+
+        # A list of (file path, exception) tuples for the files that could not be indexed by the last scan.
+        self.errors = []
+
+    def scan(self):
+        """List the music files in the folder and index the ones that are new or have changed since the last scan,
+        reading them with read_tracks(). See list_changes() and index_changes() for the details.
+
+        :raise IOError: Error reading folder.
+        """
+
+        (signatures, errors) = self.list_changes()
+        self.index_changes(signatures, read_tracks(list(signatures)), errors)
+
+    def list_changes(self):
+        """List the music files in the folder and find the ones that are new or have changed since the last scan.
+        Files that have gone are dropped, and files whose modification time and size are the same as when they were
+        indexed are kept as they are. A changed file was edited by another program, so a track loaded from it for
+        editing is dropped as well and loaded again when it is next needed.
+
+        :returns: A tuple of a map of the paths of the files to read to their signatures, and a list of (file path,
+            exception) tuples for the files that could not be looked at. Pass both to index_changes().
+        :rtype: tuple
+
+        :raise IOError: Error reading folder.
+        """
+
+        file_paths = get_music_files(self.path)
+
+        for file_path in set(self.file_paths).difference(file_paths):
+            self.remove_track(file_path)
+
+        signatures = {}
+        errors = []
+        for file_path in file_paths:
+            try:
+                signature = _get_signature(file_path)
+            except OSError as error:
+                self.index.remove(file_path)
+                self._signatures.pop(file_path, None)
+                errors.append((file_path, error))
+                continue
+
+            if file_path in self.index and self._signatures.get(file_path) == signature:
+                continue
+
+            if file_path in self._signatures:
+                self.tracks.pop(file_path, None)
+            signatures[file_path] = signature
+
+        self.file_paths = file_paths
+
+        return (signatures, errors)
+
+    def index_changes(self, signatures, results, errors):
+        """Index the files found by list_changes() once they have been read.
+
+        Files that could not be read are listed but not indexed, so they are never matched by a query. They are kept
+        in errors until the next scan.
+
+        :param signatures: The map of file paths to signatures list_changes() returned.
+        :type signatures: dict
+
+        :param results: A list of (track, exception) tuples as returned by read_tracks(), in the order of signatures.
+        :type results: list
+
+        :param errors: The list of (file path, exception) tuples list_changes() returned.
+        :type errors: list
+        """
+
+        errors = list(errors)
+        for ((file_path, signature), (track, error)) in zip(signatures.items(), results):
+            if error is not None:
+                self.index.remove(file_path)
+                self._signatures.pop(file_path, None)
+                errors.append((file_path, error))
+                continue
+
+            self.index.add(self.tracks.get(file_path) or track)
+            self._signatures[file_path] = signature
+
+        self.errors = errors
+
+    def add_track(self, track):
+        """Index a track loaded for editing or saved by the editor, remembering its file as it is now.
+
+        :param track: The track.
+        :type track: MP3Track or MusicTrack
+        """
+
+        file_path = track.get_file_path()
+        self.index.add(track)
+        try:
+            self._signatures[file_path] = _get_signature(file_path)
+        except OSError:
+            # Index it again on the next scan, which reports the error.
+            self._signatures.pop(file_path, None)
+
+    def remove_track(self, file_path):
+        """Forget a file that is no longer in the folder under this path.
+
+        :param file_path: The path of the file.
+        :type file_path: str
+        """
+
+        self.tracks.pop(file_path, None)
+        self.index.remove(file_path)
+        self._signatures.pop(file_path, None)
+
+
+class Workspace:
+    """A set of folders open at once, whose files can be selected and edited together.
+
+    Folders are listed on a thread each, and each keeps its own tracks and index. The files of every folder that need
+    reading are then read together with read_tracks(), which parses MP3 tags in a pool of processes when there are
+    enough of them. Opening a set of folders scans every one of them, but only files that are new or changed are parsed
+    again. Folders that are no longer open are remembered along with the tracks loaded from them, so switching back to
+    them is quick.
+    """
+
+    def __init__(self, max_workers=DEFAULT_SCAN_WORKERS, processes=None):
+        """
+        :param max_workers: The number of folders to list at once. Defaults to DEFAULT_SCAN_WORKERS.
+        :type max_workers: int
+
+        :param processes: The number of processes to parse tags with. Defaults to None, which uses one per CPU.
+        :type processes: int or None
+        """
+
+        self.max_workers = max_workers
+        self.processes = processes
+
+        # A map of folder paths to every root opened so far, whether it is still open or not.
+        self._roots = {}
+
+        # The roots that are open, in the order they were given.
+        self._open_roots = []
+
+        # A map of file paths to the root they belong to, for every root opened so far.
+        self._owners = {}
+
+    def open(self, paths):
+        """Open a set of folders in place of the ones that are open. Each folder is scanned for new, changed, and
+        removed files. Files that could not be indexed are listed by get_scan_errors().
+
+        :param paths: The paths of the folders.
+        :type paths: iterable
+
+        :returns: A list of (folder path, exception) tuples for the folders that could not be scanned, which are not
+            opened.
+        :rtype: list
+        """
+
+        roots = []
+        for path in paths:
+            path = os.path.abspath(os.path.expanduser(path))
+            if path not in self._roots:
+                self._roots[path] = WorkspaceRoot(path)
+            if self._roots[path] not in roots:
+                roots.append(self._roots[path])
+
+        def list_changes(root):
+            try:
+                return (root, root.list_changes(), None)
+            except OSError as error:
+                return (root, None, error)
+
+        if len(roots) > 0:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(roots))) as executor:
+                results = list(executor.map(list_changes, roots))
+        else:
+            results = []
+
+        # Read the changed files of every root together, so they share one pool of processes.
+        file_paths = [file_path for (_, changes, _) in results if changes is not None for file_path in changes[0]]
+        read_results = iter(read_tracks(file_paths, self.processes))
+        for (root, changes, _) in results:
+            if changes is not None:
+                (signatures, errors) = changes
+                root.index_changes(signatures, [next(read_results) for _ in signatures], errors)
+
+        self._open_roots = [root for (root, _, error) in results if error is None]
+
+        self._owners = {}
+        for root in self._roots.values():
+            self._owners.update((file_path, root) for file_path in root.file_paths)
+
+        return [(root.path, error) for (root, _, error) in results if error is not None]
+
+    def get_roots(self):
+        """Get the open roots.
+
+        :returns: The open roots, in the order they were opened.
+        :rtype: list
+        """
+
+        return list(self._open_roots)
+
+    def get_scan_errors(self):
+        """Get the files of the open roots that could not be indexed when they were last scanned.
+
+        :returns: A list of (file path, exception) tuples.
+        :rtype: list
+        """
+
+        return [error for root in self._open_roots for error in root.errors]
+
+    def get_file_paths(self):
+        """Get the music files of every open root.
+
+        :returns: The file paths, grouped by root in the order the roots were opened.
+        :rtype: list
+        """
+
+        return [file_path for root in self._open_roots for file_path in root.file_paths]
+
+    def get_display_name(self, file_path):
+        """Get a short name for a file. With more than one root open, the name of its root is kept to tell apart files
+        with the same name in different roots.
+
+        :param file_path: The path of the file.
+        :type file_path: str
+
+        :returns: The display name.
+        :rtype: str
+        """
+
+        root = self._owners.get(file_path)
+        if root is None or len(self._open_roots) == 1:
+            return os.path.basename(file_path)
+
+        return os.path.join(os.path.basename(root.path) or root.path, os.path.relpath(file_path, root.path))
+
+    def get_track(self, file_path):
+        """Get the track for a file, loading it for editing and indexing it if it has not been loaded.
+
+        :param file_path: The path of the file.
+        :type file_path: str
+
+        :returns: The track for the file.
+        :rtype: MP3Track or MusicTrack
+
+        :raise KeyError: The file is not in a root that has been opened.
+        :raise ValueError: Unsupported format.
+        :raise IOError: Error reading file.
+        """
+
+        root = self._owners[file_path]
+        if file_path not in root.tracks:
+            track = track_factory.open_track(file_path)
+            root.tracks[file_path] = track
+            root.add_track(track)
+
+        return root.tracks[file_path]
+
+    def get_loaded_tracks(self):
+        """Get every track loaded for editing, including those of roots that are no longer open, which may still be
+        edited by an undo.
+
+        :returns: A map of file paths to tracks, in the form batch_utils.save_assignments() takes.
+        :rtype: dict
+        """
+
+        return {file_path: track for root in self._roots.values() for (file_path, track) in root.tracks.items()}
+
+    def update_index(self, tracks):
+        """Index tracks again after they have been edited.
+
+        :param tracks: The tracks.
+        :type tracks: iterable
+        """
+
+        for track in tracks:
+            root = self._owners.get(track.get_file_path())
+            if root is not None:
+                root.add_track(track)
+
+    def rename_track(self, old_file_path, track):
+        """Move a track to its new path after its file has been renamed within its folder.
+
+        :param old_file_path: The path of the file before it was renamed.
+        :type old_file_path: str
+
+        :param track: The renamed track.
+        :type track: MP3Track or MusicTrack
+        """
+
+        root = self._owners.pop(old_file_path)
+        new_file_path = track.get_file_path()
+
+        root.remove_track(old_file_path)
+        root.tracks[new_file_path] = track
+        root.add_track(track)
+        root.file_paths = sorted(set(root.file_paths).difference([old_file_path]).union([new_file_path]))
+
+        self._owners[new_file_path] = root
+
+    def query(self, query):
+        """Find the files of the open roots whose tags match a query. See TrackIndex for the query syntax.
+
+        :param query: The query string.
+        :type query: str
+
+        :returns: The set of matching file paths.
+        :rtype: set
+
+        :raise ValueError: Malformed query.
+        """
+
+        # Parse the query even with no root open, so a malformed query is always reported.
+        matching_file_paths = TrackIndex().query(query)
+        for root in self._open_roots:
+            matching_file_paths |= root.index.query(query)
+
+        return matching_file_paths
+
+
+def read_tracks(file_paths, processes=None):
+    """Read music files for indexing.
+
+    MP3 files are read into picklable snapshots. With at least PROCESS_POOL_THRESHOLD files, they are parsed in a pool
+    of processes, so a large scan uses every CPU. Files of other formats are loaded with their track class in this
+    process, as mutagenx only reads their metadata blocks.
+
+    :param file_paths: The paths of the files.
+    :type file_paths: list
+
+    :param processes: The number of processes to parse with. Defaults to None, which uses one per CPU.
+    :type processes: int or None
+
+    :returns: A list of (track, exception) tuples in the order of file_paths, with the exception None if the file was
+        read and the track None if it was not.
+    :rtype: list
+    """
+
+    results = [None] * len(file_paths)
+
+    processes = processes or os.cpu_count() or 1
+    if len(file_paths) >= PROCESS_POOL_THRESHOLD and processes > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                chunk_size = max(1, len(file_paths) // (processes * 4))
+                results = list(executor.map(_read_mp3_tag, file_paths, chunksize=chunk_size))
+        except (OSError, BrokenProcessPool):
+            # Processes cannot be started here, so parse in this process instead.
+            results = [None] * len(file_paths)
+
+    for (index, file_path) in enumerate(file_paths):
+        if results[index] is None:
+            try:
+                results[index] = (track_factory.read_track(file_path), None)
+            except (IOError, ValueError, ImportError) as error:
+                results[index] = (None, error)
+
+    return results
+
+
+def _read_mp3_tag(file_path):
+    """Read the tag of an MP3 file in a worker process of read_tracks().
+
+    :param file_path: The path of the file.
+    :type file_path: str
+
+    :returns: A (snapshot, exception) tuple, or None if the file is not an MP3 file and has to be read by the parent.
+    :rtype: tuple or None
+    """
+
+    try:
+        if file_utils.get_file_format(file_path) != file_utils.FORMAT_MP3:
+            return None
+        return (read_tag(file_path), None)
+    except IOError as error:
+        return (None, error)
+
+
+def _get_signature(file_path):
+    """Get what is compared to tell whether a file has changed since it was indexed.
+
+    :param file_path: The path of the file.
+    :type file_path: str
+
+    :returns: The modification time in nanoseconds and the size of the file.
+    :rtype: tuple
+
+    :raise OSError: Error reading file.
+    """
+
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+if __name__ == "__main__":
+    # Open the folders given on the command line and time the scan.
+    import sys
+    import time
+
+    workspace = Workspace()
+
+    start = time.perf_counter()
+    scan_failures = workspace.open(sys.argv[1:] or ["."])
+    elapsed = time.perf_counter() - start
+
+    for workspace_root in workspace.get_roots():
+        print("{}: {} files".format(workspace_root.path, len(workspace_root.file_paths)))
+    for (failed_path, scan_error) in scan_failures + workspace.get_scan_errors():
+        print("{}: {}".format(failed_path, scan_error))
+    print("Scanned {} files in {:.2f}s".format(len(workspace.get_file_paths()), elapsed))